@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 import dj_database_url
 from datetime import timedelta
@@ -60,7 +61,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "core.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
@@ -77,6 +78,8 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',  # << Latencia por ruta para /metrics
+    'core.middleware.SQLProfilingMiddleware',  # << Opcional (SQL_PROFILING_ENABLED); primero para medir toda la petición
     "corsheaders.middleware.CorsMiddleware",  # << debe ir ARRIBA de CommonMiddleware
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # << Para servir archivos estáticos en producción
@@ -121,7 +124,14 @@ CHANNEL_LAYERS = {
 
 # Chat configuration
 MAX_UPLOAD_SIZE = 10485760  # 10MB en bytes
-WEBSOCKET_HEARTBEAT_INTERVAL = 30
+CHAT_THUMBNAIL_WORKERS = int(os.getenv('CHAT_THUMBNAIL_WORKERS', 2))  # hilos que generan miniaturas de adjuntos
+WEBSOCKET_HEARTBEAT_INTERVAL = 30  # segundos entre renovaciones de la presencia de cada conexión
+CHAT_PRESENCE_TTL = 90  # segundos tras los que vence la presencia que ninguna conexión renovó
+WEBSOCKET_JWT_CACHE_TTL = 60  # segundos que se reutiliza un token ya validado en el handshake
+CHAT_TYPING_WINDOW = 0.3  # segundos en los que se agrupan los eventos de escritura
+CHAT_TYPING_TIMEOUT = 5  # segundos sin typing.start tras los que se considera que dejó de escribir
+CHAT_MEMBERSHIP_TTL = 30  # segundos que un proceso reutiliza la lista de participantes cacheada
+CHAT_JSON_ENCODER = os.getenv("CHAT_JSON_ENCODER")  # ruta a un callable obj -> str; por defecto orjson si está instalado
 
 
 # Database
@@ -157,6 +167,61 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Coste del hash de contraseñas. 'production': PBKDF2 con PASSWORD_HASH_ITERATIONS;
+# 'fast': pocas iteraciones para tests y cargas de datos (por defecto al correr `manage.py test`).
+# Los hashes más débiles que el perfil activo se rehacen de forma transparente al iniciar sesión.
+PASSWORD_HASHING_PROFILE = os.getenv('PASSWORD_HASHING_PROFILE', 'fast' if 'test' in sys.argv[1:2] else 'production')
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', 1_000_000))
+PASSWORD_FAST_ITERATIONS = int(os.getenv('PASSWORD_FAST_ITERATIONS', 1_000))
+PASSWORD_HASHERS = [
+    'core.hashers.FastPBKDF2PasswordHasher' if PASSWORD_HASHING_PROFILE == 'fast'
+    else 'core.hashers.ProductionPBKDF2PasswordHasher',
+    # Sólo para verificar hashes existentes de otros algoritmos (se migran al primero al hacer login)
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Login por username o email sin distinguir mayúsculas, con una sola consulta
+AUTHENTICATION_BACKENDS = ['core.backends.CaseInsensitiveLoginBackend']
+
+# ActivityLog se escribe en un hilo aparte para no sumar el INSERT a la latencia de la petición
+ACTIVITY_LOG_ASYNC = os.getenv('ACTIVITY_LOG_ASYNC', 'True') == 'True'
+
+# Perfilado SQL por ruta (consultas, tiempo SQL, SQL repetido) en /api/admin/sql-profile/ y Server-Timing
+SQL_PROFILING_ENABLED = os.getenv('SQL_PROFILING_ENABLED', 'False') == 'True'
+SQL_PROFILING_SAMPLE_RATE = float(os.getenv('SQL_PROFILING_SAMPLE_RATE', 1.0))  # fracción de peticiones perfiladas
+SQL_PROFILING_SERVER_TIMING = os.getenv('SQL_PROFILING_SERVER_TIMING', 'True') == 'True'
+SQL_PROFILING_WINDOW = 900  # segundos de historia del histograma móvil
+SQL_PROFILING_SLOT = 60  # segundos por tramo de la ventana
+
+# Métricas en formato Prometheus en /metrics. Con varios workers, METRICS_MULTIPROC_DIR debe ser un
+# directorio compartido (vaciado en cada despliegue) donde cada proceso vuelca sus métricas.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 5))  # segundos entre volcados de cada proceso
+# Si se define, /metrics exige "Authorization: Bearer <token>"; si no, con DEBUG=False sólo lo ve el staff logueado
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Los loggers de la app ("core.*") escriben a la consola, donde los recoge el hosting
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {'core': {'handlers': ['console'], 'level': os.getenv('CORE_LOG_LEVEL', 'INFO')}},
+}
+
+# Retención de ActivityLog/AccessLog (manage.py log_retention): particiones mensuales en PostgreSQL si se
+# convirtieron con manage.py partition_logs; si no, tabla <tabla>_archive
+LOG_RETENTION_MONTHS = int(os.getenv('LOG_RETENTION_MONTHS', 12))  # meses que se conservan, incluido el actual
+LOG_PARTITION_MONTHS_AHEAD = int(os.getenv('LOG_PARTITION_MONTHS_AHEAD', 3))  # particiones creadas por adelantado
+LOG_ARCHIVE_DIR = os.getenv('LOG_ARCHIVE_DIR', str(BASE_DIR / 'log_archive'))  # destino de --action export
+
+# Rollups diarios del reporte de seguridad (manage.py refresh_security_rollups, p. ej. cada 5 minutos desde cron).
+# Cada refresco vuelve a recalcular los días desde SECURITY_ROLLUP_LAG segundos antes del anterior
+SECURITY_ROLLUP_LAG = int(os.getenv('SECURITY_ROLLUP_LAG', 300))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -196,11 +261,22 @@ CORS_ALLOWED_ORIGINS = os.getenv(
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=8),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
+    "TOKEN_OBTAIN_SERIALIZER": "core.tokens.CondoTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "core.tokens.CondoTokenRefreshSerializer",
 }
+AUTH_USER_CACHE_TTL = 30  # segundos que un proceso reutiliza el usuario completo cargado para un token
+AUTH_CLAIMS_MAX_AGE = int(os.getenv('AUTH_CLAIMS_MAX_AGE', 900))  # edad máxima de un access token para usar sus claims sin BD
 
 # --- 👇 AÑADE ESTO AL FINAL DEL ARCHIVO ---
 # Configuración para la subida de archivos de usuario (fotos, etc.)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
-MERCADOPAGO_ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN")
\ No newline at end of file
+MERCADOPAGO_ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN")
+MERCADOPAGO_WEBHOOK_SECRET = os.getenv("MERCADOPAGO_WEBHOOK_SECRET", "")  # vacío: no se valida x-signature
+MERCADOPAGO_NOTIFICATION_URL = os.getenv("MERCADOPAGO_NOTIFICATION_URL", "")
+# "mercadopago" usa el SDK real; "stub" es el proveedor en memoria de core.services.payment_providers
+PAYMENT_PROVIDER = os.getenv("PAYMENT_PROVIDER", "mercadopago" if MERCADOPAGO_ACCESS_TOKEN else "stub")
+# Webhooks de pago (manage.py process_payment_events): reintentos con backoff de base * 2^(intento-1) segundos
+PAYMENT_WEBHOOK_MAX_ATTEMPTS = int(os.getenv("PAYMENT_WEBHOOK_MAX_ATTEMPTS", 8))
+PAYMENT_WEBHOOK_RETRY_BASE = int(os.getenv("PAYMENT_WEBHOOK_RETRY_BASE", 30))
\ No newline at end of file
@@ -41,6 +41,7 @@ router.register(r"ai/access-logs", ai.AccessLogViewSet, basename="access-log")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", v.metrics_view, name='metrics'),
 
     # Login propio
     path("api/auth/login/", v.LoginView.as_view()),
@@ -59,6 +60,8 @@ urlpatterns = [
     path("api/reports/finance/", v.FinanceReportView.as_view()),  # <-- NUEVO
     path("api/reports/occupancy/", v.OccupancyReportView.as_view(), name='report-occupancy'),
     path("api/reports/dashboard-stats/", v.DashboardStatsView.as_view()),
+    path("api/search/", v.SearchView.as_view(), name='search'),
+    path("api/admin/sql-profile/", v.SQLProfileView.as_view(), name='sql-profile'),
     path("api/reports/export/", reports.ExportReportView.as_view(), name='direct-export-report'),  # Export endpoint
     
     path("api/fees/<int:fee_id>/create-payment-preference/", v.FeePaymentPreferenceView.as_view()),
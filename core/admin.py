@@ -4,7 +4,7 @@ from .models import (
     CommonArea, Reservation, MaintenanceRequest, Vehicle,
     Pet, FamilyMember, NoticeCategory, Notification,
     ActivityLog, MaintenanceRequestComment, MaintenanceRequestAttachment,
-    FaceEncoding, Visitor, SecurityIncident, AccessLog
+    FaceEncoding, Visitor, SecurityIncident, AccessLog, PaymentEvent, PaymentDeadLetter
 )
 
 @admin.register(ExpenseType)
@@ -30,6 +30,17 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ("method",)
     search_fields = ("fee__unit__code",)
 
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "provider", "topic", "action", "resource_id", "status", "attempts", "received_at")
+    list_filter = ("status", "provider", "topic")
+    search_fields = ("resource_id", "idempotency_key")
+
+@admin.register(PaymentDeadLetter)
+class PaymentDeadLetterAdmin(admin.ModelAdmin):
+    list_display = ("id", "event", "reason", "failed_at")
+    search_fields = ("event__resource_id", "reason")
+
 @admin.register(Notice)
 class NoticeAdmin(admin.ModelAdmin):
     list_display = ("id", "title", "publish_date", "created_by")
@@ -0,0 +1,145 @@
+# core/authentication.py
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import ClaimsProfile, ClaimsUser
+
+User = get_user_model()
+
+CLAIMS = ('username', 'is_active', 'is_staff', 'is_superuser', 'role', 'profile_id', 'full_name')
+MAX_CACHED_USERS = 10000
+# Momento (epoch) desde el que los claims emitidos antes para el usuario dejan de valer (ver revoke_claims).
+# Con LocMem (por defecto) la marca es del proceso; con CACHES en Redis la ven todos los workers.
+REVOKED_KEY = 'auth:claims-revoked:{user_id}'
+
+# Caché del proceso: user_id -> (expira, User con su profile). TTL corto: los cambios de
+# otros procesos se ven como mucho AUTH_USER_CACHE_TTL segundos después.
+_users = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_full_user(user_id):
+    """Usuario completo (con profile) desde la caché del proceso o, si expiró, desde la BD"""
+    user_id = int(user_id)
+    now = time.monotonic()
+    with _lock:
+        entry = _users.get(user_id)
+        if entry is not None and entry[0] > now:
+            _users.move_to_end(user_id)
+            return entry[1]
+
+    user = User.objects.select_related('profile').get(pk=user_id)
+    ttl = getattr(settings, 'AUTH_USER_CACHE_TTL', 30)
+    with _lock:
+        _users[user_id] = (now + ttl, user)
+        _users.move_to_end(user_id)
+        while len(_users) > MAX_CACHED_USERS:
+            _users.popitem(last=False)
+    return user
+
+
+def invalidate_user(user_id=None):
+    with _lock:
+        if user_id is None:
+            _users.clear()
+        else:
+            _users.pop(int(user_id), None)
+
+
+def revoke_claims(user_id):
+    """
+    Deja de confiar en los claims de los tokens ya emitidos para el usuario (desactivado, cambio de
+    permisos o de rol): sus peticiones pasan a leer el usuario de la BD hasta que renueve el token.
+    """
+    lifetime = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+    cache.set(REVOKED_KEY.format(user_id=int(user_id)), time.time(), timeout=lifetime + 60)
+    invalidate_user(user_id)
+
+
+def claims_trusted(token):
+    """
+    Los claims valen si el token tiene menos de AUTH_CLAIMS_MAX_AGE segundos y no fue emitido antes de
+    una revocación. El límite de edad acota el tiempo en que un cambio puede pasar desapercibido
+    cuando la revocación no llega al proceso (caché no compartida).
+    """
+    issued_at = token.get('iat')
+    if issued_at is None or time.time() - issued_at > getattr(settings, 'AUTH_CLAIMS_MAX_AGE', 900):
+        return False
+    revoked_at = cache.get(REVOKED_KEY.format(user_id=int(token[api_settings.USER_ID_CLAIM])))
+    return revoked_at is None or issued_at > revoked_at
+
+
+def _from_claims(model, values):
+    # from_db espera los valores en el orden de los campos concretos; el resto queda diferido
+    field_names = [f.attname for f in model._meta.concrete_fields if f.attname in values]
+    return model.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+
+
+def build_claims_user(token):
+    """
+    Usuario (y perfil) construido sólo con los claims del token, sin consultas.
+    Devuelve None si el token es anterior a estos claims o si no se puede confiar en ellos
+    (claims_trusted): entonces hay que leer el usuario de la BD.
+    """
+    if any(claim not in token for claim in CLAIMS) or not claims_trusted(token):
+        return None
+
+    user_id = int(token[api_settings.USER_ID_CLAIM])
+    user = _from_claims(ClaimsUser, {
+        'id': user_id,
+        'username': token['username'],
+        'is_staff': token['is_staff'],
+        'is_superuser': token['is_superuser'],
+        'is_active': token['is_active'],
+    })
+
+    profile = None
+    if token['profile_id'] is not None:
+        profile = _from_claims(ClaimsProfile, {
+            'id': token['profile_id'],
+            'user_id': user_id,
+            'full_name': token['full_name'],
+            'role': token['role'],
+        })
+        ClaimsProfile.user.field.set_cached_value(profile, user)
+    # Con None cacheado, hasattr(user, 'profile') es False sin ir a la BD
+    User.profile.related.set_cached_value(user, profile)
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication sin consulta por petición: el usuario sale de los claims
+    (ver core.tokens.add_user_claims). Los tokens antiguos, sin claims, los revocados y los de más
+    de AUTH_CLAIMS_MAX_AGE segundos usan la caché del proceso (AUTH_USER_CACHE_TTL).
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = build_claims_user(validated_token)
+        if user is not None:
+            if not user.is_active:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            return user
+
+        try:
+            user = get_full_user(validated_token[api_settings.USER_ID_CLAIM])
+        except User.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        # Copia: la instancia cacheada se comparte entre peticiones
+        return copy.copy(user)
@@ -0,0 +1,37 @@
+# core/backends.py
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+UserModel = get_user_model()
+
+
+class CaseInsensitiveLoginBackend(ModelBackend):
+    """
+    Autentica por username o email sin distinguir mayúsculas con una sola consulta, que usa los
+    índices funcionales lower(...) de la migración 0017 y trae el perfil que necesita el login.
+    La contraseña se verifica sobre ese mismo usuario, sin volver a buscarlo.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        field = 'email' if '@' in username else 'username'
+        user = (
+            UserModel._default_manager
+            .alias(login_key=Lower(field))
+            .filter(login_key=username.lower())
+            .select_related('profile')
+            .order_by('pk')
+            .first()
+        )
+        if user is None:
+            # Mismo coste que un login real para no revelar qué usuarios existen
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
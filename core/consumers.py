@@ -1,16 +1,26 @@
 # core/consumers.py
+import asyncio
 import json
+import logging
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Conversation, Message, MessageReadStatus
+from django.db import transaction
+from .models import Conversation, Message
+from .services import membership, metrics, presence
+from .services.chat import message_payload
+from .services.frames import encode_frame
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
+        self.conversation_id = int(self.scope['url_route']['kwargs']['conversation_id'])
         self.room_group_name = f'chat_{self.conversation_id}'
         self.user = self.scope['user']
         
@@ -19,8 +29,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        # Verificar permisos
-        has_permission = await self.check_permission()
+        # Verificar permisos y cachear la conversación y los datos del remitente
+        has_permission = await self.load_connection_state()
         if not has_permission:
             await self.close(code=4001)
             return
@@ -31,35 +41,79 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        await self.accept()
+        # Si el token llegó por subprotocolo hay que devolverlo o el navegador aborta el handshake
+        await self.accept(subprotocol=self.scope.get('jwt_subprotocol'))
+        self.accepted = True
+        metrics.WS_CONNECTIONS.inc()
+        metrics.WS_CONNECTIONS_TOTAL.inc()
+        self.schedule_token_expiry()
         
-        # Notificar que el usuario está online
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
+        # Notificar que el usuario está online (sólo en su primera conexión/pestaña)
+        self.presence_registered = True
+        self.presence_task = asyncio.ensure_future(self.refresh_presence())
+        if await presence.register_connection(self.conversation_id, self.user.id):
+            await self.group_send({
                 'type': 'user_online',
                 'user_id': self.user.id,
-                'username': self.user.username
-            }
-        )
+                'frame': encode_frame('user.online', {
+                    'user_id': self.user.id,
+                    'username': self.user.username
+                })
+            })
     
     async def disconnect(self, close_code):
-        # Notificar que el usuario está offline
-        if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'user_offline',
-                    'user_id': self.user.id
-                }
+        if getattr(self, 'accepted', False):
+            self.accepted = False
+            metrics.WS_CONNECTIONS.dec()
+        
+        for task_name in ('expiry_task', 'presence_task'):
+            task = getattr(self, task_name, None)
+            if task is not None:
+                task.cancel()
+        
+        if getattr(self, 'presence_registered', False):
+            self.presence_registered = False
+            await presence.typing_coalescer.update(
+                self.channel_layer, self.conversation_id, self.user.id, self.user.username, False
             )
-            
+            # Notificar que el usuario está offline (sólo al cerrar su última conexión)
+            if await presence.unregister_connection(self.conversation_id, self.user.id):
+                await self.group_send({
+                    'type': 'user_offline',
+                    'user_id': self.user.id,
+                    'frame': encode_frame('user.offline', {'user_id': self.user.id})
+                })
+        
+        if hasattr(self, 'room_group_name'):
             # Salir del grupo
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
             )
     
+    async def group_send(self, event):
+        """group_send al grupo de la conversación midiendo su latencia por tipo de evento"""
+        with metrics.GROUP_SEND_LATENCY.time(event=event['type']):
+            await self.channel_layer.group_send(self.room_group_name, event)
+    
+    def schedule_token_expiry(self):
+        """Cierra la conexión (4401) cuando expira el JWT con el que se autenticó"""
+        token_exp = self.scope.get('token_exp')
+        if token_exp:
+            self.expiry_task = asyncio.ensure_future(self.close_on_token_expiry(token_exp - time.time()))
+    
+    async def close_on_token_expiry(self, delay):
+        await asyncio.sleep(max(delay, 0))
+        await self.send_error('TOKEN_EXPIRED', 'El token expiró, vuelve a conectar con uno nuevo')
+        await self.close(code=4401)
+    
+    async def refresh_presence(self):
+        """Mientras la conexión siga abierta renueva el vencimiento de su contador de presencia"""
+        interval = getattr(settings, 'WEBSOCKET_HEARTBEAT_INTERVAL', 30)
+        while True:
+            await asyncio.sleep(interval)
+            await presence.refresh_connection(self.conversation_id, self.user.id)
+    
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
@@ -89,39 +143,29 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.send_error('EMPTY_MESSAGE', 'El mensaje no puede estar vacío')
             return
         
-        # Guardar mensaje en la base de datos
+        # Guardar mensaje en la base de datos (un solo salto de hilo y una transacción)
         message = await self.save_message(text, message_type)
         
         if message:
-            # Serializar mensaje
-            message_data = await self.serialize_message(message)
+            metrics.CHAT_MESSAGES.inc(source='websocket')
+            # Serializar mensaje con los datos cacheados en connect(), sin consultas
+            message_data = self.build_message_payload(message)
             
-            # Broadcast a todos en el grupo
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'message_new',
-                    'message': message_data
-                }
-            )
+            # Broadcast a todos en el grupo: se codifica una vez aquí y cada consumidor lo reenvía
+            await self.group_send({
+                'type': 'message_new',
+                'frame': encode_frame('message.new', message_data)
+            })
     
     async def handle_typing_start(self):
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'typing_start',
-                'user_id': self.user.id,
-                'username': self.user.username
-            }
+        # Se agrupa por conversación: un solo broadcast por ventana de CHAT_TYPING_WINDOW
+        await presence.typing_coalescer.update(
+            self.channel_layer, self.conversation_id, self.user.id, self.user.username, True
         )
     
     async def handle_typing_stop(self):
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'typing_stop',
-                'user_id': self.user.id
-            }
+        await presence.typing_coalescer.update(
+            self.channel_layer, self.conversation_id, self.user.id, self.user.username, False
         )
     
     async def handle_message_read(self, data):
@@ -130,139 +174,110 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.mark_message_as_read(message_id)
             
             # Notificar al remitente
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'message_read',
+            await self.group_send({
+                'type': 'message_read',
+                'frame': encode_frame('message.read', {
                     'message_id': message_id,
                     'user_id': self.user.id,
-                    'read_at': None  # Se llenará en el handler
-                }
-            )
+                    'read_at': None
+                })
+            })
     
-    # Handlers para eventos del grupo
+    # Handlers para eventos del grupo: reenvían el frame ya codificado por el emisor
     async def message_new(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'message.new',
-            'data': event['message']
-        }))
+        await self.send(text_data=event['frame'])
     
-    async def typing_start(self, event):
+    async def typing_batch(self, event):
         # No enviar al usuario que está escribiendo
-        if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
-                'type': 'typing.start',
-                'data': {
-                    'user_id': event['user_id'],
-                    'username': event['username']
-                }
-            }))
+        for item in event['started'] + event['stopped']:
+            if item['user_id'] != self.user.id:
+                await self.send(text_data=item['frame'])
     
-    async def typing_stop(self, event):
-        if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
-                'type': 'typing.stop',
-                'data': {
-                    'user_id': event['user_id']
-                }
-            }))
+    async def message_thumbnail(self, event):
+        await self.send(text_data=event['frame'])
     
     async def message_read(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'message.read',
-            'data': {
-                'message_id': event['message_id'],
-                'user_id': event['user_id'],
-                'read_at': event.get('read_at')
-            }
-        }))
+        await self.send(text_data=event['frame'])
+    
+    async def messages_read(self, event):
+        await self.send(text_data=event['frame'])
+    
+    async def members_removed(self, event):
+        # Otro proceso pudo cambiar los participantes: invalidar la caché local
+        membership.invalidate(self.conversation_id)
+        if self.user.id in event['user_ids']:
+            # El usuario fue removido de la conversación: expulsarlo del grupo
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+            await self.close(code=4003)
     
     async def user_online(self, event):
         if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
-                'type': 'user.online',
-                'data': {
-                    'user_id': event['user_id'],
-                    'username': event.get('username')
-                }
-            }))
+            await self.send(text_data=event['frame'])
     
     async def user_offline(self, event):
         if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
-                'type': 'user.offline',
-                'data': {
-                    'user_id': event['user_id']
-                }
-            }))
+            await self.send(text_data=event['frame'])
     
     async def send_error(self, error_code, message):
-        await self.send(text_data=json.dumps({
-            'type': 'error',
-            'data': {
-                'code': error_code,
-                'message': message
-            }
+        await self.send(text_data=encode_frame('error', {
+            'code': error_code,
+            'message': message
         }))
     
+    def build_message_payload(self, message):
+        """Serializa el mensaje para enviar por WebSocket"""
+        return message_payload(message, self.sender_payload)
+    
     # Database operations
     @database_sync_to_async
-    def check_permission(self):
-        """Verifica que el usuario sea participante de la conversación"""
-        try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            return conversation.participants.filter(id=self.user.id).exists()
-        except Conversation.DoesNotExist:
+    def load_connection_state(self):
+        """
+        Verifica la pertenencia (caché de miembros del proceso; una ausencia se confirma en la BD)
+        y cachea los datos de presentación del remitente para toda la vida de la conexión.
+        """
+        if not membership.is_member(self.conversation_id, self.user.id):
             return False
+        
+        # Con un usuario del JWT (core.ws_auth) el perfil viene de los claims, sin consulta
+        profile = getattr(self.user, 'profile', None)
+        self.sender_payload = {
+            'id': self.user.id,
+            'username': self.user.username,
+            'full_name': profile.full_name if profile is not None else self.user.username,
+        }
+        return True
     
     @database_sync_to_async
     def save_message(self, text, message_type):
-        """Guarda el mensaje en la base de datos"""
+        """
+        Guarda el mensaje y actualiza el preview de la conversación en una transacción.
+        Devuelve None si falla el guardado. Las bajas cierran la conexión con members_removed.
+        """
         try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            message = Message.objects.create(
-                conversation=conversation,
-                sender=self.user,
-                type=message_type,
-                text=text
-            )
-            
-            # Actualizar último mensaje de la conversación
-            conversation.update_last_message(message)
-            
+            with transaction.atomic():
+                message = Message.objects.create(
+                    conversation_id=self.conversation_id,
+                    sender=self.user,
+                    type=message_type,
+                    text=text
+                )
+                # UPDATE directo: no hace falta volver a leer la conversación
+                Conversation.objects.filter(pk=self.conversation_id).update(
+                    last_message_at=message.created_at,
+                    last_message_preview=Conversation.preview_for(message)
+                )
             return message
-        except Exception as e:
-            print(f"Error saving message: {e}")
+        except Exception:
+            metrics.CHAT_MESSAGE_ERRORS.inc(source='websocket')
+            logger.exception('Error guardando mensaje en la conversación %s', self.conversation_id)
             return None
     
-    @database_sync_to_async
-    def serialize_message(self, message):
-        """Serializa el mensaje para enviar por WebSocket"""
-        return {
-            'id': message.id,
-            'sender': {
-                'id': message.sender.id,
-                'username': message.sender.username,
-                'full_name': message.sender.profile.full_name if hasattr(message.sender, 'profile') else message.sender.username,
-            },
-            'type': message.type,
-            'text': message.text,
-            'attachment': None,  # TODO: Implementar cuando se agregue subida de archivos
-            'created_at': message.created_at.isoformat(),
-            'edited_at': message.edited_at.isoformat() if message.edited_at else None,
-            'is_deleted': message.is_deleted,
-            'is_read': False
-        }
-    
     @database_sync_to_async
     def mark_message_as_read(self, message_id):
         """Marca un mensaje como leído"""
         try:
-            message = Message.objects.get(id=message_id)
-            MessageReadStatus.objects.get_or_create(
-                message=message,
-                user=self.user
-            )
+            message = Message.objects.get(id=message_id, conversation_id=self.conversation_id)
+            message.mark_as_read_by(self.user)
             return True
         except Message.DoesNotExist:
             return False
@@ -0,0 +1,59 @@
+# core/filters.py
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def _parse_bound(value, param):
+    """Fecha-hora ISO, o fecha sola (medianoche en la zona del proyecto). Devuelve (instante, es_fecha)."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError
+            return timezone.make_aware(datetime.combine(day, time.min)), True
+    except ValueError:
+        raise ValidationError({param: "Fecha inválida, usa AAAA-MM-DD o una fecha-hora ISO 8601."})
+    return (timezone.make_aware(moment) if timezone.is_naive(moment) else moment), False
+
+
+def _parse_ids(value, param):
+    try:
+        return [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ValidationError({param: "Debe ser un id o una lista de ids separados por coma."})
+
+
+def filter_logs(queryset, params, choice_filters=None):
+    """
+    Filtros de los visores de logs, todos sobre columnas con índice compuesto (columna, timestamp):
+
+    - `?from=` / `?to=`: rango sobre timestamp. Con una fecha sola `to` incluye el día completo.
+    - `?user=<id>[,<id>...]`
+    - `choice_filters` ({parámetro: campo}): valores separados por coma, p. ej. `?action=CREATE,DELETE`.
+
+    Acotar por timestamp además permite a PostgreSQL descartar las particiones mensuales fuera del rango.
+    """
+    start = params.get('from')
+    if start:
+        queryset = queryset.filter(timestamp__gte=_parse_bound(start, 'from')[0])
+    end = params.get('to')
+    if end:
+        moment, is_date = _parse_bound(end, 'to')
+        if is_date:
+            queryset = queryset.filter(timestamp__lt=moment + timedelta(days=1))
+        else:
+            queryset = queryset.filter(timestamp__lte=moment)
+
+    users = params.get('user')
+    if users:
+        queryset = queryset.filter(user_id__in=_parse_ids(users, 'user'))
+
+    for param, field in (choice_filters or {}).items():
+        values = [item.strip() for item in params.get(param, '').split(',') if item.strip()]
+        if values:
+            queryset = queryset.filter(**{f'{field}__in': values})
+    return queryset
@@ -0,0 +1,31 @@
+# core/hashers.py
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ProductionPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 con las iteraciones de PASSWORD_HASH_ITERATIONS. Mismo algoritmo que el hasher de
+    Django, así que verifica cualquier hash pbkdf2_sha256 y, si tiene menos iteraciones (p. ej.
+    uno creado con el perfil 'fast'), Django lo rehace en el siguiente login correcto.
+    """
+
+    @property
+    def iterations(self):
+        # Se lee en cada uso para respetar override_settings y cambios de configuración
+        return settings.PASSWORD_HASH_ITERATIONS
+
+
+class FastPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """Perfil 'fast' para tests y datos de prueba: pocas iteraciones, nunca en producción"""
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_FAST_ITERATIONS
+
+    def must_update(self, encoded):
+        # No degradar hashes más fuertes que ya existan en la base de datos
+        return self.decode(encoded)["iterations"] < self.iterations
+
+    def harden_runtime(self, password, encoded):
+        pass
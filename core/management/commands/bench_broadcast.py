@@ -0,0 +1,70 @@
+import json
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.consumers import ChatConsumer
+from core.services.frames import encode_frame, get_encoder
+
+
+class _Member:
+    """Sustituto mínimo de un ChatConsumer conectado: sólo cuenta los bytes enviados."""
+    def __init__(self, user_id):
+        self.user = type('BenchUser', (), {'id': user_id})()
+        self.sent = 0
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.sent += len(text_data)
+
+
+class Command(BaseCommand):
+    help = 'Compara el CPU de codificar un broadcast por destinatario frente a un frame pre-codificado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=500, help='Miembros del grupo')
+        parser.add_argument('--iterations', type=int, default=200, help='Broadcasts a simular')
+
+    def handle(self, *args, **options):
+        members = [_Member(i) for i in range(options['members'])]
+        iterations = options['iterations']
+        message = {
+            'id': 123456,
+            'sender': {'id': 42, 'username': 'residente.42', 'full_name': 'Residente Cuarenta y Dos'},
+            'type': 'TEXT',
+            'text': 'Recordatorio: mañana se corta el agua de 9:00 a 13:00 en la Torre B. ' * 2,
+            'attachment': None,
+            'created_at': timezone.now().isoformat(),
+            'edited_at': None,
+            'is_deleted': False,
+            'is_read': False,
+        }
+
+        async def legacy():
+            # Antes: cada consumidor hacía json.dumps del mismo payload
+            for _ in range(iterations):
+                event = {'type': 'message_new', 'message': message}
+                for member in members:
+                    await member.send(text_data=json.dumps({'type': 'message.new', 'data': event['message']}))
+
+        async def pre_encoded():
+            for _ in range(iterations):
+                event = {'type': 'message_new', 'frame': encode_frame('message.new', message)}
+                for member in members:
+                    await ChatConsumer.message_new(member, event)
+
+        legacy_cpu = self._measure(legacy)
+        new_cpu = self._measure(pre_encoded)
+        saved = (1 - new_cpu / legacy_cpu) * 100 if legacy_cpu else 0
+
+        encoder = getattr(get_encoder(), '__qualname__', repr(get_encoder()))
+        self.stdout.write(f"Grupo de {options['members']} miembros, {iterations} broadcasts (encoder: {encoder})")
+        self.stdout.write(f"  json.dumps por destinatario: {legacy_cpu * 1000 / iterations:.3f} ms CPU/broadcast")
+        self.stdout.write(f"  frame pre-codificado:        {new_cpu * 1000 / iterations:.3f} ms CPU/broadcast")
+        self.stdout.write(self.style.SUCCESS(f"  CPU ahorrado: {saved:.1f}%"))
+
+    def _measure(self, coroutine_fn):
+        start = time.process_time()
+        async_to_sync(coroutine_fn)()
+        return time.process_time() - start
@@ -0,0 +1,73 @@
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from core.models import Conversation, Profile
+from core.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Mide mensajes/segundo por proceso del ChatConsumer (guardar + broadcast) con un channel layer en memoria.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000, help='Número de mensajes a enviar')
+        parser.add_argument('--warmup', type=int, default=50, help='Mensajes de calentamiento (no se miden)')
+
+    def handle(self, *args, **options):
+        # Lo que crea el benchmark se borra al terminar, aunque falle a mitad
+        sender, created_sender = User.objects.get_or_create(username='bench_chat_sender')
+        profile, created_profile = Profile.objects.get_or_create(user=sender, defaults={'full_name': 'Bench Sender'})
+        conversation = None
+        try:
+            conversation = Conversation.objects.create(type='GROUP', name='bench_chat', created_by=sender)
+            conversation.participants.add(sender)
+            with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+                channel_layers.backends = {}
+                elapsed = async_to_sync(self._run)(sender, conversation.id, options['messages'], options['warmup'])
+        finally:
+            channel_layers.backends = {}
+            if conversation is not None:
+                conversation.delete()
+            if created_sender:
+                sender.delete()
+            elif created_profile:
+                profile.delete()
+
+        rate = options['messages'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['messages']} mensajes en {elapsed:.2f}s -> {rate:,.0f} mensajes/s "
+            f"({elapsed / options['messages'] * 1000:.2f} ms/mensaje)"
+        ))
+
+    async def _run(self, user, conversation_id, count, warmup):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{conversation_id}/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        if not connected:
+            raise RuntimeError('No se pudo conectar al ChatConsumer')
+
+        for i in range(warmup):
+            await self._roundtrip(communicator, i)
+
+        start = time.perf_counter()
+        for i in range(count):
+            await self._roundtrip(communicator, i)
+        elapsed = time.perf_counter() - start
+
+        await communicator.disconnect()
+        return elapsed
+
+    async def _roundtrip(self, communicator, i):
+        await communicator.send_json_to({'type': 'message.send', 'data': {'text': f'bench {i}'}})
+        while True:
+            frame = await communicator.receive_json_from(timeout=5)
+            if frame['type'] == 'message.new':
+                return frame
@@ -0,0 +1,198 @@
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import AccessLog, ActivityLog, Conversation, Fee, Message, Payment, Profile, Unit
+from core.services import audit
+from core.tokens import CondoRefreshToken
+
+User = get_user_model()
+
+# (nombre, ruta, usuario que la llama, máximo de consultas SQL por petición).
+# Los presupuestos no dependen del volumen de datos: si una vista crece con las filas (N+1), se nota aquí.
+ENDPOINTS = [
+    ('fees-list', '/api/fees/', 'admin', 4),
+    ('fees-mine', '/api/fees/?mine=1', 'resident', 4),
+    ('unit-detail', '/api/units/{unit_id}/', 'admin', 8),
+    ('dashboard-stats', '/api/reports/dashboard-stats/', 'admin', 16),
+    ('advanced-overview', '/api/reports/advanced/?type=overview', 'admin', 28),
+    ('predict-delinquency', '/api/ai/predict-delinquency/', 'admin', 3),
+    ('conversations', '/api/conversations/', 'resident', 4),
+    ('export-financial-csv', '/api/reports/export/?type=financial&format=csv', 'admin', 8),
+    ('export-financial-excel', '/api/reports/export/?type=financial&format=excel', 'admin', 8),
+    ('export-financial-pdf', '/api/reports/export/?type=financial&format=pdf', 'admin', 8),
+    ('export-security-csv', '/api/reports/export/?type=security&format=csv', 'admin', 10),
+    ('activity-logs', '/api/activity-logs/?action=PAGE_ACCESS,UPDATE', 'admin', 4),
+    ('access-logs', '/api/ai/access-logs/?type=FACIAL&granted=0', 'admin', 4),
+]
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(samples, pct):
+    """Percentil por rango más cercano sobre muestras ya ordenadas"""
+    if not samples:
+        return None
+    index = max(0, min(len(samples) - 1, round(pct / 100 * len(samples) + 0.5) - 1))
+    return samples[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Benchmark de los endpoints más usados: latencia (percentiles), consultas SQL y memoria pico por '
+            'petición sobre un dataset generado a escala. Falla si algún endpoint supera su presupuesto de consultas.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.1, help='Escala del dataset (ver generate_load_data)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='bench', help='Prefijo del dataset; si ya existe se reutiliza')
+        parser.add_argument('--iterations', type=int, default=20, help='Peticiones medidas por endpoint')
+        parser.add_argument('--warmup', type=int, default=2, help='Peticiones previas sin medir por endpoint')
+        parser.add_argument('--only', default='', help='Endpoints a medir, separados por coma (por nombre)')
+        parser.add_argument('--output', default='',
+                            help='Archivo JSON de resultados (por defecto bench_results/endpoints-<fecha>.json)')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['warmup'] < 0:
+            raise CommandError('--iterations debe ser al menos 1 y --warmup no puede ser negativo')
+        selected = [name.strip() for name in options['only'].split(',') if name.strip()]
+        known = {name for name, *_ in ENDPOINTS}
+        if set(selected) - known:
+            raise CommandError(f"Endpoints desconocidos: {', '.join(sorted(set(selected) - known))}")
+        endpoints = [e for e in ENDPOINTS if not selected or e[0] in selected]
+
+        prefix = options['prefix']
+        if not User.objects.filter(username__startswith=f'{prefix}_user_').exists():
+            self.stdout.write(f"Generando dataset '{prefix}' a escala {options['scale']}...")
+            call_command('generate_load_data', scale=options['scale'], seed=options['seed'], prefix=prefix,
+                         stdout=io.StringIO())
+        context = self._context(prefix)
+        clients = {role: self._client(user) for role, user in context['users'].items()}
+
+        results = []
+        for name, path, role, budget in endpoints:
+            result = self._measure(clients[role], path.format(**context), options['warmup'], options['iterations'])
+            result.update({'name': name, 'path': path.format(**context), 'user': role, 'query_budget': budget})
+            result['ok'] = result['status'] == 200 and result['queries'] <= budget
+            results.append(result)
+            self._print_result(result)
+
+        # Los ActivityLog de las peticiones se escriben en otro hilo: esperarlo antes de terminar
+        audit._executor.submit(lambda: None).result()
+
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'scale': options['scale'],
+            'seed': options['seed'],
+            'iterations': options['iterations'],
+            'dataset': context['dataset'],
+            'endpoints': results,
+        }
+        output = options['output'] or os.path.join(
+            'bench_results', f"endpoints-{timezone.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        if os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        self.stdout.write(f'\nResultados guardados en {output}')
+
+        failed = [r for r in results if not r['ok']]
+        if failed:
+            raise CommandError('Endpoints fuera de presupuesto o con error: ' + ', '.join(
+                f"{r['name']} (HTTP {r['status']}, {r['queries']}/{r['query_budget']} consultas)" for r in failed
+            ))
+        self.stdout.write(self.style.SUCCESS('Todos los endpoints dentro de su presupuesto de consultas.'))
+
+    def _context(self, prefix):
+        admin, _ = User.objects.get_or_create(username=f'{prefix}_admin', defaults={'is_staff': True})
+        Profile.objects.update_or_create(user=admin, defaults={'role': 'ADMIN', 'full_name': 'Administrador benchmark'})
+
+        # El residente con más conversaciones del dataset, dueño de al menos una unidad
+        resident = (
+            User.objects.filter(username__startswith=f'{prefix}_user_', profile__role='RESIDENT', units__isnull=False)
+            .annotate(conversation_count=Count('conversations', distinct=True))
+            .order_by('-conversation_count', 'id')
+            .first()
+        )
+        if resident is None:
+            raise CommandError(f"El dataset '{prefix}' no tiene residentes con unidad; usa otro --prefix.")
+        unit = Unit.objects.filter(owner=resident).order_by('id').first()
+
+        dataset = {
+            model._meta.model_name: model.objects.count()
+            for model in (User, Unit, Fee, Payment, AccessLog, ActivityLog, Conversation, Message)
+        }
+        return {'users': {'admin': admin, 'resident': resident}, 'unit_id': unit.id, 'dataset': dataset}
+
+    def _client(self, user):
+        client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+        # Token real: la autenticación por claims también forma parte de lo que se mide
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {CondoRefreshToken.for_user(user).access_token}')
+        return client
+
+    def _measure(self, client, path, warmup, iterations):
+        for _ in range(warmup):
+            client.get(path)
+
+        latencies, queries, status, size = [], 0, None, 0
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = client.get(path)
+                latencies.append((time.perf_counter() - start) * 1000)
+            status, queries = response.status_code, max(queries, len(ctx.captured_queries))
+            size = len(response.content)
+
+        # Memoria en una petición aparte: tracemalloc distorsiona la latencia
+        tracemalloc.start()
+        try:
+            client.get(path)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            'status': status,
+            'queries': queries,
+            'response_bytes': size,
+            'peak_memory_kb': round(peak / 1024, 1),
+            'latency_ms': {
+                'min': round(latencies[0], 2),
+                'mean': round(statistics.fmean(latencies), 2),
+                **{f'p{pct}': round(percentile(latencies, pct), 2) for pct in PERCENTILES},
+                'max': round(latencies[-1], 2),
+            },
+        }
+
+    def _print_result(self, result):
+        latency = result['latency_ms']
+        line = (f"{result['name']:<24} HTTP {result['status']}  {result['queries']:>3}/{result['query_budget']:<3} consultas  "
+                f"p50 {latency['p50']:>8.1f}ms  p95 {latency['p95']:>8.1f}ms  "
+                f"mem {result['peak_memory_kb']:>9,.0f}KB")
+        self.stdout.write(self.style.SUCCESS(line) if result['ok'] else self.style.ERROR(line))
@@ -0,0 +1,66 @@
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from core.models import ActivityLog
+from core.services import audit
+
+User = get_user_model()
+
+PASSWORD = 'BenchLogin#2024'
+
+
+class Command(BaseCommand):
+    help = 'Mide logins/segundo de POST /api/auth/login/ (extremo a extremo) y las consultas por login.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Usuarios de prueba a crear')
+        parser.add_argument('--logins', type=int, default=200, help='Logins a medir')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Un solo hash compartido: crear miles de usuarios no debe costar miles de PBKDF2
+        password_hash = make_password(PASSWORD)
+        users = User.objects.bulk_create(
+            [User(username=f'bench_login_{i}', email=f'bench_login_{i}@bench.local', password=password_hash)
+             for i in range(options['users'])],
+            batch_size=1000,
+        )
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+
+        try:
+            queries = 0
+            start = time.perf_counter()
+            for _ in range(options['logins']):
+                user = rng.choice(users)
+                # Mezclar mayúsculas y email para ejercitar los índices lower(...)
+                identifier = user.email if rng.random() < 0.5 else user.username.upper()
+                with CaptureQueriesContext(connection) as ctx:
+                    response = client.post('/api/auth/login/', {'username': identifier, 'password': PASSWORD},
+                                           content_type='application/json')
+                if response.status_code != 200:
+                    self.stderr.write(f'Login fallido para {identifier}: {response.status_code}')
+                    return
+                queries += len(ctx.captured_queries)
+            elapsed = time.perf_counter() - start
+
+            # Esperar a que el hilo de auditoría termine antes de contar y limpiar
+            audit._executor.submit(lambda: None).result()
+            logs = ActivityLog.objects.filter(user__username__startswith='bench_login_', action='USER_LOGIN_SUCCESS').count()
+        finally:
+            audit._executor.submit(lambda: None).result()
+            User.objects.filter(username__startswith='bench_login_').delete()
+
+        logins = options['logins']
+        self.stdout.write(f"Hasher: {get_hasher().algorithm} ({getattr(get_hasher(), 'iterations', '-')} iteraciones)")
+        self.stdout.write(f"{logins} logins en {elapsed:.2f}s -> {logins / elapsed:,.1f} logins/s")
+        self.stdout.write(f"Consultas por login en el hilo de la petición: {queries / logins:.1f}")
+        self.stdout.write(self.style.SUCCESS(f"Registros USER_LOGIN_SUCCESS: {logs} (uno por login)"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import ledger
+
+
+class Command(BaseCommand):
+    help = ('Compara los saldos de UnitPeriodBalance con las cuotas y pagos. Falla si hay diferencias '
+            '(para alertar desde cron); con --fix reconstruye los periodos afectados.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--periods', default='', help='Periodos AAAA-MM separados por coma (por defecto todos)')
+        parser.add_argument('--fix', action='store_true', help='Reconstruye los periodos con diferencias')
+        parser.add_argument('--limit', type=int, default=20, help='Diferencias a mostrar')
+
+    def handle(self, *args, **options):
+        periods = [p.strip() for p in options['periods'].split(',') if p.strip()]
+        result = ledger.check(periods or None, limit=options['limit'])
+        for item in result['mismatches']:
+            unit_id, expense_type_id, period = item['key']
+            self.stdout.write(
+                f"  unidad {unit_id}, tipo {expense_type_id}, {period}: "
+                f"esperado {item['expected']}, en el libro {item['actual']}"
+            )
+        if not result['total_mismatches']:
+            self.stdout.write(self.style.SUCCESS(f"Libro consistente ({result['checked']} saldos revisados)."))
+            return
+        if options['fix']:
+            ledger.rebuild(result['periods'])
+            self.stdout.write(self.style.WARNING(
+                f"{result['total_mismatches']} diferencias corregidas en {', '.join(result['periods'])}."
+            ))
+            return
+        raise CommandError(
+            f"{result['total_mismatches']} saldos no coinciden en {', '.join(result['periods'])}; "
+            f"usa --fix o rebuild_ledger."
+        )
@@ -0,0 +1,362 @@
+import csv
+import io
+import multiprocessing
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min, OuterRef, Subquery
+from django.utils import timezone
+
+from core.models import (
+    AccessLog, ActivityLog, Conversation, ExpenseType, Fee, Message, Payment, Profile, Unit,
+)
+from core.services import search
+
+User = get_user_model()
+
+# Filas por unidad de escala (--scale 1). Las cuotas salen de unidades x PERIODS x tipos de gasto.
+BASE_COUNTS = {
+    'users': 1000,
+    'conversations': 300,
+    'access_logs': 200_000,
+    'activity_logs': 200_000,
+    'messages': 200_000,
+}
+PERIODS = 24
+EXPENSE_TYPES = [
+    ('Cuota de Mantenimiento', Decimal('500.00')),
+    ('Fondo de Reserva', Decimal('100.00')),
+    ('Servicios Comunes', Decimal('250.00')),
+    ('Seguridad', Decimal('150.00')),
+    ('Limpieza', Decimal('80.00')),
+]
+PARALLEL_TABLES = ['fees', 'access_logs', 'activity_logs', 'messages']
+ALL_TABLES = PARALLEL_TABLES + ['payments']
+WORDS = (
+    'agua luz gas portero ascensor garaje jardín basura ruido mascota reunión cuota pago multa '
+    'piscina gimnasio vecino torre departamento llave paquete visita seguridad limpieza pintura '
+    'mañana tarde noche hoy urgente gracias favor consulta aviso horario corte reparación'
+).split()
+
+# Estado compartido con los procesos hijos (se hereda con fork)
+_CTX = {}
+
+
+def insert_rows(model, columns, rows, use_copy):
+    """Inserta filas (tuplas en el orden de `columns`, por attname) con COPY o bulk_create"""
+    if not rows:
+        return 0
+    if use_copy:
+        buffer = io.StringIO()
+        # QUOTE_NONNUMERIC: '' queda como "" (texto vacío) y None como vacío (NULL)
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+        buffer.seek(0)
+        db_columns = ', '.join(model._meta.get_field(c).column for c in columns)
+        sql = f'COPY {model._meta.db_table} ({db_columns}) FROM STDIN WITH (FORMAT csv)'
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                raw.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+    else:
+        # bulk_create pisa los campos auto_now_add con la hora actual: las fechas del pasado se restauran
+        # con un UPDATE por pk (executemany), sin tocar los Field compartidos del modelo.
+        # bulk_update no sirve aquí: su CASE WHEN por lote triplica el tiempo de inserción
+        fields = [model._meta.get_field(c) for c in columns]
+        stamped = [f for f in fields if getattr(f, 'auto_now_add', False)]
+        objs = [model(**dict(zip(columns, row))) for row in rows]
+        wanted = [[f.get_db_prep_save(getattr(obj, f.attname), connection) for f in stamped] for obj in objs]
+        with transaction.atomic():
+            model.objects.bulk_create(objs, batch_size=len(rows))
+            if stamped:
+                qn = connection.ops.quote_name
+                assignments = ', '.join(f'{qn(f.column)} = %s' for f in stamped)
+                sql = f'UPDATE {qn(model._meta.db_table)} SET {assignments} WHERE {qn(model._meta.pk.column)} = %s'
+                with connection.cursor() as cursor:
+                    cursor.executemany(sql, [[*values, obj.pk] for obj, values in zip(objs, wanted)])
+    return len(rows)
+
+
+def chunk_rng(table, index):
+    # Semilla por (tabla, bloque): el resultado no depende del número de workers
+    return random.Random(f"{_CTX['seed']}:{table}:{index}")
+
+
+def gen_fees(index):
+    rng = chunk_rng('fees', index)
+    per_chunk = _CTX['units_per_chunk']
+    units = _CTX['unit_ids'][index * per_chunk:(index + 1) * per_chunk]
+    rows = []
+    for unit_id in units:
+        for period_start in _CTX['periods']:
+            past = period_start < _CTX['current_period']
+            for expense_type_id, amount in _CTX['expense_types']:
+                roll = rng.random()
+                status = 'ISSUED' if not past else ('PAID' if roll < 0.8 else 'OVERDUE' if roll < 0.9 else 'ISSUED')
+                rows.append((unit_id, expense_type_id, period_start.strftime('%Y-%m'), amount, status,
+                             period_start, period_start.date() + timedelta(days=9)))
+    return Fee, ['unit_id', 'expense_type_id', 'period', 'amount', 'status', 'issued_at', 'due_date'], rows
+
+
+def _row_range(table, index):
+    size = _CTX['chunk_size']
+    return range(index * size, min(_CTX['counts'][table], (index + 1) * size))
+
+
+def gen_access_logs(index):
+    rng = chunk_rng('access_logs', index)
+    user_ids, now, tag = _CTX['user_ids'], _CTX['now'], _CTX['tag']
+    rows = []
+    for _ in _row_range('access_logs', index):
+        access_type = rng.choice(['FACIAL', 'VEHICLE', 'MANUAL', 'VISITOR'])
+        rows.append((
+            access_type,
+            None if access_type == 'VISITOR' else rng.choice(user_ids),
+            now - timedelta(seconds=rng.randrange(365 * 86400)),
+            rng.random() < 0.95,
+            round(rng.uniform(0.5, 1.0), 3),
+            tag,
+        ))
+    return AccessLog, ['access_type', 'user_id', 'timestamp', 'was_granted', 'confidence_score', 'notes'], rows
+
+
+def gen_activity_logs(index):
+    rng = chunk_rng('activity_logs', index)
+    user_ids, now = _CTX['user_ids'], _CTX['now']
+    actions = [code for code, _ in ActivityLog.ACTION_CHOICES]
+    paths = ['/api/fees/', '/api/units/', '/api/notices/', '/api/reservations/', '/api/reports/dashboard-stats/']
+    rows = []
+    for _ in _row_range('activity_logs', index):
+        action = rng.choice(actions)
+        rows.append((
+            rng.choice(user_ids), action, f'{action.lower()} (carga sintética)',
+            f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+            'load-generator', rng.choice(paths), rng.choice(['GET', 'POST', 'PATCH']),
+            now - timedelta(seconds=rng.randrange(365 * 86400)), '',
+        ))
+    columns = ['user_id', 'action', 'description', 'ip_address', 'user_agent', 'path', 'method', 'timestamp', 'session_key']
+    return ActivityLog, columns, rows
+
+
+def gen_messages(index):
+    rng = chunk_rng('messages', index)
+    conversations, now = _CTX['conversations'], _CTX['now']
+    rows = []
+    for _ in _row_range('messages', index):
+        conversation_id, participants = rng.choice(conversations)
+        rows.append((
+            conversation_id, rng.choice(participants), 'TEXT',
+            ' '.join(rng.choices(WORDS, k=rng.randint(3, 16))),
+            now - timedelta(seconds=rng.randrange(180 * 86400)), False, '',
+        ))
+    columns = ['conversation_id', 'sender_id', 'type', 'text', 'created_at', 'is_deleted', 'attachment_name']
+    return Message, columns, rows
+
+
+def gen_payments(index):
+    rng = chunk_rng('payments', index)
+    low = _CTX['fee_min_id'] + index * _CTX['chunk_size']
+    fees = (
+        Fee.objects.filter(id__gte=low, id__lt=low + _CTX['chunk_size'], status='PAID',
+                            unit__code__startswith=_CTX['unit_code_prefix'])
+        .values_list('id', 'amount', 'issued_at')
+    )
+    rows = [
+        (fee_id, amount, issued_at + timedelta(days=rng.randint(0, 25), seconds=rng.randrange(86400)),
+         rng.choice(['cash', 'transfer', 'card', 'mercadopago']), '')
+        for fee_id, amount, issued_at in fees.iterator()
+    ]
+    return Payment, ['fee_id', 'amount', 'paid_at', 'method', 'note'], rows
+
+
+GENERATORS = {
+    'fees': gen_fees,
+    'access_logs': gen_access_logs,
+    'activity_logs': gen_activity_logs,
+    'messages': gen_messages,
+    'payments': gen_payments,
+}
+
+
+def _init_worker():
+    # Cada proceso hijo abre su propia conexión
+    connections.close_all()
+
+
+def run_chunk(task):
+    table, index = task
+    model, columns, rows = GENERATORS[table](index)
+    return table, insert_rows(model, columns, rows, _CTX['use_copy'])
+
+
+class Command(BaseCommand):
+    help = ('Genera datos sintéticos a escala (millones de cuotas, pagos, logs y mensajes) para pruebas de carga. '
+            'Reproducible con --seed; en PostgreSQL usa COPY y admite --workers en paralelo.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Factor de escala: 1 = 1000 unidades, 120k cuotas, 200k filas por log/mensajes')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla del generador aleatorio')
+        parser.add_argument('--workers', type=int, default=1, help='Procesos en paralelo por tabla (sólo PostgreSQL)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Filas por lote de inserción')
+        parser.add_argument('--tables', default=','.join(ALL_TABLES),
+                            help=f'Tablas grandes a generar, separadas por coma ({", ".join(ALL_TABLES)})')
+        parser.add_argument('--prefix', default='lt', help='Prefijo de usuarios/unidades de esta carga')
+        parser.add_argument('--no-copy', action='store_true', help='Usar bulk_create también en PostgreSQL')
+
+    def handle(self, *args, **options):
+        tables = [t.strip() for t in options['tables'].split(',') if t.strip()]
+        unknown = set(tables) - set(ALL_TABLES)
+        if unknown:
+            raise CommandError(f"Tablas desconocidas: {', '.join(sorted(unknown))}")
+
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_user_').exists():
+            raise CommandError(f"Ya existen datos con el prefijo '{prefix}'. Usa otro --prefix o una base vacía.")
+
+        workers = options['workers']
+        if workers > 1 and connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(f'{connection.vendor} no admite escrituras concurrentes: usando 1 worker.'))
+            workers = 1
+
+        scale = options['scale']
+        counts = {table: max(1, int(base * scale)) for table, base in BASE_COUNTS.items()}
+        self.report = []
+        started = time.perf_counter()
+
+        self._build_context(options, counts, prefix)
+        for table in [t for t in PARALLEL_TABLES if t in tables]:
+            self._run_table(table, self._chunks_for(table), workers)
+        if 'payments' in tables:
+            self._run_table('payments', self._chunks_for('payments'), workers)
+        if 'messages' in tables:
+            self._finish_messages()
+
+        total_rows = sum(rows for table, rows, _ in self.report if table != 'search_index')
+        total_time = time.perf_counter() - started
+        self.stdout.write(f"\n{'tabla':<16}{'filas':>12}{'segundos':>10}{'filas/s':>12}")
+        for table, rows, seconds in self.report:
+            self.stdout.write(f"{table:<16}{rows:>12,}{seconds:>10.2f}{rows / seconds if seconds else 0:>12,.0f}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{'total':<16}{total_rows:>12,}{total_time:>10.2f}{total_rows / total_time if total_time else 0:>12,.0f}"
+        ))
+
+    def _timed(self, table, fn):
+        start = time.perf_counter()
+        rows = fn()
+        self.report.append((table, rows, time.perf_counter() - start))
+        return rows
+
+    def _build_context(self, options, counts, prefix):
+        rng = random.Random(f"{options['seed']}:base")
+        now = timezone.now().replace(microsecond=0)
+        current_period = now.replace(day=1, hour=0, minute=0, second=0)
+        periods = []
+        period = current_period
+        for _ in range(PERIODS):
+            periods.append(period)
+            period = (period - timedelta(days=1)).replace(day=1)
+        periods.reverse()
+
+        # Usuarios y perfiles: un solo hash de contraseña para todos
+        password_hash = make_password('password123')
+        users = self._timed('users', lambda: len(User.objects.bulk_create(
+            [User(username=f'{prefix}_user_{i}', email=f'{prefix}_user_{i}@load.local', password=password_hash)
+             for i in range(counts['users'])], batch_size=options['chunk_size'])))
+        user_ids = list(User.objects.filter(username__startswith=f'{prefix}_user_').order_by('id').values_list('id', flat=True))
+        roles = ['RESIDENT'] * 18 + ['STAFF', 'ADMIN']
+        self._timed('profiles', lambda: len(Profile.objects.bulk_create(
+            [Profile(user_id=uid, full_name=f'Residente {i}', role=rng.choice(roles)) for i, uid in enumerate(user_ids)],
+            batch_size=options['chunk_size'])))
+
+        self._timed('units', lambda: len(Unit.objects.bulk_create(
+            [Unit(code=f'{prefix.upper()}-{i:07d}', tower=f'T{i % 20 + 1}', number=str(i), owner_id=uid)
+             for i, uid in enumerate(user_ids)], batch_size=options['chunk_size'])))
+        unit_ids = list(Unit.objects.filter(code__startswith=f'{prefix.upper()}-').order_by('id').values_list('id', flat=True))
+
+        expense_types = []
+        for name, amount in EXPENSE_TYPES:
+            expense_type, _ = ExpenseType.objects.get_or_create(name=name, defaults={'amount_default': amount})
+            expense_types.append((expense_type.id, expense_type.amount_default))
+
+        # Conversaciones de 2 a 8 participantes
+        conversations = []
+
+        def create_conversations():
+            created = Conversation.objects.bulk_create([
+                Conversation(type='GROUP', name=f'{prefix} carga {i}', created_by_id=rng.choice(user_ids))
+                for i in range(counts['conversations'])
+            ])
+            through = Conversation.participants.through
+            links = []
+            for conversation in created:
+                participants = rng.sample(user_ids, min(len(user_ids), rng.randint(2, 8)))
+                conversations.append((conversation.id, participants))
+                links.extend(through(conversation_id=conversation.id, user_id=uid) for uid in participants)
+            through.objects.bulk_create(links, batch_size=options['chunk_size'])
+            return len(created)
+        self._timed('conversations', create_conversations)
+
+        units_per_chunk = max(1, options['chunk_size'] // (PERIODS * len(expense_types)))
+        _CTX.clear()
+        _CTX.update({
+            'seed': options['seed'],
+            'chunk_size': options['chunk_size'],
+            'counts': counts,
+            'now': now,
+            'periods': periods,
+            'current_period': current_period,
+            'user_ids': user_ids,
+            'unit_ids': unit_ids,
+            'unit_code_prefix': f'{prefix.upper()}-',
+            'tag': f'{prefix} (carga sintética)',
+            'units_per_chunk': units_per_chunk,
+            'expense_types': expense_types,
+            'conversations': conversations,
+            'use_copy': connection.vendor == 'postgresql' and not options['no_copy'],
+        })
+
+    def _chunks_for(self, table):
+        if table == 'fees':
+            per_chunk = _CTX['units_per_chunk']
+            return range((len(_CTX['unit_ids']) + per_chunk - 1) // per_chunk)
+        if table == 'payments':
+            bounds = Fee.objects.filter(unit__code__startswith=_CTX['unit_code_prefix']).aggregate(
+                low=Min('id'), high=Max('id')
+            )
+            if bounds['low'] is None:
+                return range(0)
+            _CTX['fee_min_id'] = bounds['low']
+            return range((bounds['high'] - bounds['low']) // _CTX['chunk_size'] + 1)
+        return range((_CTX['counts'][table] + _CTX['chunk_size'] - 1) // _CTX['chunk_size'])
+
+    def _run_table(self, table, chunks, workers):
+        tasks = [(table, index) for index in chunks]
+
+        def run():
+            if workers > 1:
+                connections.close_all()
+                with multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker) as pool:
+                    return sum(rows for _, rows in pool.imap_unordered(run_chunk, tasks))
+            return sum(run_chunk(task)[1] for task in tasks)
+
+        rows = self._timed(table, run)
+        self.stdout.write(f'  {table}: {rows:,} filas')
+
+    def _finish_messages(self):
+        """Preview de conversaciones e índice de búsqueda: bulk_create/COPY no disparan señales"""
+        low, high = _CTX['conversations'][0][0], _CTX['conversations'][-1][0]
+        latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at')
+        Conversation.objects.filter(id__gte=low, id__lte=high).update(
+            last_message_at=Subquery(latest.values('created_at')[:1]),
+            last_message_preview=Subquery(latest.values('text')[:1]),
+        )
+        self._timed('search_index', lambda: search.rebuild_index()['messages'] or 0)
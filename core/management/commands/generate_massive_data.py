@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from core.models import (
     Profile, Unit, ExpenseType, Fee, Notice, NoticeCategory,
@@ -139,6 +140,8 @@ class Command(BaseCommand):
         users = []
         profiles = []
         roles = ['RESIDENT', 'ADMIN', 'STAFF']  # STAFF incluye seguridad y mantenimiento
+        # Un solo hash para todos: set_password por usuario costaría un PBKDF2 completo cada vez
+        password_hash = make_password('password123')
         
         # Crear usuarios en lotes
         for i in range(count):
@@ -149,8 +152,8 @@ class Command(BaseCommand):
                     email=f'{username}@condominio.com',
                     first_name=fake.first_name(),
                     last_name=fake.last_name(),
+                    password=password_hash,
                 )
-                user.set_password('password123')
                 users.append(user)
         
         # Insertar usuarios en lote
@@ -0,0 +1,42 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import payment_import
+
+
+class Command(BaseCommand):
+    help = ('Importa pagos desde un CSV o extracto bancario (columnas unidad, periodo, monto y opcionalmente '
+            'tipo, metodo, referencia, fecha) y muestra el reporte de conciliación.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo CSV (separado por coma o punto y coma)')
+        parser.add_argument('--method', default='transfer', help='Método de pago si la fila no lo indica')
+        parser.add_argument('--dry-run', action='store_true', help='Concilia sin registrar los pagos')
+        parser.add_argument('--batch-size', type=int, default=payment_import.DEFAULT_BATCH)
+        parser.add_argument('--report', default='', help='Guarda las líneas no conciliadas y sobrepagos en este CSV')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as file:
+                report = payment_import.import_payments(
+                    file, method=options['method'], source=os.path.basename(options['path']),
+                    dry_run=options['dry_run'], batch_size=options['batch_size'],
+                )
+        except (OSError, payment_import.ImportFormatError) as exc:
+            raise CommandError(str(exc))
+
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{report['rows']} filas: {report['matched']} conciliadas, {report['payments_created']} pagos, "
+            f"{report['fees_paid']} cuotas saldadas. Aplicado {report['amount_applied']}, "
+            f"sin aplicar {report['amount_unapplied']}."
+        ))
+        if report['unmatched'] or report['overpaid']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(report['unmatched'])} filas sin conciliar, {len(report['overpaid'])} sobrepagos."
+            ))
+        if options['report']:
+            with open(options['report'], 'w', newline='', encoding='utf-8') as out:
+                payment_import.write_report(report, out)
+            self.stdout.write(f"Reporte de conciliación en {options['report']}")
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import log_partitions
+
+
+class Command(BaseCommand):
+    help = ('Retención de ActivityLog/AccessLog por mes: crea las particiones de los próximos meses y '
+            'archiva (detach), exporta o elimina los meses fuera de la ventana de LOG_RETENTION_MONTHS. '
+            'Pensado para ejecutarse a diario desde cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None,
+                            help='Meses a conservar, incluido el actual (por defecto LOG_RETENTION_MONTHS)')
+        parser.add_argument('--tables', default=','.join(log_partitions.LOG_MODELS),
+                            help='Tablas a procesar separadas por coma: activity, access')
+        parser.add_argument('--action', choices=['detach', 'export', 'drop'], default='detach',
+                            help='detach: desacopla la partición (o la mueve a <tabla>_archive); '
+                                 'export: la escribe comprimida en --output-dir y la elimina; drop: la elimina')
+        parser.add_argument('--format', choices=['csv.gz', 'parquet'], default='csv.gz',
+                            help='Formato de --action export (parquet requiere pyarrow)')
+        parser.add_argument('--output-dir', default=None, help='Destino de los exports (por defecto LOG_ARCHIVE_DIR)')
+        parser.add_argument('--months-ahead', type=int, default=None,
+                            help='Particiones a crear por adelantado (por defecto LOG_PARTITION_MONTHS_AHEAD)')
+        parser.add_argument('--dry-run', action='store_true', help='Sólo lista los meses que se procesarían')
+
+    def handle(self, *args, **options):
+        tables = [name.strip() for name in options['tables'].split(',') if name.strip()]
+        unknown = set(tables) - set(log_partitions.LOG_MODELS)
+        if unknown:
+            raise CommandError(f"Tablas desconocidas: {', '.join(sorted(unknown))}")
+        months = options['months'] or getattr(settings, 'LOG_RETENTION_MONTHS', 12)
+        if months < 1:
+            raise CommandError('--months debe ser al menos 1')
+        action = options['action']
+        if action == 'export' and options['format'] == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise CommandError('El formato parquet requiere pyarrow (pip install pyarrow)')
+        output_dir = options['output_dir'] or str(getattr(settings, 'LOG_ARCHIVE_DIR', 'log_archive'))
+        cutoff = log_partitions.retention_cutoff(months)
+        self.stdout.write(f"Conservando desde {cutoff:%Y-%m} ({months} meses), acción: {action}")
+
+        for key in tables:
+            model = log_partitions.LOG_MODELS[key]
+            table = model._meta.db_table
+            if options['dry_run']:
+                created = []
+            else:
+                created = log_partitions.ensure_partitions(model, options['months_ahead'])
+            for name in created:
+                self.stdout.write(f"  {table}: partición creada {name}")
+
+            expired = log_partitions.expired_partitions(model, months)
+            if not expired:
+                self.stdout.write(f"  {table}: nada que archivar")
+                continue
+            for partition in expired:
+                label = f"{table} {partition.month:%Y-%m}"
+                if options['dry_run']:
+                    self.stdout.write(f"  {label}: se aplicaría {action}")
+                    continue
+                if action == 'detach':
+                    target = log_partitions.detach_partition(model, partition)
+                    self.stdout.write(f"  {label}: archivado en {target}")
+                    continue
+                if action == 'export':
+                    path, rows = log_partitions.export_partition(model, partition, output_dir, options['format'])
+                    self.stdout.write(f"  {label}: {rows} filas exportadas a {path}")
+                deleted = log_partitions.drop_partition(model, partition)
+                suffix = f" ({deleted} filas)" if deleted is not None else ""
+                self.stdout.write(f"  {label}: eliminado{suffix}")
+
+        self.stdout.write(self.style.SUCCESS('Retención de logs completada.'))
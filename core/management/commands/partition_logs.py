@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.services import log_partitions
+
+
+class Command(BaseCommand):
+    help = ('Convierte ActivityLog/AccessLog en tablas particionadas por mes (sólo PostgreSQL). Reescribe la '
+            'tabla completa y cambia la PK a (id, timestamp): correrlo en una ventana de mantenimiento y '
+            'después de un backup. Sin --apply sólo muestra lo que haría.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tables', default=','.join(log_partitions.LOG_MODELS),
+                            help='Tablas a convertir separadas por coma: activity, access')
+        parser.add_argument('--months-ahead', type=int, default=3, help='Particiones futuras a crear')
+        parser.add_argument('--revert', action='store_true', help='Vuelve a tablas sin particionar')
+        parser.add_argument('--apply', action='store_true', help='Ejecuta la conversión')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('El particionado sólo está disponible en PostgreSQL; en este motor la '
+                               'retención usa <tabla>_archive sin convertir nada.')
+        tables = [name.strip() for name in options['tables'].split(',') if name.strip()]
+        unknown = set(tables) - set(log_partitions.LOG_MODELS)
+        if unknown:
+            raise CommandError(f"Tablas desconocidas: {', '.join(sorted(unknown))}")
+
+        for key in tables:
+            model = log_partitions.LOG_MODELS[key]
+            table = model._meta.db_table
+            partitioned = log_partitions.is_partitioned(model)
+            if partitioned != options['revert']:
+                self.stdout.write(f"  {table}: ya está {'particionada' if partitioned else 'sin particionar'}")
+                continue
+            rows = model.objects.count()
+            action = 'volver a tabla simple' if options['revert'] else 'particionar por mes'
+            if not options['apply']:
+                self.stdout.write(f"  {table}: se va a {action} ({rows} filas copiadas)")
+                continue
+            with connection.schema_editor(atomic=True) as schema_editor:
+                if options['revert']:
+                    log_partitions.unpartition_table(schema_editor, model)
+                else:
+                    log_partitions.partition_table(schema_editor, model, options['months_ahead'])
+            self.stdout.write(self.style.SUCCESS(f"  {table}: {action} listo ({rows} filas)"))
+
+        if not options['apply']:
+            self.stdout.write(self.style.WARNING('Nada cambió: agrega --apply para ejecutar.'))
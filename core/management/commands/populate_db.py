@@ -2,6 +2,7 @@ import random
 from datetime import date, timedelta
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.db import transaction
 from faker import Faker
 from core.models import Profile, Unit, Vehicle, Pet, CommonArea, ExpenseType, Notice, MaintenanceRequest, Fee, Payment
@@ -37,16 +38,21 @@ class Command(BaseCommand):
 
         # --- Crear 75 Residentes ---
         self.stdout.write('Step 2: Creating 75 residents...')
+        # Un solo hash compartido por todos los usuarios de prueba
+        password_hash = make_password('password123')
         residents = []
         for i in range(75):
             first_name, last_name = fake.first_name(), fake.last_name()
             username = f"{first_name.lower()}.{last_name.lower()}{i}"
-            user = User.objects.create_user(username=username, email=f"{username}@example.com", password='password123', first_name=first_name, last_name=last_name)
-            Profile.objects.create(user=user, role='RESIDENT', full_name=f"{first_name} {last_name}", phone=fake.phone_number())
-            residents.append(user)
+            residents.append(User(username=username, email=f"{username}@example.com", password=password_hash, first_name=first_name, last_name=last_name))
+        residents = User.objects.bulk_create(residents)
+        Profile.objects.bulk_create([
+            Profile(user=user, role='RESIDENT', full_name=f"{user.first_name} {user.last_name}", phone=fake.phone_number())
+            for user in residents
+        ])
         self.stdout.write(self.style.SUCCESS(f'   > Created {len(residents)} residents.'))
         
-        staff_user = User.objects.create_user(username='juan.perez', email='staff@condo.com', password='password123', first_name='Juan', last_name='Pérez')
+        staff_user = User.objects.create(username='juan.perez', email='staff@condo.com', password=password_hash, first_name='Juan', last_name='Pérez')
         Profile.objects.create(user=staff_user, role='STAFF', full_name='Juan Pérez', phone=fake.phone_number())
 
         # --- Crear Unidades ---
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.services import payment_webhooks
+
+
+class Command(BaseCommand):
+    help = ('Worker de webhooks de pago: aplica las notificaciones guardadas por el webhook de MercadoPago '
+            '(reintentos con backoff, descartadas a PaymentDeadLetter). Sin --once queda en ejecución.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Procesa lo pendiente y termina')
+        parser.add_argument('--batch', type=int, default=100, help='Eventos reclamados por lote')
+        parser.add_argument('--interval', type=float, default=2.0, help='Segundos de espera con la cola vacía')
+        parser.add_argument('--requeue-dead', action='store_true',
+                            help='Vuelve a encolar los eventos descartados antes de procesar')
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            self.stdout.write(f"{payment_webhooks.requeue_dead()} eventos descartados vueltos a encolar.")
+        try:
+            while True:
+                close_old_connections()
+                result = payment_webhooks.process_batch(options['batch'])
+                if result:
+                    self.stdout.write(', '.join(f"{key}: {count}" for key, count in sorted(result.items())))
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido.')
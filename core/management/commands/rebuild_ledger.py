@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.services import ledger
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los saldos por unidad y periodo (UnitPeriodBalance) desde las cuotas y pagos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--periods', default='', help='Periodos AAAA-MM separados por coma (por defecto todos)')
+
+    def handle(self, *args, **options):
+        periods = [p.strip() for p in options['periods'].split(',') if p.strip()]
+        written = ledger.rebuild(periods or None)
+        self.stdout.write(self.style.SUCCESS(f"Libro de saldos reconstruido: {written} filas."))
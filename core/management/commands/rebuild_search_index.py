@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.services import search
+
+
+class Command(BaseCommand):
+    help = 'Repuebla el índice de búsqueda FTS5 (SQLite) de mensajes y avisos, p. ej. tras cargas con bulk_create.'
+
+    def handle(self, *args, **options):
+        result = search.rebuild_index()
+        if result['backend'] != 'fts5':
+            self.stdout.write(f"Backend '{result['backend']}': el índice no requiere reconstrucción.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice FTS5 reconstruido: {result['messages']} mensajes, {result['notices']} avisos."
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import security_rollups
+
+
+class Command(BaseCommand):
+    help = ('Actualiza los rollups diarios de incidentes, accesos y visitantes que usa el reporte de seguridad. '
+            'Sólo recalcula los días con filas nuevas desde la última ejecución; --rebuild los recalcula todos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Borra y recalcula todos los días')
+        parser.add_argument('--sources', default=','.join(security_rollups.SOURCES),
+                            help=f'Fuentes separadas por coma ({", ".join(security_rollups.SOURCES)})')
+
+    def handle(self, *args, **options):
+        sources = [name.strip() for name in options['sources'].split(',') if name.strip()]
+        unknown = set(sources) - set(security_rollups.SOURCES)
+        if unknown:
+            raise CommandError(f"Fuentes desconocidas: {', '.join(sorted(unknown))}")
+
+        result = security_rollups.refresh(rebuild=options['rebuild'], sources=sources)
+        for name, days in result.items():
+            self.stdout.write(f"  {name}: {days} días recalculados")
+        self.stdout.write(self.style.SUCCESS('Rollups de seguridad actualizados.'))
@@ -1,17 +1,74 @@
 # core/middleware.py
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.utils.deprecation import MiddlewareMixin
-from .models import ActivityLog
+from contextlib import ExitStack
+from .services import metrics, sql_profiling
+from .services.audit import record_activity
 import json
+import logging
+import random
+import time
 
+logger = logging.getLogger(__name__)
 
-def get_client_ip(request):
-    """Obtiene la IP real del cliente"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+
+class MetricsMiddleware:
+    """
+    Latencia y conteo de peticiones HTTP por nombre de ruta para /metrics (METRICS_ENABLED).
+    Se etiqueta con el nombre de la URL resuelta, no con el path, para no crear una serie por id.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        route = (match.view_name or match.route) if match else 'sin-ruta'
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, route=route, method=request.method)
+        metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        return response
+
+
+class SQLProfilingMiddleware:
+    """
+    Perfilado SQL opcional (SQL_PROFILING_ENABLED): cuenta consultas, tiempo SQL y SQL repetido por
+    petición, lo agrega por nombre de ruta en sql_profiling.profile y añade la cabecera Server-Timing.
+    Desactivado, Django lo descarta al arrancar y no cuesta nada.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SQL_PROFILING_SAMPLE_RATE', 1.0)
+        self.server_timing = getattr(settings, 'SQL_PROFILING_SERVER_TIMING', True)
+
+    def __call__(self, request):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        collector = sql_profiling.QueryCollector()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        route = (match.view_name or match.route) if match else 'sin-ruta'
+        duplicates = collector.duplicates()
+        sql_profiling.profile.record(route, collector.count, collector.duration * 1000, duplicates)
+        if self.server_timing:
+            extra = sum(times - 1 for times in duplicates.values())
+            response['Server-Timing'] = sql_profiling.server_timing(collector, total_ms, extra)
+        return response
 
 
 class ActivityLogMiddleware(MiddlewareMixin):
@@ -50,6 +107,10 @@ class ActivityLogMiddleware(MiddlewareMixin):
         if not hasattr(request, 'user') or not request.user.is_authenticated:
             return response
         
+        # La vista ya registró esta acción (p. ej. login/logout): no duplicarla
+        if getattr(request, 'activity_logged', False):
+            return response
+        
         # No registrar rutas excluidas
         path = request.path
         if any(excluded in path for excluded in self.EXCLUDED_PATHS):
@@ -71,21 +132,11 @@ class ActivityLogMiddleware(MiddlewareMixin):
                 # Obtener descripción legible
                 description = self._get_description(request, action)
                 
-                # Crear el log
-                ActivityLog.objects.create(
-                    user=request.user,
-                    action=action,
-                    description=description,
-                    ip_address=get_client_ip(request),
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')[:500],
-                    path=path,
-                    method=request.method,
-                    session_key=request.session.session_key if hasattr(request, 'session') else '',
-                    details=self._get_details(request)
-                )
-        except Exception as e:
+                # Crear el log (fuera del hilo de la petición)
+                record_activity(request, request.user, action, description, self._get_details(request))
+        except Exception:
             # No queremos que un error en el logging rompa la aplicación
-            print(f"Error logging activity: {e}")
+            logger.exception("Error logging activity for %s %s", request.method, request.path)
         
         return response
     
@@ -151,7 +202,7 @@ class ActivityLogMiddleware(MiddlewareMixin):
         return f'{method} {path}'
     
     def _get_details(self, request):
-        """Obtiene detalles adicionales de la petición"""
+        """Obtiene detalles adicionales de la petición (sin archivos subidos ni valores no serializables)"""
         details = {}
         
         # Agregar parámetros de query
@@ -160,15 +211,22 @@ class ActivityLogMiddleware(MiddlewareMixin):
         
         # Agregar algunos datos del body (sin contraseñas)
         if request.method in ['POST', 'PUT', 'PATCH']:
-            try:
-                if hasattr(request, 'data'):
-                    body = dict(request.data)
-                    # Remover campos sensibles
-                    sensitive_fields = ['password', 'token', 'secret', 'key']
-                    for field in sensitive_fields:
-                        body.pop(field, None)
-                    details['body'] = body
-            except:
-                pass
+            data = getattr(request, 'data', None)
+            if data is None and hasattr(request, '_post'):
+                data = request.POST  # formulario ya leído por la vista: no se vuelve a leer el cuerpo
+            # Los archivos (adjuntos, fotos) no van al log: se omiten sus campos
+            files = request.FILES if hasattr(request, '_files') else {}
+            sensitive_fields = ['password', 'token', 'secret', 'key']
+            body = {}
+            for field, value in (dict(data) if isinstance(data, dict) else {}).items():
+                if field in files or field in sensitive_fields:
+                    continue
+                try:
+                    json.dumps(value)
+                except (TypeError, ValueError):
+                    continue
+                body[field] = value
+            if body:
+                details['body'] = body
         
         return json.dumps(details) if details else ''
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def collapse_read_statuses(apps, schema_editor):
+    """Convierte las filas por mensaje de MessageReadStatus en una marca de agua por (conversación, usuario)"""
+    MessageReadStatus = apps.get_model('core', 'MessageReadStatus')
+    ConversationReadState = apps.get_model('core', 'ConversationReadState')
+
+    rows = (
+        MessageReadStatus.objects
+        .values('message__conversation_id', 'user_id')
+        .annotate(last_id=Max('message_id'), last_at=Max('read_at'))
+        .order_by()
+    )
+    ConversationReadState.objects.bulk_create(
+        (
+            ConversationReadState(
+                conversation_id=row['message__conversation_id'],
+                user_id=row['user_id'],
+                last_read_message_id=row['last_id'],
+                last_read_at=row['last_at'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_conversation_message_messagereadstatus_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.BigIntegerField(default=0)),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='core_messag_convers_5c17c7_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='core.conversation'),
+        ),
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_read_states', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversationreadstate',
+            unique_together={('conversation', 'user')},
+        ),
+        migrations.RunPython(collapse_read_statuses, migrations.RunPython.noop),
+    ]
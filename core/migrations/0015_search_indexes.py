@@ -0,0 +1,67 @@
+import logging
+
+from django.db import OperationalError, migrations
+
+logger = logging.getLogger(__name__)
+
+PG_CONFIG = 'spanish'
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    PostgreSQL: índices GIN de expresión (to_tsvector) que mantiene el propio motor.
+    SQLite: tablas FTS5 espejo, pobladas aquí y sincronizadas después por core.signals.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS core_message_text_fts ON core_message "
+            f"USING gin (to_tsvector('{PG_CONFIG}', text))"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS core_notice_fts ON core_notice USING gin ("
+            f"(setweight(to_tsvector('{PG_CONFIG}', title), 'A') || "
+            f"setweight(to_tsvector('{PG_CONFIG}', body), 'B')))"
+        )
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS core_message_fts USING fts5("
+                "text, conversation_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS core_notice_fts USING fts5("
+                "title, body, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except OperationalError as e:
+            # SQLite compilado sin FTS5: la búsqueda cae a icontains
+            logger.warning("FTS5 no disponible, la búsqueda usará icontains: %s", e)
+            return
+        schema_editor.execute(
+            "INSERT INTO core_message_fts (rowid, text, conversation_id) "
+            "SELECT id, text, conversation_id FROM core_message WHERE is_deleted = 0 AND text <> ''"
+        )
+        schema_editor.execute(
+            "INSERT INTO core_notice_fts (rowid, title, body) SELECT id, title, body FROM core_notice"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS core_message_text_fts")
+        schema_editor.execute("DROP INDEX IF EXISTS core_notice_fts")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS core_message_fts")
+        schema_editor.execute("DROP TABLE IF EXISTS core_notice_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_conversationreadstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
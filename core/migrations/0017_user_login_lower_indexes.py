@@ -0,0 +1,36 @@
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+LOGIN_INDEXES = [
+    ('username', 'auth_user_username_lower_idx'),
+    ('email', 'auth_user_email_lower_idx'),
+]
+
+
+def _indexes():
+    return [models.Index(Lower(field), name=name) for field, name in LOGIN_INDEXES]
+
+
+def create_login_indexes(apps, schema_editor):
+    """Índices funcionales lower(username)/lower(email) para el login (core.backends)"""
+    User = apps.get_model('auth', 'User')
+    for index in _indexes():
+        schema_editor.add_index(User, index)
+
+
+def drop_login_indexes(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    for index in _indexes():
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0016_claims_proxies'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_login_indexes, drop_login_indexes),
+    ]
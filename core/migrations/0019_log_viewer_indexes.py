@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_user_login_lower_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='activitylog',
+            name='core_activi_action_b2beff_idx',
+        ),
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['-timestamp'], name='core_access_timesta_e68eb1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['access_type', '-timestamp'], name='core_access_access__1c6e32_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['was_granted', '-timestamp'], name='core_access_was_gra_9dc23c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['user', '-timestamp'], name='core_access_user_id_2f361f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['action', '-timestamp'], name='core_activi_action_1fc1d1_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_log_viewer_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyAccessStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('access_type', models.CharField(max_length=20)),
+                ('was_granted', models.BooleanField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('day', 'access_type', 'was_granted')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyIncidentStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('incident_type', models.CharField(max_length=30)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('ai_detections', models.PositiveIntegerField(default=0)),
+                ('resolved', models.PositiveIntegerField(default=0)),
+                ('response_seconds', models.FloatField(default=0.0)),
+            ],
+            options={
+                'unique_together': {('day', 'incident_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyVisitorStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('unit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.unit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'unit'], name='core_dailyv_day_5af26c_idx')],
+            },
+        ),
+    ]
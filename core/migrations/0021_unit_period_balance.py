@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:07
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_balances(apps, schema_editor):
+    """Saldos iniciales desde las cuotas y pagos existentes (igual que core.services.ledger.rebuild)"""
+    Fee = apps.get_model('core', 'Fee')
+    Payment = apps.get_model('core', 'Payment')
+    UnitPeriodBalance = apps.get_model('core', 'UnitPeriodBalance')
+    zero = Decimal('0.00')
+    for period in Fee.objects.values_list('period', flat=True).distinct().order_by('period'):
+        paid = dict(
+            Payment.objects.filter(fee__period=period).values_list('fee_id').annotate(total=Sum('amount')).order_by()
+        )
+        balances = []
+        for fee_id, unit_id, expense_type_id, amount, status in Fee.objects.filter(period=period).values_list(
+                'id', 'unit_id', 'expense_type_id', 'amount', 'status'):
+            total_paid = paid.get(fee_id) or zero
+            outstanding = max(amount - total_paid, zero)
+            balances.append(UnitPeriodBalance(
+                unit_id=unit_id, expense_type_id=expense_type_id, period=period, issued=amount, paid=total_paid,
+                outstanding=outstanding, overdue=outstanding if status == 'OVERDUE' else zero,
+            ))
+        UnitPeriodBalance.objects.bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_security_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitPeriodBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=7)),
+                ('issued', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('overdue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('expense_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.expensetype')),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='core.unit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period'], name='core_unitpe_period_030d5a_idx')],
+                'unique_together': {('unit', 'expense_type', 'period')},
+            },
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_unit_period_balance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fee',
+            index=models.Index(fields=['issued_at'], name='core_fee_issued__531420_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fee',
+            index=models.Index(fields=['status', 'period'], name='core_fee_status_363539_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['paid_at'], name='core_paymen_paid_at_b57af1_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_payment_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+            ],
+            options={
+                'unique_together': {('source', 'day')},
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.db import models
 from django.utils import timezone
 
@@ -18,6 +19,36 @@ class Profile(models.Model):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default="RESIDENT")
     def __str__(self): return f"{self.full_name or self.user.username} ({self.role})"
 
+class ClaimsUser(get_user_model()):
+    """
+    Usuario construido desde los claims del JWT (core.authentication) sin consultar la BD.
+    Los campos que no vienen en el token quedan diferidos y se completan juntos, desde la
+    caché del proceso, la primera vez que se accede a alguno.
+    """
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        if fields is None or from_queryset is not None:
+            return super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        from .authentication import get_full_user
+        full = get_full_user(self.pk)
+        for name in self.get_deferred_fields():
+            setattr(self, name, getattr(full, name))
+
+class ClaimsProfile(Profile):
+    """Perfil con `role` y `full_name` desde los claims; el resto se carga como en ClaimsUser"""
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        if fields is None or from_queryset is not None:
+            return super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        from .authentication import get_full_user
+        full = get_full_user(self.user_id).profile
+        for name in self.get_deferred_fields():
+            setattr(self, name, getattr(full, name))
+
 class Unit(models.Model):
     code = models.CharField(max_length=30, unique=True)
     tower = models.CharField(max_length=30)
@@ -42,6 +73,7 @@ class Fee(models.Model):
     due_date = models.DateField(null=True, blank=True)
     class Meta:
         unique_together = ("unit", "expense_type", "period")
+        indexes = [models.Index(fields=["issued_at"]), models.Index(fields=["status", "period"])]
     def __str__(self): return f"{self.unit} {self.period} {self.expense_type}"
 
 class Payment(models.Model):
@@ -50,6 +82,58 @@ class Payment(models.Model):
     paid_at = models.DateTimeField(auto_now_add=True)
     method = models.CharField(max_length=30, default="cash")
     note = models.TextField(blank=True)
+    external_id = models.CharField(max_length=64, null=True, blank=True, unique=True)  # id del pago en el proveedor
+    class Meta:
+        indexes = [models.Index(fields=["paid_at"])]
+
+class UnitPeriodBalance(models.Model):
+    """
+    Saldo de una unidad por periodo y tipo de expensa (core.services.ledger): lo emitido, lo cobrado
+    según los pagos registrados, lo pendiente y la parte pendiente de cuotas vencidas.
+    """
+    unit = models.ForeignKey(Unit, on_delete=models.CASCADE, related_name="balances")
+    expense_type = models.ForeignKey(ExpenseType, on_delete=models.CASCADE, related_name="+")
+    period = models.CharField(max_length=7)
+    issued = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overdue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        unique_together = ("unit", "expense_type", "period")
+        indexes = [models.Index(fields=["period"])]
+    def __str__(self): return f"{self.unit} {self.period} {self.expense_type}: {self.outstanding}"
+
+class PaymentEvent(models.Model):
+    """
+    Notificación (webhook) del proveedor de pagos tal como llegó, pendiente de aplicar por
+    core.services.payment_webhooks. idempotency_key evita guardar dos veces la misma notificación.
+    """
+    STATUS = [("PENDING", "Pendiente"), ("PROCESSING", "En proceso"), ("DONE", "Aplicado"),
+              ("IGNORED", "Ignorado"), ("DEAD", "Descartado")]
+    provider = models.CharField(max_length=20, default="mercadopago")
+    idempotency_key = models.CharField(max_length=128, unique=True)
+    topic = models.CharField(max_length=40, blank=True)  # payment, merchant_order, ...
+    action = models.CharField(max_length=40, blank=True)  # payment.created, payment.updated, ...
+    resource_id = models.CharField(max_length=64, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)  # en PROCESSING: vencimiento del bloqueo
+    last_error = models.TextField(blank=True)
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"]), models.Index(fields=["provider", "resource_id"])]
+    def __str__(self): return f"{self.provider} {self.topic} {self.resource_id} ({self.status})"
+
+class PaymentDeadLetter(models.Model):
+    """Notificación que agotó sus reintentos o no se puede aplicar; se revisa a mano o se reencola"""
+    event = models.OneToOneField(PaymentEvent, on_delete=models.CASCADE, related_name="dead_letter")
+    reason = models.TextField()
+    failed_at = models.DateTimeField(auto_now_add=True)
+    def __str__(self): return f"{self.event} - {self.reason[:60]}"
 
 class NoticeCategory(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -138,7 +222,7 @@ class ActivityLog(models.Model):
         indexes = [
             models.Index(fields=['-timestamp']),
             models.Index(fields=['user', '-timestamp']),
-            models.Index(fields=['action']),
+            models.Index(fields=['action', '-timestamp']),
         ]
     
     def __str__(self): 
@@ -284,6 +368,13 @@ class AccessLog(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        # Uno por combinación de filtros del visor (core.filters), todos terminados en timestamp para el cursor
+        indexes = [
+            models.Index(fields=['-timestamp']),
+            models.Index(fields=['access_type', '-timestamp']),
+            models.Index(fields=['was_granted', '-timestamp']),
+            models.Index(fields=['user', '-timestamp']),
+        ]
     
     def __str__(self):
         person = self.user.username if self.user else (self.visitor.full_name if self.visitor else "Desconocido")
@@ -330,17 +421,19 @@ class Conversation(models.Model):
             return self.participants.exclude(id=current_user.id).first()
         return None
     
+    @staticmethod
+    def preview_for(message):
+        """Texto de preview para un mensaje"""
+        if message.type == 'IMAGE':
+            return "📷 Imagen"
+        if message.type == 'FILE':
+            return f"📎 {message.attachment_name}"
+        return message.text[:200]
+    
     def update_last_message(self, message):
         """Actualiza el preview del último mensaje"""
         self.last_message_at = message.created_at
-        if message.type == 'TEXT':
-            self.last_message_preview = message.text[:200]
-        elif message.type == 'IMAGE':
-            self.last_message_preview = "📷 Imagen"
-        elif message.type == 'FILE':
-            self.last_message_preview = f"📎 {message.attachment_name}"
-        else:
-            self.last_message_preview = message.text[:200]
+        self.last_message_preview = self.preview_for(message)
         self.save(update_fields=['last_message_at', 'last_message_preview'])
 
 
@@ -375,6 +468,7 @@ class Message(models.Model):
         ordering = ['created_at']
         indexes = [
             models.Index(fields=['conversation', 'created_at']),
+            models.Index(fields=['conversation', 'id']),
             models.Index(fields=['sender']),
         ]
     
@@ -382,11 +476,20 @@ class Message(models.Model):
         return f"Mensaje de {self.sender.username} en {self.conversation}"
     
     def mark_as_read_by(self, user):
-        """Marca el mensaje como leído por un usuario"""
+        """
+        Marca el mensaje como leído por un usuario. Como en el resto del chat, leer un mensaje implica
+        haber leído los anteriores: además del recibo de MessageReadStatus, la marca de agua de la
+        conversación avanza hasta este mensaje (nunca retrocede) y los anteriores cuentan como leídos.
+        """
         MessageReadStatus.objects.get_or_create(message=self, user=user)
+        ConversationReadState.advance(self.conversation_id, user, self.id)
     
     def is_read_by(self, user):
-        """Verifica si el mensaje fue leído por un usuario"""
+        """Verifica si el mensaje fue leído por un usuario (por marca de agua o por recibo propio)"""
+        if ConversationReadState.objects.filter(
+            conversation_id=self.conversation_id, user=user, last_read_message_id__gte=self.id
+        ).exists():
+            return True
         return MessageReadStatus.objects.filter(message=self, user=user).exists()
     
     def get_read_by_users(self):
@@ -409,3 +512,89 @@ class MessageReadStatus(models.Model):
     
     def __str__(self):
         return f"{self.user.username} leyó mensaje #{self.message.id}"
+
+
+class ConversationReadState(models.Model):
+    """Marca de agua de lectura por (conversación, participante): todo mensaje con id <= last_read_message_id está leído"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_read_states')
+    last_read_message_id = models.BigIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ('conversation', 'user')
+    
+    def __str__(self):
+        return f"{self.user} leyó hasta #{self.last_read_message_id} en {self.conversation}"
+    
+    @classmethod
+    def advance(cls, conversation_id, user, message_id, read_at=None):
+        """Avanza la marca de agua (nunca retrocede). Devuelve True si se movió."""
+        read_at = read_at or timezone.now()
+        state, created = cls.objects.get_or_create(
+            conversation_id=conversation_id,
+            user=user,
+            defaults={'last_read_message_id': message_id, 'last_read_at': read_at},
+        )
+        if created:
+            return True
+        return cls.objects.filter(
+            pk=state.pk, last_read_message_id__lt=message_id
+        ).update(last_read_message_id=message_id, last_read_at=read_at) > 0
+
+
+# --- Rollups diarios de seguridad (core.services.security_rollups) ---
+
+class RollupWatermark(models.Model):
+    """Hasta dónde se procesó cada tabla origen: último id visto y momento del último refresco"""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.name} hasta #{self.last_id}"
+
+
+class RollupDirtyDay(models.Model):
+    """Día de un rollup a recalcular porque se editó o borró una fila ya agregada (ver core.signals)"""
+    source = models.CharField(max_length=50)
+    day = models.DateField()
+    
+    class Meta:
+        unique_together = ('source', 'day')
+
+
+class DailyIncidentStat(models.Model):
+    """Incidentes por día de detección y tipo; la respuesta se acumula para promediarla sobre cualquier rango"""
+    day = models.DateField()
+    incident_type = models.CharField(max_length=30)
+    count = models.PositiveIntegerField(default=0)
+    ai_detections = models.PositiveIntegerField(default=0)
+    resolved = models.PositiveIntegerField(default=0)
+    response_seconds = models.FloatField(default=0.0)  # suma de (resolved_at - detected_at) de los resueltos
+    
+    class Meta:
+        unique_together = ('day', 'incident_type')
+
+
+class DailyAccessStat(models.Model):
+    """Accesos por día, tipo y resultado (concedido/denegado)"""
+    day = models.DateField()
+    access_type = models.CharField(max_length=20)
+    was_granted = models.BooleanField()
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('day', 'access_type', 'was_granted')
+
+
+class DailyVisitorStat(models.Model):
+    """Visitantes por día de entrada y unidad visitada"""
+    day = models.DateField()
+    unit = models.ForeignKey(Unit, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'unit']),
+        ]
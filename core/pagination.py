@@ -0,0 +1,169 @@
+# core/pagination.py
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Paginación por keyset sobre (created_at, id), sin OFFSET.
+
+    - Sin parámetros: la página más reciente.
+    - `?before=<cursor>`: mensajes anteriores al cursor (historial hacia atrás).
+    - `?since=<cursor>`: mensajes posteriores al cursor (sincronización incremental).
+
+    El cursor puede ser el token opaco devuelto en `next`/`previous`/`sync_cursor`
+    o directamente el id de un mensaje (lo que conoce un cliente WebSocket al reconectar).
+    Los resultados siempre se devuelven en orden ascendente.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    since_query_param = 'since'
+    before_query_param = 'before'
+    timestamp_field = 'created_at'
+    missing_cursor_message = "Cursor inválido: el mensaje no existe en esta conversación."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        ts = self.timestamp_field
+
+        since = request.query_params.get(self.since_query_param)
+        before = request.query_params.get(self.before_query_param)
+        if since and before:
+            raise ValidationError(f"Usa '{self.since_query_param}' o '{self.before_query_param}', no ambos.")
+
+        if since:
+            position = self.decode_cursor(since, queryset)
+            queryset = queryset.filter(
+                Q(**{f'{ts}__gt': position[0]}) | Q(**{ts: position[0], 'id__gt': position[1]})
+            ).order_by(ts, 'id')
+            rows = list(queryset[:page_size + 1])
+            self.has_newer = len(rows) > page_size
+            self.has_older = True
+            self.page = rows[:page_size]
+        else:
+            if before:
+                position = self.decode_cursor(before, queryset)
+                queryset = queryset.filter(
+                    Q(**{f'{ts}__lt': position[0]}) | Q(**{ts: position[0], 'id__lt': position[1]})
+                )
+            rows = list(queryset.order_by(f'-{ts}', '-id')[:page_size + 1])
+            self.has_older = len(rows) > page_size
+            self.has_newer = bool(before)
+            self.page = list(reversed(rows[:page_size]))
+
+        self.sync_cursor = self.encode_cursor(self.page[-1]) if self.page else (since or None)
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'sync_cursor': self.sync_cursor,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'sync_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.page or not self.has_newer:
+            return None
+        url = remove_query_param(self.base_url, self.before_query_param)
+        return replace_query_param(url, self.since_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.page or not self.has_older:
+            return None
+        url = remove_query_param(self.base_url, self.since_query_param)
+        return replace_query_param(url, self.before_query_param, self.encode_cursor(self.page[0]))
+
+    # --- Codificación del cursor ---
+    def encode_cursor(self, obj):
+        raw = f"{getattr(obj, self.timestamp_field).isoformat()}|{obj.id}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, value, queryset):
+        if value.isdigit():
+            # Id de mensaje: resolver su posición con una búsqueda por PK
+            timestamp = queryset.filter(pk=int(value)).values_list(self.timestamp_field, flat=True).first()
+            if timestamp is None:
+                raise ValidationError(self.missing_cursor_message)
+            return timestamp, int(value)
+        try:
+            raw = base64.urlsafe_b64decode(value.encode('ascii')).decode('utf-8')
+            timestamp, pk = raw.rsplit('|', 1)
+            return datetime.fromisoformat(timestamp), int(pk)
+        except (ValueError, UnicodeError):
+            raise ValidationError("Cursor inválido.")
+
+
+class LogCursorPagination(KeysetCursorPagination):
+    """
+    Keyset sobre (timestamp, id) para los visores de ActivityLog/AccessLog, del más reciente al más antiguo.
+
+    - Sin parámetros: los registros más recientes.
+    - `next` (`?before=<cursor>`): la página siguiente, más antigua.
+    - `?since=<cursor>`: sólo lo posterior al cursor, para refrescar el visor sin recargarlo.
+
+    Nunca cuenta filas ni usa OFFSET: cada página es un rango del índice sobre timestamp.
+    """
+    page_size = 50
+    max_page_size = 500
+    timestamp_field = 'timestamp'
+    missing_cursor_message = "Cursor inválido: el registro no existe."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        super().paginate_queryset(queryset, request, view)
+        self.page.reverse()
+        self.sync_cursor = self.encode_cursor(self.page[0]) if self.page else self.sync_cursor
+        return self.page
+
+    def get_next_link(self):
+        if not self.page or not self.has_older:
+            return None
+        url = remove_query_param(self.base_url, self.since_query_param)
+        return replace_query_param(url, self.before_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.page or not self.has_newer:
+            return None
+        url = remove_query_param(self.base_url, self.before_query_param)
+        return replace_query_param(url, self.since_query_param, self.encode_cursor(self.page[0]))
+
+
+class LogPaginationMixin:
+    """Cursor para los visores de logs; `?page=` sigue usando PageNumberPagination para clientes antiguos."""
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if 'page' in self.request.query_params:
+                self._paginator = PageNumberPagination()
+            else:
+                self._paginator = LogCursorPagination()
+        return self._paginator
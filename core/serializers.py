@@ -1,4 +1,5 @@
 # condominio_backend/core/serializers.py
+from decimal import Decimal
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from django.utils import timezone
@@ -9,7 +10,7 @@ from .models import (
     Profile, Unit, ExpenseType, Fee, Payment, Notice,
     CommonArea, Reservation, MaintenanceRequest, ActivityLog, MaintenanceRequestComment,
     Vehicle, Pet, FamilyMember, NoticeCategory, Notification, MaintenanceRequestAttachment,
-    FaceEncoding, Visitor, SecurityIncident, AccessLog, Conversation, Message, MessageReadStatus
+    FaceEncoding, Visitor, SecurityIncident, AccessLog, Conversation, Message, ConversationReadState
 )
 User = get_user_model()
 
@@ -115,6 +116,9 @@ class FeeSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "status", "issued_at"]
 
     def get_total_paid(self, obj):
+        # Con los pagos precargados (listados y detalle de unidad) se suma en memoria, sin una consulta por cuota
+        if 'payments' in getattr(obj, '_prefetched_objects_cache', {}):
+            return sum((payment.amount for payment in obj.payments.all()), Decimal('0')) or 0
         return obj.payments.aggregate(total=Sum('amount'))['total'] or 0
 
 class MaintenanceRequestCommentSerializer(serializers.ModelSerializer):
@@ -324,8 +328,10 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ['id', 'conversation', 'sender', 'type', 'text', 
-                  'attachment', 'created_at', 'edited_at', 'is_deleted']
-        read_only_fields = ['sender', 'created_at', 'edited_at']
+                  'attachment', 'attachment_thumbnail', 'attachment_name', 'attachment_size',
+                  'created_at', 'edited_at', 'is_deleted']
+        read_only_fields = ['sender', 'created_at', 'edited_at',
+                            'attachment_thumbnail', 'attachment_name', 'attachment_size']
 
 class ConversationSerializer(serializers.ModelSerializer):
     participants = UserLiteSerializer(many=True, read_only=True)
@@ -346,23 +352,27 @@ class ConversationSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'last_message_at']
     
     def get_last_message_preview(self, obj):
-        last_msg = obj.messages.order_by('-created_at').first()
-        return last_msg.text[:50] if last_msg else None
+        # Campo desnormalizado por Conversation.update_last_message
+        return obj.last_message_preview[:50] if obj.last_message_preview else None
     
     def get_unread_count(self, obj):
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return 0
         
-        # Contar mensajes no leídos por el usuario actual
-        from .models import MessageReadStatus
-        read_message_ids = MessageReadStatus.objects.filter(
-            user=request.user,
-            message__conversation=obj
-        ).values_list('message_id', flat=True)
+        # Calculado en bloque por ConversationViewSet (annotate_unread_counts)
+        annotated = getattr(obj, 'unread_count_annotated', None)
+        if annotated is not None:
+            return annotated
         
-        return obj.messages.exclude(
-            id__in=read_message_ids
+        # Mensajes de otros posteriores a la marca de agua de lectura del usuario
+        watermark = ConversationReadState.objects.filter(
+            conversation=obj,
+            user=request.user
+        ).values_list('last_read_message_id', flat=True).first() or 0
+        
+        return obj.messages.filter(
+            id__gt=watermark
         ).exclude(
             sender=request.user
         ).count()
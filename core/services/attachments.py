@@ -0,0 +1,140 @@
+from __future__ import annotations
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload, TemporaryFileUploadHandler
+from django.db import close_old_connections, transaction
+from core.models import Conversation, Message
+from core.services import metrics
+from core.services.chat import broadcast_to_conversation, message_payload
+from core.services.frames import encode_frame
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+# Margen para las cabeceras multipart al comparar Content-Length con MAX_UPLOAD_SIZE
+MULTIPART_OVERHEAD = 64 * 1024
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "CHAT_THUMBNAIL_WORKERS", 2),
+    thread_name_prefix="chat-thumbnails",
+)
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """
+    Corta la subida en cuanto un archivo supera MAX_UPLOAD_SIZE, mientras llega,
+    sin esperar a tenerlo completo. Debe ir antes de TemporaryFileUploadHandler.
+    """
+
+    def __init__(self, request=None, max_size: int | None = None):
+        super().__init__(request)
+        self.max_size = max_size or settings.MAX_UPLOAD_SIZE
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.exceeded = True
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def install_upload_handlers(request) -> MaxSizeUploadHandler:
+    """
+    Sustituye los handlers por defecto para que el archivo se escriba a disco por trozos
+    (nunca entero en memoria) y se valide el tamaño al vuelo. Llamar antes de leer request.data.
+    """
+    django_request = getattr(request, "_request", request)
+    limiter = MaxSizeUploadHandler(django_request)
+    django_request.upload_handlers = [limiter, TemporaryFileUploadHandler(django_request)]
+    return limiter
+
+
+def content_length_exceeds_limit(request) -> bool:
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return False
+    return content_length > settings.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+
+
+@transaction.atomic
+def create_attachment_message(conversation: Conversation, user, uploaded_file, text: str = "") -> Message:
+    """
+    Guarda el adjunto en el storage (el archivo temporal se mueve/copia por trozos), crea el
+    mensaje y programa, tras el commit, el broadcast inmediato y la miniatura en segundo plano.
+    """
+    content_type = getattr(uploaded_file, "content_type", "") or ""
+    message = Message(
+        conversation=conversation,
+        sender=user,
+        type="IMAGE" if content_type.startswith("image/") else "FILE",
+        text=text,
+        attachment_name=os.path.basename(uploaded_file.name)[:255],
+        attachment_size=uploaded_file.size,
+    )
+    message.attachment.save(message.attachment_name, uploaded_file, save=False)
+    message.save()
+    conversation.update_last_message(message)
+    metrics.CHAT_MESSAGES.inc(source="attachment")
+
+    payload = message_payload(message, sender_payload_for(user))
+    transaction.on_commit(lambda: broadcast_to_conversation(conversation.id, {
+        "type": "message_new",
+        "frame": encode_frame("message.new", payload),
+    }))
+    if message.type == "IMAGE":
+        transaction.on_commit(lambda: _executor.submit(generate_thumbnail, message.id))
+    return message
+
+
+def sender_payload_for(user) -> dict:
+    profile = getattr(user, "profile", None)
+    return {
+        "id": user.id,
+        "username": user.username,
+        "full_name": profile.full_name if profile is not None else user.username,
+    }
+
+
+def generate_thumbnail(message_id: int) -> str | None:
+    """Trabajo en segundo plano: genera la miniatura con Pillow y la anuncia con message.thumbnail."""
+    from PIL import Image
+
+    close_old_connections()
+    try:
+        message = Message.objects.only("id", "conversation_id", "attachment", "attachment_name").get(pk=message_id)
+        with message.attachment.open("rb") as source:
+            image = Image.open(source)
+            image.draft("RGB", THUMBNAIL_SIZE)  # Decodificación reducida para JPEG grandes
+            image.thumbnail(THUMBNAIL_SIZE)
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=80)
+
+        name, _ = os.path.splitext(message.attachment_name or "thumb")
+        message.attachment_thumbnail.save(f"{name}_thumb.jpg", ContentFile(buffer.getvalue()), save=False)
+        Message.objects.filter(pk=message.pk).update(attachment_thumbnail=message.attachment_thumbnail.name)
+
+        url = message.attachment_thumbnail.url
+        broadcast_to_conversation(message.conversation_id, {
+            "type": "message_thumbnail",
+            "frame": encode_frame("message.thumbnail", {"message_id": message.id, "thumbnail": url}),
+        })
+        return url
+    except Message.DoesNotExist:
+        return None
+    except Exception as e:
+        # Corre en el executor: sin esto el error quedaría en un Future que nadie mira
+        metrics.CHAT_THUMBNAIL_FAILURES.inc(error=type(e).__name__)
+        logger.exception("Error generating thumbnail for message %s", message_id)
+        return None
+    finally:
+        close_old_connections()
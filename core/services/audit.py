@@ -0,0 +1,56 @@
+from __future__ import annotations
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from core.models import ActivityLog
+from core.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Un solo hilo: los registros se escriben en orden y sin competir entre sí por la BD
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="activity-log")
+metrics.ACTIVITY_LOG_QUEUE.set_function(lambda: _executor._work_queue.qsize())
+
+
+def get_client_ip(request) -> str | None:
+    """Obtiene la IP real del cliente"""
+    x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
+    if x_forwarded_for:
+        return x_forwarded_for.split(",")[0]
+    return request.META.get("REMOTE_ADDR")
+
+
+def _write(fields: dict) -> None:
+    close_old_connections()
+    try:
+        ActivityLog.objects.create(**fields)
+    except Exception:
+        logger.exception("Error writing ActivityLog %s for user %s", fields.get("action"), fields.get("user_id"))
+    finally:
+        close_old_connections()
+
+
+def record_activity(request, user, action: str, description: str = "", details: str = "") -> None:
+    """
+    Registra una acción en ActivityLog fuera del hilo de la petición (ACTIVITY_LOG_ASYNC) y marca
+    la petición para que ActivityLogMiddleware no la vuelva a registrar.
+    """
+    django_request = getattr(request, "_request", request)
+    django_request.activity_logged = True
+
+    fields = {
+        "user_id": user.pk,
+        "action": action,
+        "description": description[:255],
+        "ip_address": get_client_ip(django_request),
+        "user_agent": django_request.META.get("HTTP_USER_AGENT", "")[:500],
+        "path": django_request.path,
+        "method": django_request.method,
+        "session_key": (getattr(getattr(django_request, "session", None), "session_key", None) or ""),
+        "details": details,
+    }
+    if getattr(settings, "ACTIVITY_LOG_ASYNC", True):
+        _executor.submit(_write, fields)
+    else:
+        _write(fields)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db.models import Count, IntegerField, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from core.models import Conversation, ConversationReadState, Message
+from core.services import metrics
+from core.services.frames import encode_frame
+
+logger = logging.getLogger(__name__)
+
+
+def conversation_group_name(conversation_id: int) -> str:
+    return f"chat_{conversation_id}"
+
+
+def broadcast_to_conversation(conversation_id: int, event: dict) -> None:
+    """Envía un evento al grupo de la conversación desde código síncrono (vistas, comandos)."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        with metrics.GROUP_SEND_LATENCY.time(event=event.get("type", "")):
+            async_to_sync(channel_layer.group_send)(conversation_group_name(conversation_id), event)
+    except Exception:
+        # El chat en tiempo real no debe romper la petición HTTP
+        logger.exception("Error broadcasting to conversation %s", conversation_id)
+
+
+def attachment_payload(message: Message) -> dict | None:
+    if not message.attachment:
+        return None
+    return {
+        "url": message.attachment.url,
+        "name": message.attachment_name,
+        "size": message.attachment_size,
+        # La miniatura llega después en un evento message.thumbnail
+        "thumbnail": message.attachment_thumbnail.url if message.attachment_thumbnail else None,
+    }
+
+
+def message_payload(message: Message, sender: dict) -> dict:
+    """Serializa el mensaje para enviar por WebSocket, con los datos del remitente ya resueltos."""
+    return {
+        "id": message.id,
+        "sender": sender,
+        "type": message.type,
+        "text": message.text,
+        "attachment": attachment_payload(message),
+        "created_at": message.created_at.isoformat(),
+        "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+        "is_deleted": message.is_deleted,
+        "is_read": False,
+    }
+
+
+def get_read_watermark(conversation_id: int, user) -> int:
+    return ConversationReadState.objects.filter(
+        conversation_id=conversation_id, user=user
+    ).values_list("last_read_message_id", flat=True).first() or 0
+
+
+def annotate_unread_counts(queryset, user):
+    """
+    Anota `unread_count_annotated` en cada conversación con una subconsulta correlacionada
+    (mensajes de otros con id > marca de agua), para listar sin N+1.
+    """
+    watermark = ConversationReadState.objects.filter(
+        conversation=OuterRef("conversation"), user=user
+    ).values("last_read_message_id")[:1]
+    unread = (
+        Message.objects
+        .filter(conversation=OuterRef("pk"), id__gt=Coalesce(Subquery(watermark), 0))
+        .exclude(sender=user)
+        .order_by()
+        .values("conversation")
+        .annotate(c=Count("id"))
+        .values("c")
+    )
+    return queryset.annotate(
+        unread_count_annotated=Coalesce(Subquery(unread, output_field=IntegerField()), 0)
+    )
+
+
+def mark_conversation_read(conversation: Conversation, user, up_to_message_id: int | None = None) -> dict:
+    """
+    Marca como leídos los mensajes de la conversación (hasta `up_to_message_id` si se indica)
+    avanzando la marca de agua del usuario: una agregación y un UPDATE/INSERT, sin filas por mensaje.
+    """
+    watermark = get_read_watermark(conversation.id, user)
+    pending = conversation.messages.filter(id__gt=watermark)
+    if up_to_message_id is not None:
+        pending = pending.filter(id__lte=up_to_message_id)
+    others = ~Q(sender=user)
+    agg = pending.aggregate(
+        last=Max("id"),
+        first=Min("id", filter=others),
+        count=Count("id", filter=others),
+    )
+
+    read_at = timezone.now()
+    if agg["last"] is not None:
+        ConversationReadState.advance(conversation.id, user, agg["last"], read_at=read_at)
+
+    return {
+        "conversation_id": conversation.id,
+        "user_id": user.id,
+        "count": agg["count"],
+        "first_message_id": agg["first"],
+        "last_message_id": agg["last"] if agg["count"] else None,
+        "read_at": read_at.isoformat(),
+    }
+
+
+def broadcast_messages_read(result: dict) -> None:
+    """Un solo evento de rango `messages.read` para todo el lote marcado."""
+    broadcast_to_conversation(result["conversation_id"], {
+        "type": "messages_read",
+        "frame": encode_frame("messages.read", {
+            "user_id": result["user_id"],
+            "first_message_id": result["first_message_id"],
+            "last_message_id": result["last_message_id"],
+            "count": result["count"],
+            "read_at": result["read_at"],
+        }),
+    })
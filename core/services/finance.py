@@ -0,0 +1,112 @@
+from __future__ import annotations
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncMonth
+
+from core.models import Fee, Payment
+
+# Métricas de cobranza compartidas por DashboardStatsView, FinanceReportView y el reporte financiero.
+# Definiciones (las mismas que el libro de saldos, core.services.ledger):
+#  - emitido: suma de Fee.amount
+#  - cobrado: suma de los pagos registrados de esas cuotas (pagos parciales incluidos)
+#  - pendiente: lo que falta cobrar de cada cuota, sin que un sobrepago compense a otra
+# Los pagos se suman con una subconsulta por cuota: un JOIN Fee→Payment repetiría el monto de la
+# cuota por cada pago. Cada función resuelve su bloque de métricas en una sola consulta.
+
+ZERO = Decimal("0.00")
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def paid_subquery():
+    """Suma de pagos de la cuota (OuterRef) como subconsulta escalar"""
+    payments = (
+        Payment.objects.filter(fee=OuterRef("pk")).order_by().values("fee")
+        .annotate(total=Sum("amount")).values("total")
+    )
+    return Coalesce(Subquery(payments), Value(ZERO), output_field=MONEY)
+
+
+def _money(value) -> Decimal:
+    return value if value is not None else ZERO
+
+
+def collection_rate(issued: Decimal, paid: Decimal) -> float:
+    return round(float(paid / issued * 100), 2) if issued > 0 else 0
+
+
+def fee_summary(fees=None) -> dict:
+    """
+    Emitido, cobrado, pendiente y el desglose por estado de las cuotas dadas (todas por defecto),
+    en una consulta. by_status sólo incluye los estados con cuotas, en el orden de Fee.STATUS.
+    """
+    fees = (Fee.objects.all() if fees is None else fees).order_by().annotate(paid_total=paid_subquery())
+    aggregates = {
+        "issued": Sum("amount"),
+        "paid": Sum("paid_total"),
+        "outstanding": Sum(Greatest(F("amount") - F("paid_total"), Value(ZERO), output_field=MONEY)),
+    }
+    for code, _ in Fee.STATUS:
+        aggregates[f"{code}_count"] = Count("id", filter=Q(status=code))
+        aggregates[f"{code}_total"] = Sum("amount", filter=Q(status=code))
+    row = fees.aggregate(**aggregates)
+
+    issued, paid = _money(row["issued"]), _money(row["paid"])
+    return {
+        "issued": issued,
+        "paid": paid,
+        "outstanding": _money(row["outstanding"]),
+        "collection_rate": collection_rate(issued, paid),
+        "by_status": [
+            {"status": code, "count": row[f"{code}_count"], "total": _money(row[f"{code}_total"])}
+            for code, _ in Fee.STATUS if row[f"{code}_count"]
+        ],
+    }
+
+
+def payment_summary(payments) -> dict:
+    """Total cobrado, por mes y por método de los pagos dados, agrupando (mes, método) en una consulta"""
+    rows = (
+        payments.order_by().annotate(month=TruncMonth("paid_at"))
+        .values("month", "method").annotate(count=Count("id"), total=Sum("amount"))
+    )
+    by_month, by_method, total = {}, {}, ZERO
+    for row in rows:
+        total += row["total"]
+        by_month[row["month"]] = by_month.get(row["month"], ZERO) + row["total"]
+        method = by_method.setdefault(row["method"], {"method": row["method"], "count": 0, "total": ZERO})
+        method["count"] += row["count"]
+        method["total"] += row["total"]
+    return {
+        "total": total,
+        "by_month": [{"month": month, "total": value} for month, value in sorted(by_month.items())],
+        "by_method": sorted(by_method.values(), key=lambda item: -item["total"]),
+    }
+
+
+def ledger_summary(balances) -> dict:
+    """
+    Totales, por tipo de expensa y por periodo sobre UnitPeriodBalance, agrupando (periodo, tipo) en una
+    consulta. count es el número de cuotas (una fila del libro por cuota).
+    """
+    rows = (
+        balances.order_by().values("period", "expense_type__name")
+        .annotate(count=Count("id"), issued=Sum("issued"), paid=Sum("paid"), outstanding=Sum("outstanding"))
+    )
+    fields = ("issued", "paid", "outstanding")
+    overall = dict.fromkeys(fields, ZERO)
+    by_type, by_period = {}, {}
+    for row in rows:
+        kind = by_type.setdefault(row["expense_type__name"], {"type": row["expense_type__name"], "count": 0,
+                                                              **dict.fromkeys(fields, ZERO)})
+        period = by_period.setdefault(row["period"], {"period": row["period"], **dict.fromkeys(fields, ZERO)})
+        kind["count"] += row["count"]
+        for field in fields:
+            overall[field] += row[field]
+            kind[field] += row[field]
+            period[field] += row[field]
+    return {
+        "overall": overall,
+        "by_type": sorted(by_type.values(), key=lambda item: -item["issued"]),
+        "by_period": [by_period[key] for key in sorted(by_period)],
+    }
@@ -0,0 +1,36 @@
+from __future__ import annotations
+import json
+from functools import lru_cache
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def _orjson_encode(obj) -> str:
+    import orjson
+    return orjson.dumps(obj).decode("utf-8")
+
+
+def _default_encoder():
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+    return _orjson_encode
+
+
+@lru_cache(maxsize=None)
+def get_encoder():
+    """
+    Codificador JSON para los frames de WebSocket. Se puede reemplazar con
+    CHAT_JSON_ENCODER (ruta a un callable obj -> str); si no, usa orjson cuando
+    está instalado y json compacto en caso contrario.
+    """
+    path = getattr(settings, "CHAT_JSON_ENCODER", None)
+    if path:
+        return import_string(path)
+    return _default_encoder()
+
+
+def encode_frame(frame_type: str, data) -> str:
+    """Codifica una sola vez el frame {'type', 'data'} que se reenvía tal cual a cada miembro del grupo."""
+    return get_encoder()({"type": frame_type, "data": data})
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Q
+
+from core.models import Fee, UnitPeriodBalance
+from core.services import finance
+
+# Libro de saldos por (unidad, tipo de expensa, periodo) en UnitPeriodBalance. Se mantiene en la misma
+# transacción que el cambio que lo origina: signals de Fee/Payment (core.signals) y, agrupado en una sola
+# actualización, issue_fees/register_payment mediante batch(). Los UPDATE masivos sobre Fee/Payment no
+# disparan signals: después hay que correr `manage.py check_ledger --fix` o `rebuild_ledger`.
+
+ZERO = finance.ZERO
+BALANCE_FIELDS = ("issued", "paid", "outstanding", "overdue")
+
+_state = threading.local()
+
+
+def compute_balances(fees) -> dict[tuple, dict]:
+    """{(unit_id, expense_type_id, period): saldos} calculados desde Fee/Payment para las cuotas dadas"""
+    balances = {}
+    rows = fees.order_by().annotate(total_paid=finance.paid_subquery()).values_list(
+        "unit_id", "expense_type_id", "period", "amount", "status", "total_paid"
+    )
+    for unit_id, expense_type_id, period, amount, status, total_paid in rows:
+        outstanding = max(amount - total_paid, ZERO)
+        balances[(unit_id, expense_type_id, period)] = {
+            "issued": amount,
+            "paid": total_paid,
+            "outstanding": outstanding,
+            "overdue": outstanding if status == "OVERDUE" else ZERO,
+        }
+    return balances
+
+
+def _fees_for(keys):
+    condition = Q()
+    for unit_id, expense_type_id, period in keys:
+        condition |= Q(unit_id=unit_id, expense_type_id=expense_type_id, period=period)
+    return Fee.objects.filter(condition)
+
+
+def _write(balances: dict, stale_keys=()) -> None:
+    UnitPeriodBalance.objects.bulk_create(
+        [UnitPeriodBalance(unit_id=k[0], expense_type_id=k[1], period=k[2], **v) for k, v in balances.items()],
+        update_conflicts=True,
+        unique_fields=["unit", "expense_type", "period"],
+        update_fields=[*BALANCE_FIELDS, "updated_at"],
+        batch_size=500,
+    )
+    for unit_id, expense_type_id, period in stale_keys:
+        UnitPeriodBalance.objects.filter(unit_id=unit_id, expense_type_id=expense_type_id, period=period).delete()
+
+
+@transaction.atomic
+def sync(keys) -> None:
+    """Recalcula los saldos de las claves (unit_id, expense_type_id, period); borra los que ya no tienen cuota"""
+    keys = set(keys)
+    if not keys:
+        return
+    balances = {}
+    keys_list = sorted(keys, key=str)
+    for start in range(0, len(keys_list), 200):
+        balances.update(compute_balances(_fees_for(keys_list[start:start + 200])))
+    _write(balances, keys - set(balances))
+
+
+def key_for(fee) -> tuple:
+    return (fee.unit_id, fee.expense_type_id, fee.period)
+
+
+def fee_changed(fee, previous_key=None) -> None:
+    """Llamado desde los signals: difiere al final del batch() activo o sincroniza en el momento"""
+    keys = {key_for(fee)}
+    if previous_key:
+        keys.add(previous_key)
+    pending = getattr(_state, "pending", None)
+    if pending is not None:
+        pending.update(keys)
+    else:
+        sync(keys)
+
+
+@contextmanager
+def batch():
+    """Agrupa los cambios de Fee/Payment del bloque y actualiza los saldos una sola vez al salir"""
+    if getattr(_state, "pending", None) is not None:
+        yield  # ya dentro de otro batch: lo sincroniza el exterior
+        return
+    _state.pending = set()
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+    sync(pending)
+
+
+def rebuild(periods=None) -> int:
+    """Reconstruye el libro desde Fee/Payment (todos los periodos o los indicados). Devuelve filas escritas."""
+    fees = Fee.objects.all()
+    if periods:
+        fees = fees.filter(period__in=periods)
+    all_periods = sorted(set(fees.values_list("period", flat=True).distinct().order_by()))
+    written = 0
+    for period in all_periods:
+        with transaction.atomic():
+            UnitPeriodBalance.objects.filter(period=period).delete()
+            balances = compute_balances(fees.filter(period=period))
+            _write(balances)
+            written += len(balances)
+    stale = UnitPeriodBalance.objects.exclude(period__in=all_periods)
+    if periods:
+        stale = stale.filter(period__in=periods)
+    stale.delete()
+    return written
+
+
+def check(periods=None, limit: int = 50) -> dict:
+    """
+    Compara el libro con lo que resulta de Fee/Payment, periodo a periodo.
+    Devuelve {"checked", "mismatches": [{key, expected, actual}, ...] (hasta `limit`), "total_mismatches",
+    "periods": periodos con diferencias}.
+    """
+    fees = Fee.objects.all()
+    stored_rows = UnitPeriodBalance.objects.all()
+    if periods:
+        fees = fees.filter(period__in=periods)
+        stored_rows = stored_rows.filter(period__in=periods)
+    all_periods = sorted(
+        set(fees.values_list("period", flat=True).distinct().order_by())
+        | set(stored_rows.values_list("period", flat=True).distinct().order_by())
+    )
+    mismatches, total, checked, bad_periods = [], 0, 0, set()
+    for period in all_periods:
+        expected = compute_balances(fees.filter(period=period))
+        actual = {
+            (row[0], row[1], row[2]): dict(zip(BALANCE_FIELDS, row[3:]))
+            for row in stored_rows.filter(period=period).values_list(
+                "unit_id", "expense_type_id", "period", *BALANCE_FIELDS
+            )
+        }
+        for key in expected.keys() | actual.keys():
+            checked += 1
+            if expected.get(key) != actual.get(key):
+                total += 1
+                bad_periods.add(period)
+                if len(mismatches) < limit:
+                    mismatches.append({"key": key, "expected": expected.get(key), "actual": actual.get(key)})
+    return {"checked": checked, "mismatches": mismatches, "total_mismatches": total, "periods": sorted(bad_periods)}
@@ -0,0 +1,365 @@
+from __future__ import annotations
+import csv
+import gzip
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import AccessLog, ActivityLog
+
+# Tablas de log particionadas por mes sobre `timestamp`.
+#  - PostgreSQL, tras `manage.py partition_logs --apply` (opcional, en una ventana de mantenimiento):
+#    particionado nativo por rango (core_activitylog_p2025_01, ...) más una partición DEFAULT.
+#    La PK pasa a ser (id, timestamp) porque PostgreSQL exige que incluya la clave de partición.
+#  - Sin convertir (y en otros motores): la tabla sigue siendo única y la retención mueve los meses
+#    vencidos a <tabla>_archive.
+LOG_MODELS = {"activity": ActivityLog, "access": AccessLog}
+PARTITION_KEY = "timestamp"
+EXPORT_BATCH = 5000
+
+_PARTITION_RE = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+@dataclass
+class Partition:
+    name: str
+    month: date | None  # None para la partición DEFAULT
+    attached: bool = True
+
+
+# --- Meses ---
+
+def month_start(value: datetime | date) -> date:
+    if isinstance(value, datetime):
+        value = timezone.localtime(value, dt_timezone.utc) if timezone.is_aware(value) else value
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month: date) -> tuple[datetime, datetime]:
+    """[inicio, fin) del mes en UTC, igual que los límites de las particiones."""
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    end_month = add_months(month, 1)
+    return start, datetime(end_month.year, end_month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def retention_cutoff(keep_months: int, today: date | None = None) -> date:
+    """Primer mes que se conserva: el actual y los keep_months - 1 anteriores."""
+    return add_months(month_start(today or timezone.now()), -(max(keep_months, 1) - 1))
+
+
+def partition_name(model, month: date) -> str:
+    return f"{model._meta.db_table}_p{month:%Y_%m}"
+
+
+def default_partition_name(model) -> str:
+    return f"{model._meta.db_table}_default"
+
+
+def archive_table_name(model) -> str:
+    return f"{model._meta.db_table}_archive"
+
+
+# --- Estado ---
+
+def is_partitioned(model) -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND c.relnamespace = to_regnamespace(current_schema())",
+            [model._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(model) -> list[Partition]:
+    """Particiones adjuntas (PostgreSQL) o meses con filas en la tabla viva (resto de motores)."""
+    if is_partitioned(model):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = %s ORDER BY c.relname",
+                [model._meta.db_table],
+            )
+            names = [row[0] for row in cursor.fetchall()]
+        partitions = []
+        for name in names:
+            match = _PARTITION_RE.search(name)
+            month = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+            partitions.append(Partition(name, month))
+        return partitions
+    return [
+        Partition(model._meta.db_table, month_start(day))
+        for day in model.objects.dates(PARTITION_KEY, "month")
+    ]
+
+
+def expired_partitions(model, keep_months: int) -> list[Partition]:
+    cutoff = retention_cutoff(keep_months)
+    return [p for p in list_partitions(model) if p.month is not None and p.month < cutoff]
+
+
+# --- Conversión a tabla particionada (PostgreSQL, manage.py partition_logs) ---
+
+def _quote(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def _recreate_indexes_and_fks(schema_editor, model) -> None:
+    """Los mismos índices (mismos nombres) y FKs que crearía Django para el modelo."""
+    for statement in schema_editor._model_indexes_sql(model):
+        schema_editor.execute(statement)
+    for field in model._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            schema_editor.execute(schema_editor._create_fk_sql(model, field, "_fk_%(to_table)s_%(to_column)s"))
+
+
+def _create_month_partition(schema_editor, model, month: date) -> None:
+    start, end = month_bounds(month)
+    schema_editor.execute(
+        f"CREATE TABLE IF NOT EXISTS {_quote(partition_name(model, month))} "
+        f"PARTITION OF {_quote(model._meta.db_table)} FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+
+
+def partition_table(schema_editor, model, months_ahead: int = 3) -> None:
+    """
+    Convierte la tabla en particionada por mes: crea la nueva tabla padre con una partición por mes
+    desde el registro más antiguo hasta `months_ahead` meses en el futuro, copia las filas y borra
+    la tabla original. Es una operación única y pesada en tablas grandes: hacerla en una ventana
+    de mantenimiento.
+    """
+    table = model._meta.db_table
+    legacy = f"{table}_legacy"
+    sequence = f"{table}_pid_seq"
+    columns = ", ".join(_quote(f.column) for f in model._meta.concrete_fields)
+
+    schema_editor.execute(f"ALTER TABLE {_quote(table)} RENAME TO {_quote(legacy)}")
+    schema_editor.execute(
+        f"CREATE TABLE {_quote(table)} (LIKE {_quote(legacy)} INCLUDING DEFAULTS) "
+        f"PARTITION BY RANGE ({_quote(PARTITION_KEY)})"
+    )
+    schema_editor.execute(f"CREATE SEQUENCE {_quote(sequence)} OWNED BY {_quote(table)}.id")
+    schema_editor.execute(f"ALTER TABLE {_quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+    schema_editor.execute(f"ALTER TABLE {_quote(table)} ADD PRIMARY KEY (id, {_quote(PARTITION_KEY)})")
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN({_quote(PARTITION_KEY)}), MAX(id) FROM {_quote(legacy)}")
+        oldest, max_id = cursor.fetchone()
+    current = month_start(timezone.now())
+    month = month_start(oldest) if oldest else current
+    while month <= add_months(current, months_ahead):
+        _create_month_partition(schema_editor, model, month)
+        month = add_months(month, 1)
+    schema_editor.execute(
+        f"CREATE TABLE {_quote(default_partition_name(model))} PARTITION OF {_quote(table)} DEFAULT"
+    )
+
+    schema_editor.execute(f"INSERT INTO {_quote(table)} ({columns}) SELECT {columns} FROM {_quote(legacy)}")
+    schema_editor.execute(f"SELECT setval('{sequence}', %s, %s)", [max_id or 1, max_id is not None])
+    schema_editor.execute(f"DROP TABLE {_quote(legacy)} CASCADE")
+    _recreate_indexes_and_fks(schema_editor, model)
+
+
+def unpartition_table(schema_editor, model) -> None:
+    """Inverso de partition_table: vuelve a una tabla normal con PK (id) con las filas adjuntas."""
+    table = model._meta.db_table
+    partitioned = f"{table}_partitioned"
+    columns = ", ".join(_quote(f.column) for f in model._meta.concrete_fields)
+
+    schema_editor.execute(f"ALTER TABLE {_quote(table)} RENAME TO {_quote(partitioned)}")
+    schema_editor.execute(f"ALTER SEQUENCE {_quote(table + '_pid_seq')} OWNED BY NONE")
+    schema_editor.execute(f"CREATE TABLE {_quote(table)} (LIKE {_quote(partitioned)} INCLUDING DEFAULTS)")
+    schema_editor.execute(f"ALTER SEQUENCE {_quote(table + '_pid_seq')} OWNED BY {_quote(table)}.id")
+    schema_editor.execute(f"ALTER TABLE {_quote(table)} ADD PRIMARY KEY (id)")
+    schema_editor.execute(f"INSERT INTO {_quote(table)} ({columns}) SELECT {columns} FROM {_quote(partitioned)}")
+    schema_editor.execute(f"DROP TABLE {_quote(partitioned)} CASCADE")
+    _recreate_indexes_and_fks(schema_editor, model)
+
+
+# --- Mantenimiento ---
+
+def ensure_partitions(model, months_ahead: int | None = None) -> list[str]:
+    """
+    Crea las particiones del mes actual y de los `months_ahead` siguientes si faltan. Si la partición
+    DEFAULT ya tiene filas de ese mes, se sacan de ella y se insertan en la nueva partición.
+    """
+    if not is_partitioned(model):
+        return []
+    months_ahead = getattr(settings, "LOG_PARTITION_MONTHS_AHEAD", 3) if months_ahead is None else months_ahead
+    existing = {p.name for p in list_partitions(model)}
+    has_default = default_partition_name(model) in existing
+    table, default = _quote(model._meta.db_table), _quote(default_partition_name(model))
+    columns = ", ".join(_quote(f.column) for f in model._meta.concrete_fields)
+    created = []
+    current = month_start(timezone.now())
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(model, month)
+        if name in existing:
+            continue
+        start, end = month_bounds(month)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if has_default:
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+            cursor.execute(
+                f"CREATE TABLE {_quote(name)} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", [start, end]
+            )
+            if has_default:
+                cursor.execute(
+                    f"WITH moved AS (DELETE FROM {default} WHERE {_quote(PARTITION_KEY)} >= %s "
+                    f"AND {_quote(PARTITION_KEY)} < %s RETURNING {columns}) "
+                    f"INSERT INTO {table} ({columns}) SELECT {columns} FROM moved",
+                    [start, end],
+                )
+                cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+        created.append(name)
+    return created
+
+
+def detach_partition(model, partition: Partition) -> str:
+    """
+    PostgreSQL: DETACH de la partición, que queda como tabla independiente con el mismo nombre.
+    Otros motores: mueve las filas del mes a <tabla>_archive. Devuelve la tabla donde quedaron.
+    """
+    if is_partitioned(model):
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {_quote(model._meta.db_table)} DETACH PARTITION {_quote(partition.name)}")
+        return partition.name
+
+    archive = _ensure_archive_table(model)
+    columns = ", ".join(_quote(f.column) for f in model._meta.concrete_fields)
+    start, end = month_bounds(partition.month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {_quote(archive)} ({columns}) SELECT {columns} FROM {_quote(model._meta.db_table)} "
+            f"WHERE {_quote(PARTITION_KEY)} >= %s AND {_quote(PARTITION_KEY)} < %s",
+            [start, end],
+        )
+        _delete_month(model, partition.month, cursor)
+    return archive
+
+
+def drop_partition(model, partition: Partition) -> int | None:
+    """Elimina el mes: DROP de la partición en PostgreSQL, DELETE en el resto. Devuelve filas borradas si se conocen."""
+    if is_partitioned(model):
+        with connection.cursor() as cursor:
+            if partition.attached:
+                cursor.execute(
+                    f"ALTER TABLE {_quote(model._meta.db_table)} DETACH PARTITION {_quote(partition.name)}"
+                )
+            cursor.execute(f"DROP TABLE {_quote(partition.name)}")
+        return None
+    with transaction.atomic(), connection.cursor() as cursor:
+        return _delete_month(model, partition.month, cursor)
+
+
+def _delete_month(model, month: date, cursor) -> int:
+    start, end = month_bounds(month)
+    cursor.execute(
+        f"DELETE FROM {_quote(model._meta.db_table)} WHERE {_quote(PARTITION_KEY)} >= %s AND {_quote(PARTITION_KEY)} < %s",
+        [start, end],
+    )
+    return cursor.rowcount
+
+
+def _ensure_archive_table(model) -> str:
+    """Crea <tabla>_archive con las columnas actuales y añade las que falten si el modelo creció."""
+    archive = archive_table_name(model)
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if archive not in connection.introspection.table_names(cursor):
+            if connection.vendor == "postgresql":
+                cursor.execute(f"CREATE TABLE {_quote(archive)} (LIKE {_quote(table)})")
+            else:
+                cursor.execute(f"CREATE TABLE {_quote(archive)} AS SELECT * FROM {_quote(table)} WHERE 1 = 0")
+            return archive
+        existing = {column.name for column in connection.introspection.get_table_description(cursor, archive)}
+        for field in model._meta.concrete_fields:
+            if field.column not in existing:
+                cursor.execute(
+                    f"ALTER TABLE {_quote(archive)} ADD COLUMN {_quote(field.column)} {field.db_type(connection)} NULL"
+                )
+    return archive
+
+
+# --- Exportación comprimida ---
+
+def _rows(model, partition: Partition):
+    """Filas del mes en lotes; cursor del lado del servidor en PostgreSQL para no cargarlo entero."""
+    columns = ", ".join(_quote(f.column) for f in model._meta.concrete_fields)
+    if is_partitioned(model):
+        sql, params = f"SELECT {columns} FROM {_quote(partition.name)} ORDER BY id", []
+    else:
+        start, end = month_bounds(partition.month)
+        sql = (
+            f"SELECT {columns} FROM {_quote(model._meta.db_table)} "
+            f"WHERE {_quote(PARTITION_KEY)} >= %s AND {_quote(PARTITION_KEY)} < %s ORDER BY id"
+        )
+        params = [start, end]
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while batch := cursor.fetchmany(EXPORT_BATCH):
+            yield batch
+
+
+def export_partition(model, partition: Partition, output_dir: str, fmt: str = "csv.gz") -> tuple[str, int]:
+    """Escribe el mes en <output_dir>/<tabla>_<AAAA_MM>.csv.gz o .parquet. Devuelve (ruta, filas)."""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{model._meta.db_table}_{partition.month:%Y_%m}.{fmt}")
+    fields = model._meta.concrete_fields
+    rows = 0
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(f.column, _arrow_type(pa, f)) for f in fields])
+        # SQLite devuelve fechas como texto y booleanos como enteros
+        converters = {
+            i: {"DateTimeField": lambda v: parse_datetime(v) if isinstance(v, str) else v,
+                "BooleanField": lambda v: None if v is None else bool(v)}[f.get_internal_type()]
+            for i, f in enumerate(fields) if f.get_internal_type() in ("DateTimeField", "BooleanField")
+        }
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            for batch in _rows(model, partition):
+                columns = [list(column) for column in zip(*batch)]
+                for index, convert in converters.items():
+                    columns[index] = [convert(v) for v in columns[index]]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                rows += len(batch)
+    else:
+        with gzip.open(path, "wt", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow([field.column for field in fields])
+            for batch in _rows(model, partition):
+                writer.writerows(batch)
+                rows += len(batch)
+    return path, rows
+
+
+def _arrow_type(pa, field):
+    internal = field.get_internal_type()
+    if internal in ("AutoField", "BigAutoField", "IntegerField", "BigIntegerField", "ForeignKey",
+                    "PositiveIntegerField", "SmallIntegerField"):
+        return pa.int64()
+    if internal == "FloatField":
+        return pa.float64()
+    if internal == "BooleanField":
+        return pa.bool_()
+    if internal == "DateTimeField":
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
@@ -0,0 +1,58 @@
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from core.models import Conversation
+
+# Caché en memoria del proceso: conversation_id -> (cargado en, frozenset(user_ids)).
+# Las bajas sólo llegan a otros procesos por el evento members_removed de un consumidor del grupo:
+# las entradas caducan a los CHAT_MEMBERSHIP_TTL segundos para que una baja no quede sin ver.
+MAX_CACHED_CONVERSATIONS = 10000
+
+_members: OrderedDict[int, tuple[float, frozenset]] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _load_members(conversation_id: int) -> frozenset:
+    ids = frozenset(
+        Conversation.participants.through.objects
+        .filter(conversation_id=conversation_id)
+        .values_list("user_id", flat=True)
+    )
+    with _lock:
+        _members[conversation_id] = (time.monotonic(), ids)
+        _members.move_to_end(conversation_id)
+        while len(_members) > MAX_CACHED_CONVERSATIONS:
+            _members.popitem(last=False)
+    return ids
+
+
+def get_members(conversation_id: int) -> frozenset:
+    conversation_id = int(conversation_id)
+    ttl = getattr(settings, "CHAT_MEMBERSHIP_TTL", 30)
+    with _lock:
+        entry = _members.get(conversation_id)
+        if entry is not None and time.monotonic() - entry[0] < ttl:
+            _members.move_to_end(conversation_id)
+            return entry[1]
+    return _load_members(conversation_id)
+
+
+def is_member(conversation_id: int, user_id: int) -> bool:
+    """
+    Pertenencia desde la caché. Una respuesta negativa se confirma contra la base de datos,
+    porque otro proceso pudo añadir al usuario sin que esta caché se enterara. Una positiva
+    obsoleta dura como mucho CHAT_MEMBERSHIP_TTL segundos.
+    """
+    if user_id in get_members(conversation_id):
+        return True
+    return user_id in _load_members(int(conversation_id))
+
+
+def invalidate(conversation_id: int | None = None) -> None:
+    with _lock:
+        if conversation_id is None:
+            _members.clear()
+        else:
+            _members.pop(int(conversation_id), None)
@@ -0,0 +1,334 @@
+from __future__ import annotations
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Métricas en memoria en formato de texto de Prometheus, sin dependencias ni servicios externos.
+# Con varios workers (gunicorn/daphne) cada proceso vuelca su estado a METRICS_MULTIPROC_DIR cada
+# METRICS_FLUSH_INTERVAL segundos y /metrics suma los volcados de todos los procesos.
+# Ese directorio debe vaciarse al desplegar, igual que en el modo multiproceso de prometheus_client; los
+# volcados de procesos terminados se acumulan en ARCHIVE_FILE y se borran al servir /metrics.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AI_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+ARCHIVE_FILE = "archived.json"  # contadores acumulados de los procesos que ya terminaron
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_owner_pid = os.getpid()
+_flusher_pid = None
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        REGISTRY[name] = self
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> dict:
+        return {json.dumps(key): value for key, value in self._values.items()}
+
+    def reset(self) -> None:
+        self._values = {}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            _check_fork()
+            self._values[key] = self._values.get(key, 0) + amount
+        _ensure_flusher()
+
+
+class Gauge(_Metric):
+    """Gauge sumado entre procesos vivos; con set_function el valor se lee al exportar."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            _check_fork()
+            self._values[key] = self._values.get(key, 0) + amount
+        _ensure_flusher()
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with _lock:
+            _check_fork()
+            self._values[self._key(labels)] = value
+        _ensure_flusher()
+
+    def set_function(self, function) -> None:
+        self._function = function
+
+    def snapshot(self) -> dict:
+        if self._function is not None:
+            try:
+                self._values[()] = float(self._function())
+            except Exception:
+                pass
+        return super().snapshot()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            _check_fork()
+            state = self._values.get(key)
+            if state is None:
+                # [conteo por bucket (no acumulado) + desbordamiento, suma]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+        _ensure_flusher()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+REGISTRY: dict[str, _Metric] = {}
+
+HTTP_REQUESTS = Counter("http_requests_total", "Peticiones HTTP atendidas", ["route", "method", "status"])
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Latencia de peticiones HTTP por ruta", ["route", "method"])
+AI_LATENCY = Histogram("ai_upstream_duration_seconds", "Latencia de las llamadas al proveedor de IA",
+                       ["endpoint"], buckets=AI_BUCKETS)
+AI_FAILURES = Counter("ai_upstream_failures_total", "Llamadas al proveedor de IA fallidas", ["endpoint", "error"])
+WS_CONNECTIONS = Gauge("websocket_connections", "Conexiones WebSocket de chat abiertas")
+WS_CONNECTIONS_TOTAL = Counter("websocket_connections_total", "Conexiones WebSocket de chat aceptadas")
+CHAT_MESSAGES = Counter("chat_messages_total", "Mensajes de chat enviados", ["source"])
+CHAT_MESSAGE_ERRORS = Counter("chat_message_errors_total", "Mensajes de chat que no se pudieron guardar", ["source"])
+CHAT_THUMBNAIL_FAILURES = Counter("chat_thumbnail_failures_total", "Miniaturas de adjuntos que no se pudieron generar",
+                                  ["error"])
+GROUP_SEND_LATENCY = Histogram("channel_group_send_duration_seconds", "Latencia de group_send en la capa de canales",
+                               ["event"])
+ACTIVITY_LOG_QUEUE = Gauge("activity_log_queue_depth", "ActivityLog pendientes de escribir en el hilo de auditoría")
+PAYMENT_EVENTS = Counter("payment_webhook_events_total", "Notificaciones de pago procesadas por resultado", ["result"])
+
+
+def track_ai_call(endpoint: str, function, *args, **kwargs):
+    """Llama al proveedor de IA midiendo la latencia; los fallos se cuentan por tipo y se relanzan."""
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    except Exception as e:
+        AI_FAILURES.inc(endpoint=endpoint, error=type(e).__name__)
+        raise
+    finally:
+        AI_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+
+
+# --- Multiproceso ---
+
+def _multiproc_dir() -> str | None:
+    return getattr(settings, "METRICS_MULTIPROC_DIR", None) or None
+
+
+def _check_fork() -> None:
+    """Tras un fork el hijo hereda los valores del padre: se descartan para no contarlos dos veces."""
+    global _owner_pid
+    if os.getpid() != _owner_pid:
+        _owner_pid = os.getpid()
+        for metric in REGISTRY.values():
+            metric.reset()
+
+
+def _ensure_flusher() -> None:
+    global _flusher_pid
+    if _flusher_pid == os.getpid() or not _multiproc_dir():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _flush_loop() -> None:
+    interval = getattr(settings, "METRICS_FLUSH_INTERVAL", 5)
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except OSError:
+            logger.exception("Error flushing metrics to %s", _multiproc_dir())
+
+
+def flush() -> None:
+    """Vuelca el estado de este proceso a METRICS_MULTIPROC_DIR/<pid>.json (escritura atómica)."""
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    with _lock:
+        _check_fork()
+        data = {"pid": os.getpid(), "metrics": {name: m.snapshot() for name, m in REGISTRY.items()}}
+    _write(path, data)
+
+
+atexit.register(lambda: _multiproc_dir() and flush())
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(merged: dict, data: dict, gauges: bool) -> None:
+    for name, values in data.get("metrics", {}).items():
+        metric = REGISTRY.get(name)
+        if metric is None or (metric.kind == "gauge" and not gauges):
+            continue
+        target = merged.setdefault(name, {})
+        for key, value in values.items():
+            if metric.kind == "histogram":
+                current = target.setdefault(key, [[0] * len(value[0]), 0.0])
+                current[0] = [a + b for a, b in zip(current[0], value[0])]
+                current[1] += value[1]
+            else:
+                target[key] = target.get(key, 0) + value
+
+
+def _read(path: str) -> dict | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path: str, data: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _archive_dead(directory: str) -> None:
+    """
+    Suma los contadores e histogramas de los procesos terminados a ARCHIVE_FILE y borra sus volcados,
+    para que el directorio no crezca con cada reinicio de workers. Los gauges de esos procesos se descartan.
+    """
+    dead = [
+        path for path in glob.glob(os.path.join(directory, "*.json"))
+        if os.path.basename(path) != ARCHIVE_FILE and not _pid_alive((_read(path) or {}).get("pid", 0))
+    ]
+    if not dead:
+        return
+    # El lock evita que dos procesos archiven el mismo volcado (y lo cuenten dos veces)
+    with open(os.path.join(directory, ".archive.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        archived = {}
+        _merge(archived, _read(archive_path) or {}, gauges=False)
+        for path in dead:
+            data = _read(path)
+            if data is None or _pid_alive(data.get("pid", 0)):
+                continue
+            _merge(archived, data, gauges=False)
+            _write(archive_path, {"pid": None, "metrics": archived})
+            os.remove(path)
+
+
+def _collect() -> dict:
+    """{nombre: {clave_json: valor}} de este proceso o sumado entre todos los volcados."""
+    directory = _multiproc_dir()
+    if not directory:
+        with _lock:
+            _check_fork()
+            return {name: m.snapshot() for name, m in REGISTRY.items()}
+
+    flush()
+    _archive_dead(directory)
+    merged = {name: {} for name in REGISTRY}
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        data = _read(path)
+        if data is not None:
+            # Los contadores de procesos terminados siguen contando (en ARCHIVE_FILE); los gauges no
+            _merge(merged, data, gauges=os.path.basename(path) != ARCHIVE_FILE)
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render() -> str:
+    """Exposición en el formato de texto 0.0.4 de Prometheus."""
+    collected = _collect()
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(collected.get(name, {}).items()):
+            label_values = json.loads(key)
+            if metric.kind == "histogram":
+                counts, total = value
+                cumulative = 0
+                for limit, count in zip(metric.buckets + (math.inf,), counts):
+                    cumulative += count
+                    le = f'le="{_number(limit)}"'
+                    lines.append(f"{name}_bucket{_labels(metric.labelnames, label_values, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(metric.labelnames, label_values)} {total!r}")
+                lines.append(f"{name}_count{_labels(metric.labelnames, label_values)} {cumulative}")
+            else:
+                lines.append(f"{name}{_labels(metric.labelnames, label_values)} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,280 @@
+from __future__ import annotations
+import csv
+import io
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Sum
+
+from core.models import ExpenseType, Fee, Payment, Unit
+from core.services import ledger
+
+# Importación masiva de pagos desde un CSV o un extracto bancario exportado a CSV.
+# El archivo se lee en streaming dos veces. La primera pasada sólo junta las (unidad, periodo) del archivo
+# y bloquea todas sus cuotas con un solo SELECT ... FOR UPDATE ordenado por id, antes de tocar nada: dos
+# importaciones concurrentes (o una y register_payment) toman los bloqueos en el mismo orden y no pueden
+# cruzarse en un deadlock. La segunda pasada procesa lotes de `batch_size` filas: inserta los pagos con
+# bulk_create, pasa a PAID las cuotas saldadas con un UPDATE y sincroniza el libro de saldos para esas
+# claves. Todo el archivo va en una transacción: o se importa completo o no se importa nada.
+#
+# Cada fila se asigna a las cuotas de su (unidad, periodo), o sólo a la del tipo de expensa indicado, en
+# orden de tipo de expensa y hasta cubrir lo pendiente de cada una. El excedente NO se registra: queda en
+# el reporte de conciliación como sobrepago, igual que las filas sin cuota.
+
+DEFAULT_BATCH = 2000
+REPORT_FIELDS = ("line", "unit", "period", "amount", "applied", "excess", "reason")
+
+# Encabezados aceptados por columna (en minúsculas)
+COLUMNS = {
+    "unit": ("unit", "unidad", "unit_code", "codigo", "código"),
+    "period": ("period", "periodo", "período"),
+    "amount": ("amount", "monto", "importe", "credito", "crédito"),
+    "expense_type": ("expense_type", "tipo", "concepto"),
+    "method": ("method", "metodo", "método", "medio"),
+    "reference": ("reference", "referencia", "note", "nota", "descripcion", "descripción"),
+    "date": ("date", "fecha"),
+}
+REQUIRED = ("unit", "period", "amount")
+
+_PERIOD_RE = re.compile(r"^(\d{4})-(\d{2})$")
+_ZERO = Decimal("0.00")
+_CENT = Decimal("0.01")
+
+
+class ImportFormatError(ValueError):
+    """El archivo no tiene las columnas mínimas (unidad, periodo, monto)"""
+
+
+def parse_amount(value: str) -> Decimal:
+    """'1234.50', '1.234,50', '$ 1,234.50' -> Decimal. Si hay coma y punto, el último es el decimal."""
+    text = re.sub(r"[^\d,.\-]", "", value or "")
+    if "," in text and "." in text:
+        thousands = "." if text.rfind(",") > text.rfind(".") else ","
+        text = text.replace(thousands, "")
+    text = text.replace(",", ".")
+    try:
+        amount = Decimal(text).quantize(_CENT)
+    except InvalidOperation:
+        raise ValueError(f"monto inválido: {value!r}")
+    if amount <= 0:
+        raise ValueError(f"monto inválido: {value!r}")
+    return amount
+
+
+def _normalize_period(value: str) -> str:
+    text = (value or "").strip().replace("/", "-")
+    if re.match(r"^\d{2}-\d{4}$", text):  # 01-2025 -> 2025-01
+        text = f"{text[3:]}-{text[:2]}"
+    match = _PERIOD_RE.match(text)
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"periodo inválido: {value!r}")
+    return text
+
+
+def _text_stream(file):
+    """Acepta un archivo de texto, uno binario o un UploadedFile de Django"""
+    if isinstance(file, io.TextIOBase):
+        return file
+    return io.TextIOWrapper(getattr(file, "file", file), encoding="utf-8-sig", newline="")
+
+
+def read_rows(file):
+    """Itera (número de línea, {columna: valor}) con los encabezados normalizados según COLUMNS"""
+    stream = _text_stream(file)
+    header_line = stream.readline()
+    delimiter = ";" if header_line.count(";") > header_line.count(",") else ","
+    header = next(csv.reader([header_line], delimiter=delimiter), [])
+    aliases = {alias: name for name, names in COLUMNS.items() for alias in names}
+    mapping = {index: aliases[h.strip().lower()] for index, h in enumerate(header) if h.strip().lower() in aliases}
+    missing = [name for name in REQUIRED if name not in mapping.values()]
+    if missing:
+        raise ImportFormatError(f"faltan columnas: {', '.join(missing)}")
+    for line, values in enumerate(csv.reader(stream, delimiter=delimiter), start=2):
+        if not any(v.strip() for v in values):
+            continue
+        yield line, {name: values[index].strip() if index < len(values) else "" for index, name in mapping.items()}
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _Importer:
+    def __init__(self, method: str, source: str):
+        self.method = method
+        self.source = source
+        self.units = dict(Unit.objects.values_list("code", "id"))
+        self.types = {name.lower(): pk for pk, name in ExpenseType.objects.values_list("id", "name")}
+        self.report = {
+            "rows": 0, "matched": 0, "payments_created": 0, "fees_paid": 0,
+            "amount_applied": _ZERO, "amount_unapplied": _ZERO, "unmatched": [], "overpaid": [],
+        }
+
+    def _unmatched(self, line, row, reason, amount=None):
+        self.report["unmatched"].append({
+            "line": line, "unit": row.get("unit", ""), "period": row.get("period", ""),
+            "amount": amount if amount is not None else row.get("amount", ""), "reason": reason,
+        })
+        if amount is not None:
+            self.report["amount_unapplied"] += amount
+
+    def _parse(self, line, row):
+        """(unit_id, period, expense_type_id | None, amount) o None si la fila no se puede conciliar"""
+        try:
+            amount = parse_amount(row["amount"])
+            period = _normalize_period(row["period"])
+        except ValueError as exc:
+            self._unmatched(line, row, f"fila inválida: {exc}")
+            return None
+        unit_id = self.units.get(row["unit"])
+        if unit_id is None:
+            self._unmatched(line, row, "unidad desconocida", amount)
+            return None
+        expense_type_id = None
+        if row.get("expense_type"):
+            expense_type_id = self.types.get(row["expense_type"].lower())
+            if expense_type_id is None:
+                self._unmatched(line, row, "tipo de expensa desconocido", amount)
+                return None
+        return unit_id, period, expense_type_id, amount
+
+    def _note(self, row):
+        parts = [f"Importación {self.source}".strip()]
+        if row.get("reference"):
+            parts.append(f"ref. {row['reference']}")
+        if row.get("date"):
+            parts.append(f"fecha {row['date']}")
+        return " - ".join(parts)
+
+    def lock_fees(self, rows):
+        """
+        Primera pasada: resuelve las (unidad, periodo) de todo el archivo y bloquea sus cuotas con un solo
+        SELECT ... FOR UPDATE ordenado por id. Las cuotas y lo pendiente de cada una quedan en memoria.
+        """
+        wanted = set()
+        for _, row in rows:
+            unit_id = self.units.get(row["unit"])
+            try:
+                period = _normalize_period(row["period"])
+            except ValueError:
+                continue
+            if unit_id is not None:
+                wanted.add((unit_id, period))
+        self.by_key = {}
+        self.pending = {}
+        if not wanted:
+            return
+
+        units, periods = {u for u, _ in wanted}, {p for _, p in wanted}
+        fees = list(
+            Fee.objects.select_for_update()
+            .filter(unit_id__in=units, period__in=periods)
+            .order_by("id")
+            .only("id", "unit_id", "expense_type_id", "period", "amount", "status")
+        )
+        for fee in fees:
+            if (fee.unit_id, fee.period) in wanted:
+                self.by_key.setdefault((fee.unit_id, fee.period), []).append(fee)
+        for key_fees in self.by_key.values():
+            key_fees.sort(key=lambda f: (f.expense_type_id, f.id))
+        locked = [f for fs in self.by_key.values() for f in fs]
+        paid = dict(
+            Payment.objects.filter(fee__unit_id__in=units, fee__period__in=periods).order_by()
+            .values_list("fee_id").annotate(total=Sum("amount"))
+        )
+        self.pending = {f.id: max(f.amount - (paid.get(f.id) or _ZERO), _ZERO).quantize(_CENT) for f in locked}
+
+    def process(self, batch):
+        parsed = [(line, row, self._parse(line, row)) for line, row in batch]
+        self.report["rows"] += len(batch)
+        wanted = {(p[0], p[1]) for _, _, p in parsed if p}
+        if not wanted:
+            return
+        by_key = {key: self.by_key[key] for key in wanted if key in self.by_key}
+        pending = self.pending
+
+        payments = []
+        for line, row, item in parsed:
+            if item is None:
+                continue
+            unit_id, period, expense_type_id, amount = item
+            candidates = [
+                f for f in by_key.get((unit_id, period), [])
+                if expense_type_id is None or f.expense_type_id == expense_type_id
+            ]
+            if not candidates:
+                self._unmatched(line, row, "sin cuota para la unidad y el periodo", amount)
+                continue
+            self.report["matched"] += 1
+            remaining = amount
+            for fee in candidates:
+                applied = min(remaining, pending[fee.id])
+                if applied <= 0:
+                    continue
+                payments.append(Payment(fee_id=fee.id, amount=applied, method=row.get("method") or self.method,
+                                        note=self._note(row)))
+                pending[fee.id] -= applied
+                remaining -= applied
+                if not remaining:
+                    break
+            self.report["amount_applied"] += amount - remaining
+            if remaining:
+                self.report["amount_unapplied"] += remaining
+                self.report["overpaid"].append({
+                    "line": line, "unit": row["unit"], "period": period, "amount": amount,
+                    "applied": amount - remaining, "excess": remaining,
+                })
+
+        # bulk_create y update() no disparan signals: el libro se sincroniza aparte
+        Payment.objects.bulk_create(payments, batch_size=1000)
+        settled = [f for fs in by_key.values() for f in fs if pending[f.id] <= 0 and f.status != "PAID"]
+        if settled:
+            Fee.objects.filter(id__in=[f.id for f in settled]).update(status="PAID")
+            for fee in settled:
+                fee.status = "PAID"  # otro lote del archivo puede volver a tocar la misma cuota
+        touched = {p.fee_id for p in payments} | {f.id for f in settled}
+        ledger.sync(ledger.key_for(f) for fs in by_key.values() for f in fs if f.id in touched)
+        self.report["payments_created"] += len(payments)
+        self.report["fees_paid"] += len(settled)
+
+
+def import_payments(file, method: str = "transfer", source: str = "", dry_run: bool = False,
+                    batch_size: int = DEFAULT_BATCH) -> dict:
+    """
+    Importa los pagos del archivo y devuelve el reporte de conciliación:
+    {rows, matched, payments_created, fees_paid, amount_applied, amount_unapplied,
+     unmatched: [{line, unit, period, amount, reason}], overpaid: [{line, unit, period, amount, applied, excess}],
+     dry_run}. Con dry_run se calcula todo y se revierte la transacción.
+    El archivo se recorre dos veces (debe admitir seek). Lanza ImportFormatError si faltan columnas.
+    """
+    stream = _text_stream(file)
+    with transaction.atomic():
+        importer = _Importer(method, source)
+        try:
+            importer.lock_fees(read_rows(stream))
+            stream.seek(0)
+            for batch in _batches(read_rows(stream), batch_size):
+                importer.process(batch)
+        except UnicodeDecodeError:
+            raise ImportFormatError("el archivo debe estar en UTF-8")
+        if dry_run:
+            transaction.set_rollback(True)
+    return {**importer.report, "dry_run": dry_run}
+
+
+def write_report(report: dict, out) -> None:
+    """Escribe las líneas no conciliadas y los sobrepagos del reporte como CSV"""
+    writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for item in report["unmatched"]:
+        writer.writerow(item)
+    for item in report["overpaid"]:
+        writer.writerow({**item, "reason": "sobrepago"})
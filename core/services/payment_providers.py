@@ -0,0 +1,166 @@
+from __future__ import annotations
+import hashlib
+import hmac
+import itertools
+import json
+import uuid
+from decimal import Decimal
+
+import mercadopago
+from django.conf import settings
+from django.utils import timezone
+
+# Proveedores de pago. Las dos implementaciones exponen lo mismo:
+#  - create_preference(fee, notification_url) -> {"id", "init_point", "point_of_interaction"}
+#  - get_payment(payment_id) -> {"id", "status", "amount", "external_reference"}
+# get_provider() elige según PAYMENT_PROVIDER: "mercadopago" (SDK real) o "stub" (en memoria, para
+# desarrollo y tests). external_reference lleva el id de la cuota.
+
+PLACEHOLDER_QR = 'iVBORw0KGgoAAAANSUhEUgAAAQAAAAEAAQMAAABmvDolAAAABlBMVEX///8AAABVwtN+AAABbklEQVR4nO2WsQ3DMAxEFXqBJRgQ3QWLsAwLMEaowGBLYIZgCf5/lW6ECIZ/uW/yvB5k3zJ2lO/ncsP5P+H8IeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J/s38A2gUzC8oVoRBAAAAAElFTkSuQmCC'
+
+
+class ProviderError(Exception):
+    """Fallo al consultar al proveedor (red, 5xx, pago todavía no visible): se reintenta"""
+
+
+class PaymentNotFound(ProviderError):
+    pass
+
+
+def signature(secret: str, data_id: str, request_id: str, ts: str) -> str:
+    """Firma v1 de la cabecera x-signature de MercadoPago"""
+    manifest = f"id:{data_id.lower()};request-id:{request_id};ts:{ts};"
+    return hmac.new(secret.encode(), manifest.encode(), hashlib.sha256).hexdigest()
+
+
+def _payment(data: dict) -> dict:
+    return {
+        "id": str(data["id"]),
+        "status": data.get("status", ""),
+        "amount": Decimal(str(data.get("transaction_amount") or data.get("amount") or 0)),
+        "external_reference": data.get("external_reference"),
+    }
+
+
+class MercadoPagoProvider:
+    name = "mercadopago"
+
+    def __init__(self, access_token: str):
+        self.sdk = mercadopago.SDK(access_token)
+
+    def create_preference(self, fee, notification_url: str = "") -> dict:
+        data = {
+            "items": [{
+                "title": f"{fee.expense_type.name} {fee.period} - {fee.unit.code}",
+                "quantity": 1,
+                "unit_price": float(fee.amount),
+            }],
+            "external_reference": str(fee.id),
+        }
+        if notification_url:
+            data["notification_url"] = notification_url
+        result = self.sdk.preference().create(data)
+        if result.get("status") not in (200, 201):
+            raise ProviderError(f"MercadoPago respondió {result.get('status')} al crear la preferencia")
+        response = result["response"]
+        return {"id": response["id"], "init_point": response["init_point"], "point_of_interaction": None}
+
+    def get_payment(self, payment_id: str) -> dict:
+        result = self.sdk.payment().get(payment_id)
+        if result.get("status") == 404:
+            raise PaymentNotFound(f"pago {payment_id} no encontrado")
+        if result.get("status") != 200:
+            raise ProviderError(f"MercadoPago respondió {result.get('status')} al consultar el pago {payment_id}")
+        return _payment(result["response"])
+
+
+class StubProvider:
+    """
+    Proveedor local: guarda los pagos en memoria y arma las notificaciones con el formato de MercadoPago.
+    Cada notificación emitida queda en `recorded` ({"query", "headers", "body"}) para reproducirla contra el
+    webhook, repetida o desordenada; dump()/load() las guardan y las leen de un JSON.
+    """
+    name = "mercadopago"
+
+    def __init__(self):
+        self.payments: dict[str, dict] = {}
+        self.recorded: list[dict] = []
+        self._payment_ids = itertools.count(1000001)
+        self._notification_ids = itertools.count(1)
+
+    def create_preference(self, fee, notification_url: str = "") -> dict:
+        return {
+            "id": f"stub-{fee.id}",
+            "init_point": f"https://www.mercadopago.com.ar/pagar/con/qr/{fee.id}",
+            "point_of_interaction": {"transaction_data": {"qr_code_base64": PLACEHOLDER_QR}},
+        }
+
+    def get_payment(self, payment_id: str) -> dict:
+        try:
+            return dict(self.payments[str(payment_id)])
+        except KeyError:
+            raise PaymentNotFound(f"pago {payment_id} no encontrado")
+
+    def pay(self, fee_id: int, amount, status: str = "approved") -> str:
+        """Registra un pago de la cuota y emite payment.created. Devuelve el id del pago."""
+        payment_id = str(next(self._payment_ids))
+        self.payments[payment_id] = _payment({
+            "id": payment_id, "status": status, "transaction_amount": amount, "external_reference": str(fee_id),
+        })
+        self.notify(payment_id, "payment.created")
+        return payment_id
+
+    def update(self, payment_id: str, status: str) -> None:
+        self.payments[payment_id]["status"] = status
+        self.notify(payment_id, "payment.updated")
+
+    def notify(self, payment_id: str, action: str) -> dict:
+        request_id = str(uuid.uuid4())
+        headers = {"x-request-id": request_id}
+        secret = getattr(settings, "MERCADOPAGO_WEBHOOK_SECRET", "")
+        if secret:
+            ts = str(int(timezone.now().timestamp() * 1000))
+            headers["x-signature"] = f"ts={ts},v1={signature(secret, payment_id, request_id, ts)}"
+        notification = {
+            "query": {"data.id": payment_id, "type": "payment"},
+            "headers": headers,
+            "body": {
+                "id": next(self._notification_ids), "type": "payment", "action": action, "live_mode": False,
+                "date_created": timezone.now().isoformat(), "data": {"id": payment_id},
+            },
+        }
+        self.recorded.append(notification)
+        return notification
+
+    def dump(self, path: str) -> None:
+        payments = {key: dict(value, amount=str(value["amount"])) for key, value in self.payments.items()}
+        with open(path, "w", encoding="utf-8") as out:
+            json.dump({"payments": payments, "recorded": self.recorded}, out, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "StubProvider":
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        provider = cls()
+        provider.payments = {key: dict(value, amount=Decimal(value["amount"])) for key, value in data["payments"].items()}
+        provider.recorded = data["recorded"]
+        return provider
+
+
+_provider = None
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        if getattr(settings, "PAYMENT_PROVIDER", "stub") == "mercadopago":
+            _provider = MercadoPagoProvider(settings.MERCADOPAGO_ACCESS_TOKEN)
+        else:
+            _provider = StubProvider()
+    return _provider
+
+
+def set_provider(provider) -> None:
+    """Reemplaza el proveedor del proceso (tests); None vuelve a elegirlo según la configuración"""
+    global _provider
+    _provider = provider
@@ -0,0 +1,177 @@
+from __future__ import annotations
+import hashlib
+import hmac
+import json
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import Fee, Payment, PaymentDeadLetter, PaymentEvent
+from core.services import metrics, payment_providers
+from core.services.fees import register_payment
+
+# Ingesta de webhooks de pago en dos tiempos:
+#  1. MercadoPagoWebhookView verifica la firma, guarda la notificación cruda en PaymentEvent con un INSERT
+#     que ignora duplicados (idempotency_key) y responde 200 sin tocar cuotas ni al proveedor.
+#  2. `manage.py process_payment_events` reclama eventos vencidos, junta los del mismo pago (un
+#     payment.created y varios payment.updated son una sola consulta al proveedor), consulta el estado real
+#     del pago y, si está aprobado, lo aplica con register_payment. Payment.external_id es único: un pago
+#     del proveedor se registra una sola vez aunque lleguen notificaciones repetidas o dos workers a la vez.
+# Los errores transitorios se reintentan con backoff exponencial; al agotar PAYMENT_WEBHOOK_MAX_ATTEMPTS, o si
+# el pago no se puede aplicar (cuota inexistente), el evento pasa a DEAD con su fila en PaymentDeadLetter.
+
+LEASE = timedelta(minutes=5)  # un evento en PROCESSING vuelve a ser elegible si el worker murió
+MAX_BACKOFF = 3600
+
+
+def verify_signature(headers, query) -> bool:
+    """Valida x-signature con MERCADOPAGO_WEBHOOK_SECRET; sin secreto configurado se acepta todo"""
+    secret = getattr(settings, "MERCADOPAGO_WEBHOOK_SECRET", "")
+    if not secret:
+        return True
+    parts = dict(
+        part.strip().split("=", 1) for part in headers.get("x-signature", "").split(",") if "=" in part
+    )
+    ts, received = parts.get("ts", ""), parts.get("v1", "")
+    if not ts or not received:
+        return False
+    expected = payment_providers.signature(secret, query.get("data.id", ""), headers.get("x-request-id", ""), ts)
+    return hmac.compare_digest(expected, received)
+
+
+def _event(body: dict, query: dict, headers, provider: str) -> PaymentEvent:
+    data = body.get("data") if isinstance(body.get("data"), dict) else {}
+    topic = body.get("type") or body.get("topic") or query.get("type") or query.get("topic") or ""
+    resource_id = str(data.get("id") or query.get("data.id") or query.get("id") or body.get("resource") or "")
+    request_id = headers.get("x-request-id", "")
+    if body.get("id"):
+        key = f"{provider}:{body['id']}"  # id de la notificación: igual en todos los reintentos del proveedor
+    elif request_id:
+        key = f"{provider}:req:{request_id}"
+    else:
+        raw = json.dumps({"body": body, "query": query}, sort_keys=True, default=str)
+        key = f"{provider}:sha256:{hashlib.sha256(raw.encode()).hexdigest()}"
+    return PaymentEvent(
+        provider=provider, idempotency_key=key[:128], topic=str(topic)[:40], action=str(body.get("action", ""))[:40],
+        resource_id=resource_id[:64], payload={"body": body, "query": query, "request_id": request_id},
+    )
+
+
+def enqueue(body: dict, query: dict, headers, provider: str = "mercadopago") -> None:
+    """Guarda la notificación en una sola consulta; las repetidas se descartan por idempotency_key"""
+    PaymentEvent.objects.bulk_create([_event(body, query, headers, provider)], ignore_conflicts=True)
+
+
+def claim(limit: int = 100, provider: str = "mercadopago") -> list[PaymentEvent]:
+    """
+    Marca como PROCESSING hasta `limit` eventos vencidos y, con ellos, los demás eventos vencidos del mismo
+    pago. En PostgreSQL dos workers no reclaman las mismas filas (SKIP LOCKED).
+    """
+    now = timezone.now()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        due = PaymentEvent.objects.select_for_update(skip_locked=skip_locked).filter(
+            provider=provider, status__in=["PENDING", "PROCESSING"], next_attempt_at__lte=now,
+        )
+        first = list(due.order_by("next_attempt_at", "id").values_list("id", "resource_id")[:limit])
+        ids = {pk for pk, _ in first}
+        resources = {resource_id for _, resource_id in first if resource_id}
+        if resources:
+            ids.update(due.filter(resource_id__in=resources).values_list("id", flat=True))
+        PaymentEvent.objects.filter(id__in=ids).update(status="PROCESSING", next_attempt_at=now + LEASE)
+    return list(PaymentEvent.objects.filter(id__in=ids).order_by("id"))
+
+
+def _finish(events, status: str, note: str = "", payment_id=None) -> str:
+    PaymentEvent.objects.filter(id__in=[e.id for e in events]).update(
+        status=status, last_error=note, payment_id=payment_id, processed_at=timezone.now(),
+    )
+    return status.lower()
+
+
+def _dead(events, reason: str) -> str:
+    _finish(events, "DEAD", reason)
+    PaymentDeadLetter.objects.bulk_create(
+        [PaymentDeadLetter(event_id=e.id, reason=reason) for e in events], ignore_conflicts=True
+    )
+    return "dead"
+
+
+def _retry(events, error: str) -> str:
+    max_attempts = getattr(settings, "PAYMENT_WEBHOOK_MAX_ATTEMPTS", 8)
+    expired = [e for e in events if e.attempts + 1 >= max_attempts]
+    pending = [e for e in events if e.attempts + 1 < max_attempts]
+    PaymentEvent.objects.filter(id__in=[e.id for e in events]).update(attempts=F("attempts") + 1)
+    if expired:
+        _dead(expired, f"{error} (tras {max_attempts} intentos)")
+    if pending:
+        attempts = max(e.attempts for e in pending) + 1
+        delay = min(getattr(settings, "PAYMENT_WEBHOOK_RETRY_BASE", 30) * 2 ** (attempts - 1), MAX_BACKOFF)
+        PaymentEvent.objects.filter(id__in=[e.id for e in pending]).update(
+            status="PENDING", last_error=error, next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        )
+    return "retry" if pending else "dead"
+
+
+def _apply(topic: str, resource_id: str, events, provider) -> str:
+    if topic != "payment" or not resource_id:
+        return _finish(events, "IGNORED", f"notificación {topic or 'sin tipo'} no se procesa")
+    try:
+        data = provider.get_payment(resource_id)
+    except payment_providers.ProviderError as exc:
+        return _retry(events, str(exc))
+    if data["status"] != "approved":
+        # Reembolsos y contracargos de pagos ya aplicados quedan para revisión manual
+        return _finish(events, "IGNORED", f"pago en estado {data['status']}")
+    try:
+        fee_id = int(data["external_reference"])
+    except (TypeError, ValueError):
+        return _dead(events, f"external_reference inválido: {data['external_reference']!r}")
+
+    external_id = f"{provider.name}:{resource_id}"
+    try:
+        with transaction.atomic():
+            # Bloquear la cuota serializa a los workers que procesan el mismo pago
+            if not Fee.objects.select_for_update().filter(pk=fee_id).exists():
+                return _dead(events, f"la cuota {fee_id} no existe")
+            payment_id = Payment.objects.filter(external_id=external_id).values_list("id", flat=True).first()
+            if payment_id is None:
+                payment_id = register_payment(
+                    fee_id, data["amount"], method="mercadopago", note=f"MercadoPago {resource_id}",
+                    external_id=external_id,
+                )["payment_id"]
+            return _finish(events, "DONE", payment_id=payment_id)
+    except Exception as exc:
+        return _retry(events, f"{type(exc).__name__}: {exc}")
+
+
+def process_batch(limit: int = 100, provider=None) -> dict:
+    """Procesa un lote de eventos vencidos. Devuelve {resultado: eventos} (done, ignored, retry, dead)."""
+    provider = provider or payment_providers.get_provider()
+    groups = defaultdict(list)
+    for event in claim(limit, provider.name):
+        groups[(event.topic, event.resource_id)].append(event)
+    result = defaultdict(int)
+    for (topic, resource_id), events in groups.items():
+        outcome = _apply(topic, resource_id, events, provider)
+        result[outcome] += len(events)
+        metrics.PAYMENT_EVENTS.inc(len(events), result=outcome)
+    return dict(result)
+
+
+def requeue_dead(ids=None) -> int:
+    """Vuelve a poner en cola los eventos descartados (todos o los ids indicados) con los intentos en cero"""
+    letters = PaymentDeadLetter.objects.all()
+    if ids:
+        letters = letters.filter(event_id__in=ids)
+    event_ids = list(letters.values_list("event_id", flat=True))
+    with transaction.atomic():
+        PaymentEvent.objects.filter(id__in=event_ids).update(
+            status="PENDING", attempts=0, next_attempt_at=timezone.now(), processed_at=None,
+        )
+        letters.filter(event_id__in=event_ids).delete()
+    return len(event_ids)
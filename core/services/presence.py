@@ -0,0 +1,153 @@
+from __future__ import annotations
+import asyncio
+from django.conf import settings
+from django.core.cache import cache
+from core.services import membership, metrics
+from core.services.chat import conversation_group_name
+from core.services.frames import encode_frame
+
+# Contadores de conexiones en el backend de caché de Django: con LocMem (por defecto) son
+# por proceso; configurando CACHES con Redis se comparten entre todos los workers.
+# Cada contador vence a los CHAT_PRESENCE_TTL segundos salvo que una conexión abierta lo renueve
+# (refresh_connection, cada WEBSOCKET_HEARTBEAT_INTERVAL): si un worker muere sin pasar por
+# disconnect, sus usuarios dejan de figurar online al vencer la clave.
+PRESENCE_KEY = "chat:presence:{conversation_id}:{user_id}"
+
+
+def _key(conversation_id: int, user_id: int) -> str:
+    return PRESENCE_KEY.format(conversation_id=conversation_id, user_id=user_id)
+
+
+def _ttl() -> int:
+    return getattr(settings, "CHAT_PRESENCE_TTL", 90)
+
+
+async def register_connection(conversation_id: int, user_id: int) -> bool:
+    """Suma una conexión del usuario. True si es la primera (hay que anunciar user_online)."""
+    key = _key(conversation_id, user_id)
+    await cache.aadd(key, 0, timeout=_ttl())
+    try:
+        first = await cache.aincr(key) == 1
+    except ValueError:
+        # La clave expiró o fue desalojada entre add e incr
+        await cache.aset(key, 1, timeout=_ttl())
+        return True
+    await cache.atouch(key, _ttl())
+    return first
+
+
+async def refresh_connection(conversation_id: int, user_id: int) -> None:
+    """Renueva el vencimiento del contador; si ya venció lo recrea con esta conexión."""
+    key = _key(conversation_id, user_id)
+    if not await cache.atouch(key, _ttl()):
+        await cache.aadd(key, 1, timeout=_ttl())
+
+
+async def unregister_connection(conversation_id: int, user_id: int) -> bool:
+    """Resta una conexión del usuario. True si era la última (hay que anunciar user_offline)."""
+    key = _key(conversation_id, user_id)
+    try:
+        remaining = await cache.adecr(key)
+    except ValueError:
+        return True
+    if remaining <= 0:
+        await cache.adelete(key)
+        return True
+    return False
+
+
+def online_user_ids(conversation_id: int) -> list[int]:
+    """Participantes de la conversación con al menos una conexión abierta."""
+    members = membership.get_members(conversation_id)
+    keys = {_key(conversation_id, user_id): user_id for user_id in members}
+    counts = cache.get_many(keys.keys())
+    return sorted(keys[key] for key, count in counts.items() if count and count > 0)
+
+
+class TypingCoalescer:
+    """
+    Agrupa los eventos de escritura por conversación durante una ventana corta y emite
+    un solo `typing_batch` por ventana. Los typing.start repetidos (uno por tecla) sólo
+    refrescan el estado y un start+stop dentro de la misma ventana se anulan. Quien no
+    envía typing.start durante `timeout` segundos pasa a typing.stop.
+    """
+
+    def __init__(self, window: float | None = None, timeout: float | None = None):
+        self.window = window if window is not None else getattr(settings, "CHAT_TYPING_WINDOW", 0.3)
+        self.timeout = timeout if timeout is not None else getattr(settings, "CHAT_TYPING_TIMEOUT", 5.0)
+        self._typing: dict[int, dict[int, float]] = {}
+        self._pending: dict[int, dict] = {}
+        self._flush_tasks: dict[int, asyncio.Task] = {}
+        self._expiry_tasks: dict[int, asyncio.Task] = {}
+
+    async def update(self, channel_layer, conversation_id: int, user_id: int, username: str, is_typing: bool) -> None:
+        now = asyncio.get_running_loop().time()
+        typing = self._typing.setdefault(conversation_id, {})
+        pending = self._pending.setdefault(conversation_id, {"started": {}, "stopped": set()})
+
+        if is_typing:
+            expires_at = typing.get(user_id)
+            typing[user_id] = now + self.timeout
+            task = self._expiry_tasks.get(conversation_id)
+            if task is None or task.done():
+                self._expiry_tasks[conversation_id] = asyncio.ensure_future(
+                    self._expire(channel_layer, conversation_id)
+                )
+            if expires_at is not None and expires_at > now:
+                return
+            pending["stopped"].discard(user_id)
+            pending["started"][user_id] = username
+        else:
+            if typing.pop(user_id, None) is None:
+                return
+            if pending["started"].pop(user_id, None) is None:
+                pending["stopped"].add(user_id)
+
+        if not pending["started"] and not pending["stopped"]:
+            return
+        task = self._flush_tasks.get(conversation_id)
+        if task is None or task.done():
+            self._flush_tasks[conversation_id] = asyncio.ensure_future(self._flush(channel_layer, conversation_id))
+
+    async def _expire(self, channel_layer, conversation_id: int) -> None:
+        """Emite typing.stop por los usuarios cuyo último typing.start ya venció."""
+        loop = asyncio.get_running_loop()
+        try:
+            while self._typing.get(conversation_id):
+                typing = self._typing[conversation_id]
+                now = loop.time()
+                expired = [user_id for user_id, expires_at in typing.items() if expires_at <= now]
+                if not expired:
+                    await asyncio.sleep(min(typing.values()) - now)
+                    continue
+                for user_id in expired:
+                    await self.update(channel_layer, conversation_id, user_id, "", False)
+        finally:
+            self._expiry_tasks.pop(conversation_id, None)
+
+    async def _flush(self, channel_layer, conversation_id: int) -> None:
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._flush_tasks.pop(conversation_id, None)
+            pending = self._pending.pop(conversation_id, None)
+            if not self._typing.get(conversation_id):
+                self._typing.pop(conversation_id, None)
+
+        if not pending or not (pending["started"] or pending["stopped"]):
+            return
+        with metrics.GROUP_SEND_LATENCY.time(event="typing_batch"):
+            await channel_layer.group_send(conversation_group_name(conversation_id), {
+                "type": "typing_batch",
+                "started": [
+                    {"user_id": uid, "frame": encode_frame("typing.start", {"user_id": uid, "username": name})}
+                    for uid, name in pending["started"].items()
+                ],
+                "stopped": [
+                    {"user_id": uid, "frame": encode_frame("typing.stop", {"user_id": uid})}
+                    for uid in sorted(pending["stopped"])
+                ],
+            })
+
+
+typing_coalescer = TypingCoalescer()
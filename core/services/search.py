@@ -0,0 +1,210 @@
+from __future__ import annotations
+import re
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from core.models import Conversation, Message, Notice
+
+# Índices invertidos creados en la migración 0015:
+#  - PostgreSQL: índices GIN de expresión sobre to_tsvector('spanish', ...), sin columnas extra.
+#  - SQLite: tablas FTS5 espejo (rowid = id del modelo), sincronizadas por señales.
+PG_CONFIG = "spanish"
+MESSAGE_FTS_TABLE = "core_message_fts"
+NOTICE_FTS_TABLE = "core_notice_fts"
+
+# Las expresiones deben coincidir literalmente con las de los índices para que el planner los use
+PG_MESSAGE_VECTOR = f"to_tsvector('{PG_CONFIG}', m.text)"
+PG_NOTICE_VECTOR = (
+    f"(setweight(to_tsvector('{PG_CONFIG}', n.title), 'A') || "
+    f"setweight(to_tsvector('{PG_CONFIG}', n.body), 'B'))"
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_fts5_tables: bool | None = None
+
+
+def backend() -> str:
+    """'postgresql', 'fts5' o 'basic' (icontains, sin índice) según la base de datos."""
+    if connection.vendor == "postgresql":
+        return "postgresql"
+    if connection.vendor == "sqlite" and _has_fts5_tables():
+        return "fts5"
+    return "basic"
+
+
+def _has_fts5_tables() -> bool:
+    global _fts5_tables
+    if _fts5_tables is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (%s, %s)",
+                [MESSAGE_FTS_TABLE, NOTICE_FTS_TABLE],
+            )
+            _fts5_tables = cursor.fetchone()[0] == 2
+    return _fts5_tables
+
+
+def fts5_query(query: str) -> str:
+    """
+    Convierte texto libre en una consulta FTS5 segura: cada término entre comillas (AND implícito)
+    y el último como prefijo, para que funcione mientras el usuario escribe.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return ""
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+# --- Sincronización del índice FTS5 (las señales sólo llaman a esto si backend() == 'fts5') ---
+
+def index_message(message: Message) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {MESSAGE_FTS_TABLE} WHERE rowid = %s", [message.pk])
+        if not message.is_deleted and message.text:
+            cursor.execute(
+                f"INSERT INTO {MESSAGE_FTS_TABLE} (rowid, text, conversation_id) VALUES (%s, %s, %s)",
+                [message.pk, message.text, message.conversation_id],
+            )
+
+
+def unindex_message(message_id: int) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {MESSAGE_FTS_TABLE} WHERE rowid = %s", [message_id])
+
+
+def index_notice(notice: Notice) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {NOTICE_FTS_TABLE} WHERE rowid = %s", [notice.pk])
+        cursor.execute(
+            f"INSERT INTO {NOTICE_FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)",
+            [notice.pk, notice.title, notice.body],
+        )
+
+
+def unindex_notice(notice_id: int) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {NOTICE_FTS_TABLE} WHERE rowid = %s", [notice_id])
+
+
+def rebuild_index() -> dict:
+    """Repuebla las tablas FTS5 (p. ej. tras bulk_create, que no dispara señales)."""
+    if backend() != "fts5":
+        return {"backend": backend(), "messages": None, "notices": None}
+    message_table = Message._meta.db_table
+    notice_table = Notice._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {MESSAGE_FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {MESSAGE_FTS_TABLE} (rowid, text, conversation_id) "
+            f"SELECT id, text, conversation_id FROM {message_table} WHERE is_deleted = 0 AND text <> ''"
+        )
+        messages = cursor.rowcount
+        cursor.execute(f"DELETE FROM {NOTICE_FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {NOTICE_FTS_TABLE} (rowid, title, body) SELECT id, title, body FROM {notice_table}"
+        )
+        notices = cursor.rowcount
+    return {"backend": "fts5", "messages": messages, "notices": notices}
+
+
+# --- Búsqueda ---
+
+def _ranked(queryset, rows):
+    """Carga los objetos de `rows` [(id, rank)] respetando el orden por relevancia."""
+    objects = queryset.in_bulk([pk for pk, _ in rows])
+    results = []
+    for pk, rank in rows:
+        obj = objects.get(pk)
+        if obj is not None:
+            obj.search_rank = rank
+            results.append(obj)
+    return results
+
+
+def search_messages(user, query: str, limit: int = 20, conversation_id: int | None = None) -> list[Message]:
+    """Mensajes que coinciden con `query`, sólo de conversaciones donde participa `user`, por relevancia."""
+    message_table = Message._meta.db_table
+    participants_table = Conversation.participants.through._meta.db_table
+    engine = backend()
+    conversation_filter = "AND m.conversation_id = %s" if conversation_id is not None else ""
+    extra = [conversation_id] if conversation_id is not None else []
+
+    if engine == "postgresql":
+        sql = (
+            f"SELECT m.id, ts_rank({PG_MESSAGE_VECTOR}, q) AS rank "
+            f"FROM {message_table} m "
+            f"JOIN {participants_table} p ON p.conversation_id = m.conversation_id AND p.user_id = %s, "
+            f"websearch_to_tsquery('{PG_CONFIG}', %s) q "
+            f"WHERE {PG_MESSAGE_VECTOR} @@ q AND NOT m.is_deleted {conversation_filter} "
+            f"ORDER BY rank DESC, m.id DESC LIMIT %s"
+        )
+        params = [user.id, query, *extra, limit]
+    elif engine == "fts5":
+        match = fts5_query(query)
+        if not match:
+            return []
+        # bm25() devuelve valores negativos: más negativo = más relevante
+        sql = (
+            f"SELECT m.id, -bm25({MESSAGE_FTS_TABLE}) AS rank "
+            f"FROM {MESSAGE_FTS_TABLE} "
+            f"JOIN {message_table} m ON m.id = {MESSAGE_FTS_TABLE}.rowid "
+            f"JOIN {participants_table} p ON p.conversation_id = m.conversation_id AND p.user_id = %s "
+            f"WHERE {MESSAGE_FTS_TABLE} MATCH %s AND m.is_deleted = 0 {conversation_filter} "
+            f"ORDER BY bm25({MESSAGE_FTS_TABLE}), m.id DESC LIMIT %s"
+        )
+        params = [user.id, match, *extra, limit]
+    else:
+        queryset = Message.objects.filter(
+            conversation__participants=user, is_deleted=False, text__icontains=query
+        )
+        if conversation_id is not None:
+            queryset = queryset.filter(conversation_id=conversation_id)
+        rows = [(pk, 1.0) for pk in queryset.order_by("-id").values_list("id", flat=True)[:limit]]
+        return _ranked(Message.objects.select_related("sender", "sender__profile"), rows)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return _ranked(Message.objects.select_related("sender", "sender__profile"), rows)
+
+
+def search_notices(query: str, limit: int = 20) -> list[Notice]:
+    """Avisos publicados que coinciden con `query`; el título pesa más que el cuerpo."""
+    notice_table = Notice._meta.db_table
+    engine = backend()
+    now = timezone.now()
+
+    if engine == "postgresql":
+        sql = (
+            f"SELECT n.id, ts_rank({PG_NOTICE_VECTOR}, q) AS rank "
+            f"FROM {notice_table} n, websearch_to_tsquery('{PG_CONFIG}', %s) q "
+            f"WHERE {PG_NOTICE_VECTOR} @@ q AND n.publish_date <= %s "
+            f"ORDER BY rank DESC, n.publish_date DESC LIMIT %s"
+        )
+        params = [query, now, limit]
+    elif engine == "fts5":
+        match = fts5_query(query)
+        if not match:
+            return []
+        sql = (
+            f"SELECT n.id, -bm25({NOTICE_FTS_TABLE}, 10.0, 1.0) AS rank "
+            f"FROM {NOTICE_FTS_TABLE} JOIN {notice_table} n ON n.id = {NOTICE_FTS_TABLE}.rowid "
+            f"WHERE {NOTICE_FTS_TABLE} MATCH %s AND n.publish_date <= %s "
+            f"ORDER BY bm25({NOTICE_FTS_TABLE}, 10.0, 1.0), n.publish_date DESC LIMIT %s"
+        )
+        params = [match, now, limit]
+    else:
+        queryset = Notice.objects.filter(Q(title__icontains=query) | Q(body__icontains=query), publish_date__lte=now)
+        rows = [(pk, 1.0) for pk in queryset.values_list("id", flat=True)[:limit]]
+        return _ranked(_notice_queryset(), rows)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return _ranked(_notice_queryset(), rows)
+
+
+def _notice_queryset():
+    return Notice.objects.select_related("created_by", "category").prefetch_related("viewed_by")
@@ -0,0 +1,247 @@
+from __future__ import annotations
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import (
+    AccessLog, DailyAccessStat, DailyIncidentStat, DailyVisitorStat, RollupDirtyDay, RollupWatermark,
+    SecurityIncident, Visitor,
+)
+
+# Rollups diarios para el reporte de seguridad: un año de reporte lee ~365 filas por tabla en vez de
+# recorrer SecurityIncident/AccessLog/Visitor. El refresco (manage.py refresh_security_rollups) sólo
+# recalcula los días tocados por filas nuevas desde la última marca de agua, más los días del margen
+# SECURITY_ROLLUP_LAG antes del refresco anterior (filas de transacciones que confirmaron tarde).
+# Editar o borrar una fila ya agregada marca su día en RollupDirtyDay (signals en core.signals); los UPDATE
+# y DELETE masivos no disparan signals y necesitan `refresh_security_rollups --rebuild`.
+# Los reportes leen de los rollups los días completos ya refrescados y de las tablas origen los extremos
+# parciales del rango, lo posterior al último refresco y los días marcados.
+
+_RESPONSE_TIME = ExpressionWrapper(F('resolved_at') - F('detected_at'), output_field=DurationField())
+
+
+def _incident_stats(queryset):
+    return queryset.values('incident_type').annotate(
+        count=Count('id'),
+        ai_detections=Count('id', filter=Q(confidence_score__isnull=False)),
+        resolved=Count('id', filter=Q(resolved_at__isnull=False)),
+        response_time=Sum(_RESPONSE_TIME, filter=Q(resolved_at__isnull=False)),
+    ).order_by()
+
+
+def _build_incidents(day, start, end):
+    return [
+        DailyIncidentStat(
+            day=day, incident_type=row['incident_type'], count=row['count'], ai_detections=row['ai_detections'],
+            resolved=row['resolved'],
+            response_seconds=row['response_time'].total_seconds() if row['response_time'] else 0.0,
+        )
+        for row in _incident_stats(SecurityIncident.objects.filter(detected_at__gte=start, detected_at__lt=end))
+    ]
+
+
+def _build_access(day, start, end):
+    rows = (
+        AccessLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .values('access_type', 'was_granted').annotate(count=Count('id')).order_by()
+    )
+    return [DailyAccessStat(day=day, **row) for row in rows]
+
+
+def _build_visitors(day, start, end):
+    rows = (
+        Visitor.objects.filter(entry_time__gte=start, entry_time__lt=end)
+        .values('visiting_unit').annotate(count=Count('id')).order_by()
+    )
+    return [DailyVisitorStat(day=day, unit_id=row['visiting_unit'], count=row['count']) for row in rows]
+
+
+# nombre: (modelo origen, campo de fecha, rollup, constructor de las filas de un día)
+SOURCES = {
+    'security_incidents': (SecurityIncident, 'detected_at', DailyIncidentStat, _build_incidents),
+    'access_logs': (AccessLog, 'timestamp', DailyAccessStat, _build_access),
+    'visitors': (Visitor, 'entry_time', DailyVisitorStat, _build_visitors),
+}
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    """[inicio, fin) del día en la zona del proyecto, la misma que usa TruncDate"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _local_date(value: datetime) -> date:
+    return timezone.localtime(value).date()
+
+
+def source_for(model):
+    """(nombre, campo de fecha) de la fuente de rollup del modelo, o None"""
+    for name, (source_model, field, _, _) in SOURCES.items():
+        if source_model is model:
+            return name, field
+    return None
+
+
+def mark_dirty(name: str, *values) -> None:
+    """Marca para recalcular los días de las fechas dadas en el rollup `name`"""
+    days = {_local_date(value) for value in values if value}
+    RollupDirtyDay.objects.bulk_create(
+        [RollupDirtyDay(source=name, day=day) for day in days], ignore_conflicts=True
+    )
+
+
+def _dirty_days(name, model, field, watermark, max_id, now) -> set[date]:
+    days = set(model.objects.filter(pk__gt=watermark.last_id, pk__lte=max_id).dates(field, 'day'))
+    if watermark.refreshed_at is not None:
+        # Filas con id <= marca de agua que confirmaron después del refresco anterior
+        lag = timedelta(seconds=getattr(settings, 'SECURITY_ROLLUP_LAG', 300))
+        day = _local_date(watermark.refreshed_at - lag)
+        while day <= _local_date(now):
+            days.add(day)
+            day += timedelta(days=1)
+        if name == 'security_incidents':
+            # Un incidente resuelto después cambia las métricas de respuesta de su día de detección
+            resolved = SecurityIncident.objects.filter(
+                pk__lte=watermark.last_id, resolved_at__gte=watermark.refreshed_at - lag
+            )
+            days.update(resolved.dates('detected_at', 'day'))
+    return days
+
+
+def refresh(rebuild: bool = False, sources=None) -> dict:
+    """
+    Recalcula los días pendientes de cada rollup y avanza su marca de agua.
+    Con rebuild se borran y se recalculan todos los días. Devuelve {fuente: días recalculados}.
+    """
+    result = {}
+    for name in sources or SOURCES:
+        model, field, rollup, build = SOURCES[name]
+        now = timezone.now()
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=name)
+            max_id = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            marked = list(RollupDirtyDay.objects.filter(source=name).values_list('id', 'day'))
+            if rebuild:
+                rollup.objects.all().delete()
+                days = set(model.objects.dates(field, 'day'))
+            else:
+                days = _dirty_days(name, model, field, watermark, max_id, now) | {day for _, day in marked}
+            for day in sorted(days):
+                start, end = day_bounds(day)
+                rollup.objects.filter(day=day).delete()
+                rollup.objects.bulk_create(build(day, start, end))
+            RollupDirtyDay.objects.filter(id__in=[pk for pk, _ in marked]).delete()
+            watermark.last_id = max_id if rebuild else max(max_id, watermark.last_id)
+            watermark.refreshed_at = now
+            watermark.save()
+        result[name] = len(days)
+    return result
+
+
+def _split_range(refreshed_at, start: datetime, end: datetime):
+    """
+    Días completos del rango ya cubiertos por el rollup ([first_day, last_day], o None) y el filtro para la
+    parte que hay que leer de la tabla origen (extremos parciales y lo posterior al último refresco).
+    """
+    if refreshed_at is None:
+        return None, None
+    first_day = _local_date(start)
+    if day_bounds(first_day)[0] < start:
+        first_day += timedelta(days=1)
+    # Último día que termina dentro del rango y antes del refresco
+    last_day = min(_local_date(end), _local_date(refreshed_at)) - timedelta(days=1)
+    if last_day < first_day:
+        return None, None
+    return (first_day, last_day), (day_bounds(first_day)[0], day_bounds(last_day)[1])
+
+
+def _raw(model, field, start, end, cover, marked=()):
+    """Filas del rango fuera de lo cubierto por el rollup, más las de los días marcados"""
+    queryset = model.objects.filter(**{f'{field}__range': [start, end]})
+    if cover is not None:
+        condition = ~Q(**{f'{field}__gte': cover[0], f'{field}__lt': cover[1]})
+        for day in marked:
+            day_start, day_end = day_bounds(day)
+            condition |= Q(**{f'{field}__gte': day_start, f'{field}__lt': day_end})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def security_summary(start: datetime, end: datetime) -> dict:
+    """Agregados del reporte de seguridad sobre [start, end], combinando rollups y tablas origen"""
+    start, end = (timezone.make_aware(v) if timezone.is_naive(v) else v for v in (start, end))
+    refreshed = dict(RollupWatermark.objects.filter(name__in=SOURCES).values_list('name', 'refreshed_at'))
+    marked = {name: set() for name in SOURCES}
+    if refreshed:
+        for name, day in RollupDirtyDay.objects.filter(day__range=[_local_date(start), _local_date(end)]).values_list(
+                'source', 'day'):
+            marked[name].add(day)
+    days, cover = _split_range(refreshed.get('security_incidents'), start, end)
+    incidents = {}
+    rollup_rows = []
+    if days:
+        rollup_rows = DailyIncidentStat.objects.filter(day__range=days).exclude(
+            day__in=marked['security_incidents']).values('incident_type').annotate(
+            count=Sum('count'), ai_detections=Sum('ai_detections'), resolved=Sum('resolved'),
+            response_seconds=Sum('response_seconds'),
+        ).order_by()
+    raw_rows = [
+        dict(row, response_seconds=row['response_time'].total_seconds() if row['response_time'] else 0.0)
+        for row in _incident_stats(_raw(SecurityIncident, 'detected_at', start, end, cover, marked['security_incidents']))
+    ]
+    for row in list(rollup_rows) + raw_rows:
+        totals = incidents.setdefault(row['incident_type'], dict.fromkeys(
+            ('count', 'ai_detections', 'resolved', 'response_seconds'), 0))
+        for key in totals:
+            totals[key] += row[key] or 0
+
+    days, cover = _split_range(refreshed.get('access_logs'), start, end)
+    access = {}
+    if days:
+        for row in DailyAccessStat.objects.filter(day__range=days).exclude(day__in=marked['access_logs']).values(
+                'access_type', 'was_granted').annotate(count=Sum('count')).order_by():
+            access[(row['access_type'], row['was_granted'])] = row['count']
+    for row in _raw(AccessLog, 'timestamp', start, end, cover, marked['access_logs']).values(
+            'access_type', 'was_granted').annotate(count=Count('id')).order_by():
+        key = (row['access_type'], row['was_granted'])
+        access[key] = access.get(key, 0) + row['count']
+
+    days, cover = _split_range(refreshed.get('visitors'), start, end)
+    visitors_by_day, visitors_by_unit = {}, {}
+    if days:
+        visitor_rows = DailyVisitorStat.objects.filter(day__range=days).exclude(day__in=marked['visitors'])
+        for row in visitor_rows.values('day').annotate(count=Sum('count')):
+            visitors_by_day[row['day']] = row['count']
+        for row in visitor_rows.values('unit__code').annotate(count=Sum('count')).order_by():
+            visitors_by_unit[row['unit__code']] = row['count']
+    raw_visitors = _raw(Visitor, 'entry_time', start, end, cover, marked['visitors'])
+    for row in raw_visitors.annotate(date=TruncDate('entry_time')).values('date').annotate(count=Count('id')).order_by():
+        visitors_by_day[row['date']] = visitors_by_day.get(row['date'], 0) + row['count']
+    for row in raw_visitors.values('visiting_unit__code').annotate(count=Count('id')).order_by():
+        code = row['visiting_unit__code']
+        visitors_by_unit[code] = visitors_by_unit.get(code, 0) + row['count']
+
+    resolved = sum(t['resolved'] for t in incidents.values())
+    response_seconds = sum(t['response_seconds'] for t in incidents.values())
+    return {
+        'total_incidents': sum(t['count'] for t in incidents.values()),
+        'ai_detections': sum(t['ai_detections'] for t in incidents.values()),
+        'avg_response_time_hours': round(response_seconds / resolved / 3600, 2) if resolved else 0,
+        'incidents_by_type': sorted(
+            ({'type': key, 'count': t['count']} for key, t in incidents.items()), key=lambda item: -item['count']
+        ),
+        'unauthorized_access': sum(count for (_, granted), count in access.items() if not granted),
+        'access_by_type': [
+            {'type': access_type, 'granted': granted, 'count': count}
+            for (access_type, granted), count in sorted(access.items(), key=lambda item: (item[0][0], not item[0][1]))
+        ],
+        'visitors_by_day': [{'date': day, 'count': count} for day, count in sorted(visitors_by_day.items())],
+        'visitors_by_unit': sorted(
+            ({'unit': code, 'count': count} for code, count in visitors_by_unit.items()),
+            key=lambda item: -item['count'],
+        ),
+    }
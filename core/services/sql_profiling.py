@@ -0,0 +1,198 @@
+from __future__ import annotations
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+
+# Límites superiores de los buckets (el último recoge todo lo que los supera)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SQL_TIME_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+TOP_DUPLICATES = 5
+SQL_PREVIEW_CHARS = 300
+
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*%s(?:\s*,\s*%s)+\s*\)")
+
+
+def sql_shape(sql: str) -> str:
+    """Forma de la consulta: el SQL ya viene parametrizado, sólo se colapsan listas IN (%s, %s, ...)."""
+    return _PLACEHOLDER_LIST_RE.sub("(%s, ...)", sql)
+
+
+class QueryCollector:
+    """
+    Wrapper para connection.execute_wrapper: cuenta consultas, tiempo SQL y repeticiones del mismo SQL
+    durante una petición. Se mantiene mínimo (dos perf_counter y un incremento) porque va en cada consulta.
+    """
+
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self) -> Counter:
+        """Formas de SQL ejecutadas más de una vez (el síntoma típico de un N+1)."""
+        shapes = Counter()
+        for sql, times in self.statements.items():
+            shapes[sql_shape(sql)] += times
+        return Counter({shape: times for shape, times in shapes.items() if times > 1})
+
+
+def _histogram(buckets):
+    return [0] * (len(buckets) + 1)
+
+
+class _Slot:
+    """Estadísticas de una ruta dentro de un tramo de tiempo de la ventana."""
+
+    __slots__ = ("started", "requests", "queries", "sql_ms", "max_queries", "max_sql_ms",
+                 "with_duplicates", "query_histogram", "time_histogram", "duplicates")
+
+    def __init__(self, started: int):
+        self.started = started
+        self.requests = 0
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.max_queries = 0
+        self.max_sql_ms = 0.0
+        self.with_duplicates = 0
+        self.query_histogram = _histogram(QUERY_COUNT_BUCKETS)
+        self.time_histogram = _histogram(SQL_TIME_BUCKETS_MS)
+        self.duplicates = Counter()
+
+
+class RollingProfile:
+    """
+    Histograma móvil por ruta: la ventana (SQL_PROFILING_WINDOW segundos) se divide en tramos de
+    SQL_PROFILING_SLOT segundos y los tramos vencidos se descartan al registrar o al consultar.
+    """
+
+    def __init__(self, window: int | None = None, slot: int | None = None):
+        self.window = window or getattr(settings, "SQL_PROFILING_WINDOW", 900)
+        self.slot = slot or getattr(settings, "SQL_PROFILING_SLOT", 60)
+        self._routes: dict[str, list[_Slot]] = {}
+        self._lock = threading.Lock()
+
+    def _current_slot(self, route: str, now: float) -> _Slot:
+        started = int(now // self.slot * self.slot)
+        slots = self._routes.setdefault(route, [])
+        if not slots or slots[-1].started != started:
+            slots.append(_Slot(started))
+            self._expire(slots, now)
+        return slots[-1]
+
+    def _expire(self, slots: list[_Slot], now: float) -> None:
+        horizon = now - self.window
+        while slots and slots[0].started + self.slot <= horizon:
+            slots.pop(0)
+
+    def record(self, route: str, queries: int, sql_ms: float, duplicates: Counter) -> None:
+        with self._lock:
+            slot = self._current_slot(route, time.time())
+            slot.requests += 1
+            slot.queries += queries
+            slot.sql_ms += sql_ms
+            slot.max_queries = max(slot.max_queries, queries)
+            slot.max_sql_ms = max(slot.max_sql_ms, sql_ms)
+            slot.query_histogram[bisect_left(QUERY_COUNT_BUCKETS, queries)] += 1
+            slot.time_histogram[bisect_left(SQL_TIME_BUCKETS_MS, sql_ms)] += 1
+            if duplicates:
+                slot.with_duplicates += 1
+                slot.duplicates.update(duplicates)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+    def report(self, sort: str = "queries") -> list[dict]:
+        """Resumen por ruta de la ventana actual, ordenado de más a menos costosa."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for route, slots in list(self._routes.items()):
+                self._expire(slots, now)
+                if not slots:
+                    del self._routes[route]
+                    continue
+                rows.append(self._summarize(route, slots))
+        key = {
+            "queries": lambda row: row["queries"]["avg"],
+            "sql_ms": lambda row: row["sql_ms"]["total"],
+            "requests": lambda row: row["requests"],
+            "duplicates": lambda row: row["duplicate_ratio"],
+        }.get(sort, lambda row: row["queries"]["avg"])
+        return sorted(rows, key=key, reverse=True)
+
+    def _summarize(self, route: str, slots: list[_Slot]) -> dict:
+        requests = sum(s.requests for s in slots)
+        queries = sum(s.queries for s in slots)
+        sql_ms = sum(s.sql_ms for s in slots)
+        query_histogram = [sum(column) for column in zip(*(s.query_histogram for s in slots))]
+        time_histogram = [sum(column) for column in zip(*(s.time_histogram for s in slots))]
+        duplicates = Counter()
+        for s in slots:
+            duplicates.update(s.duplicates)
+        return {
+            "route": route,
+            "requests": requests,
+            "queries": {
+                "avg": round(queries / requests, 2),
+                "p95": _bucket_percentile(query_histogram, QUERY_COUNT_BUCKETS, 0.95),
+                "max": max(s.max_queries for s in slots),
+            },
+            "sql_ms": {
+                "total": round(sql_ms, 2),
+                "avg": round(sql_ms / requests, 2),
+                "p95": _bucket_percentile(time_histogram, SQL_TIME_BUCKETS_MS, 0.95),
+                "max": round(max(s.max_sql_ms for s in slots), 2),
+            },
+            "duplicate_ratio": round(sum(s.with_duplicates for s in slots) / requests, 3),
+            "top_duplicates": [
+                {"sql": shape[:SQL_PREVIEW_CHARS], "executions": times}
+                for shape, times in duplicates.most_common(TOP_DUPLICATES)
+            ],
+            "histograms": {
+                "queries": _labeled(query_histogram, QUERY_COUNT_BUCKETS),
+                "sql_ms": _labeled(time_histogram, SQL_TIME_BUCKETS_MS),
+            },
+        }
+
+
+def _bucket_percentile(histogram: list[int], buckets, fraction: float):
+    """Límite superior del bucket donde cae el percentil (None si supera el último límite)."""
+    target = sum(histogram) * fraction
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= target and count:
+            return buckets[index] if index < len(buckets) else None
+    return None
+
+
+def _labeled(histogram: list[int], buckets) -> dict:
+    labels = [f"<={limit}" for limit in buckets] + [f">{buckets[-1]}"]
+    return dict(zip(labels, histogram))
+
+
+def server_timing(collector: QueryCollector, total_ms: float, duplicates: int) -> str:
+    return (
+        f'db;dur={collector.duration * 1000:.2f};desc="{collector.count} queries, {duplicates} dup", '
+        f"app;dur={total_ms:.2f}"
+    )
+
+
+# Un perfil por proceso (cada worker de gunicorn/daphne tiene el suyo)
+profile = RollingProfile()
@@ -0,0 +1,155 @@
+# core/signals.py
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user, revoke_claims
+from .models import AccessLog, Conversation, Fee, Message, Notice, Payment, Profile, SecurityIncident, Visitor
+from .services import ledger, membership, search, security_rollups
+from .services.chat import broadcast_to_conversation
+
+
+def _broadcast_removed(conversation_id, user_ids):
+    """Avisa al grupo (en todos los procesos) para que invaliden su caché y expulsen a los removidos."""
+    user_ids = sorted(user_ids)
+    transaction.on_commit(lambda: broadcast_to_conversation(conversation_id, {
+        'type': 'members_removed',
+        'user_ids': user_ids,
+    }))
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def conversation_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # Guardar quiénes estaban para poder expulsarlos tras el clear
+        if reverse:
+            instance._cleared_conversation_ids = list(instance.conversations.values_list('id', flat=True))
+        else:
+            instance._cleared_user_ids = list(instance.participants.values_list('id', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # user.conversations.add/remove/clear(...): pk_set son ids de conversación
+        conversation_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_conversation_ids', [])
+        for conversation_id in conversation_ids:
+            membership.invalidate(conversation_id)
+            if action != 'post_add':
+                _broadcast_removed(conversation_id, [instance.pk])
+        return
+
+    membership.invalidate(instance.pk)
+    if action == 'post_remove' and pk_set:
+        _broadcast_removed(instance.pk, pk_set)
+    elif action == 'post_clear':
+        removed = getattr(instance, '_cleared_user_ids', [])
+        if removed:
+            _broadcast_removed(instance.pk, removed)
+
+
+@receiver(post_delete, sender=Conversation)
+def conversation_deleted(sender, instance, **kwargs):
+    membership.invalidate(instance.pk)
+
+
+# Índice de búsqueda: en PostgreSQL lo mantiene el índice GIN; en SQLite hay que copiar a FTS5
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, **kwargs):
+    if search.backend() == 'fts5':
+        search.index_message(instance)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    if search.backend() == 'fts5':
+        search.unindex_message(instance.pk)
+
+
+@receiver(post_save, sender=Notice)
+def notice_saved(sender, instance, **kwargs):
+    if search.backend() == 'fts5':
+        search.index_notice(instance)
+
+
+@receiver(post_delete, sender=Notice)
+def notice_deleted(sender, instance, **kwargs):
+    if search.backend() == 'fts5':
+        search.unindex_notice(instance.pk)
+
+
+# Caché de usuarios de core.authentication: en este proceso se invalida al instante,
+# en los demás expira sola (AUTH_USER_CACHE_TTL). Si cambia algo que viaja en los claims del
+# token, los tokens ya emitidos dejan de usarse como fuente del usuario (revoke_claims).
+USER_CLAIM_FIELDS = {'username', 'is_active', 'is_staff', 'is_superuser'}
+PROFILE_CLAIM_FIELDS = {'role', 'full_name', 'user', 'user_id'}
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def user_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    if not created and (update_fields is None or USER_CLAIM_FIELDS & set(update_fields)):
+        revoke_claims(instance.pk)
+    else:
+        invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    if not created and (update_fields is None or PROFILE_CLAIM_FIELDS & set(update_fields)):
+        revoke_claims(instance.user_id)
+    else:
+        invalidate_user(instance.user_id)
+
+
+# Libro de saldos (UnitPeriodBalance): se actualiza en la misma transacción que la cuota o el pago
+LEDGER_KEY_FIELDS = {'unit', 'unit_id', 'expense_type', 'expense_type_id', 'period'}
+
+
+@receiver(pre_save, sender=Fee)
+def fee_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._ledger_previous_key = None
+    if instance.pk and (update_fields is None or LEDGER_KEY_FIELDS & set(update_fields)):
+        previous = Fee.objects.filter(pk=instance.pk).values_list('unit_id', 'expense_type_id', 'period').first()
+        if previous and previous != ledger.key_for(instance):
+            instance._ledger_previous_key = previous
+
+
+@receiver([post_save, post_delete], sender=Fee)
+def fee_changed(sender, instance, **kwargs):
+    ledger.fee_changed(instance, getattr(instance, '_ledger_previous_key', None))
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def payment_changed(sender, instance, **kwargs):
+    try:
+        fee = instance.fee
+    except Fee.DoesNotExist:
+        return
+    ledger.fee_changed(fee)
+
+
+# Rollups del reporte de seguridad: las filas nuevas las detecta la marca de agua; editar o borrar una fila
+# ya agregada marca su día (y el anterior, si cambió la fecha) para el próximo refresco
+ROLLUP_MODELS = [SecurityIncident, Visitor, AccessLog]
+
+
+def rollup_source_pre_save(sender, instance, update_fields=None, **kwargs):
+    _, field = security_rollups.source_for(sender)
+    instance._rollup_previous_day = None
+    if instance.pk and (update_fields is None or field in update_fields):
+        instance._rollup_previous_day = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+def rollup_source_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    name, field = security_rollups.source_for(sender)
+    security_rollups.mark_dirty(name, getattr(instance, field), getattr(instance, '_rollup_previous_day', None))
+
+
+for _model in ROLLUP_MODELS:
+    pre_save.connect(rollup_source_pre_save, sender=_model)
+    post_save.connect(rollup_source_changed, sender=_model)
+    post_delete.connect(rollup_source_changed, sender=_model)
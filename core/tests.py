@@ -1,3 +1,796 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import ws_auth
+from .authentication import ClaimsJWTAuthentication, invalidate_user
+from .hashers import FastPBKDF2PasswordHasher, ProductionPBKDF2PasswordHasher
+from .management.commands.bench_endpoints import ENDPOINTS
+from .models import (
+    AccessLog, ActivityLog, Conversation, ConversationReadState, DailyAccessStat, DailyIncidentStat, ExpenseType, Fee,
+    Message, MessageReadStatus, Payment, PaymentDeadLetter, PaymentEvent, Profile, SecurityIncident, Unit,
+    UnitPeriodBalance,
+)
+from .routing import websocket_urlpatterns
+from .serializers import ConversationSerializer
+from .services import (
+    attachments, fees, finance, ledger, log_partitions, membership, metrics, payment_import, payment_providers,
+    payment_webhooks, presence, security_rollups, sql_profiling,
+)
+from .services.chat import annotate_unread_counts, broadcast_to_conversation, get_read_watermark, mark_conversation_read
+from .tokens import CondoRefreshToken
+
+User = get_user_model()
+
+
+class ConversationListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='resident', password='x')
+        cls.other = User.objects.create_user(username='neighbour', password='x')
+        for i in range(100):
+            conversation = Conversation.objects.create(type='DIRECT', created_by=cls.user)
+            conversation.participants.add(cls.user, cls.other)
+            last = None
+            for n in range(3):
+                last = Message.objects.create(conversation=conversation, sender=cls.other, text=f'mensaje {n}')
+            Message.objects.create(conversation=conversation, sender=cls.user, text='respuesta')
+            conversation.update_last_message(last)
+            if i % 2 == 0:
+                # Leídos los dos primeros: queda 1 sin leer
+                ConversationReadState.objects.create(
+                    conversation=conversation, user=cls.user, last_read_message_id=last.id - 1
+                )
+
+    def test_serializing_100_conversations_uses_constant_queries(self):
+        request = APIRequestFactory().get('/api/conversations/')
+        request.user = self.user
+        queryset = annotate_unread_counts(
+            Conversation.objects.filter(participants=self.user).prefetch_related('participants'),
+            self.user,
+        )
+        # 1 consulta de conversaciones con anotaciones + 1 prefetch de participantes
+        with self.assertNumQueries(2):
+            data = ConversationSerializer(queryset, many=True, context={'request': request}).data
+
+        self.assertEqual(len(data), 100)
+        unread = sorted(item['unread_count'] for item in data)
+        self.assertEqual(unread[:50], [1] * 50)
+        self.assertEqual(unread[50:], [3] * 50)
+        self.assertTrue(all(item['last_message_preview'] == 'mensaje 2' for item in data))
+
+    def test_list_endpoint_query_count(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # count de paginación + página anotada + prefetch de participantes
+        with self.assertNumQueries(3):
+            response = client.get('/api/conversations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 100)
+
+
+class ReadStateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='resident', password='x')
+        self.other = User.objects.create_user(username='neighbour', password='x')
+        self.conversation = Conversation.objects.create(type='DIRECT', created_by=self.user)
+        self.conversation.participants.add(self.user, self.other)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, sender=self.other, text=f'mensaje {n}')
+            for n in range(3)
+        ]
+
+    def unread_count(self):
+        conversations = annotate_unread_counts(Conversation.objects.filter(pk=self.conversation.pk), self.user)
+        return conversations.get().unread_count_annotated
+
+    def test_reading_a_message_marks_the_previous_ones_as_read(self):
+        first, second, third = self.messages
+        second.mark_as_read_by(self.user)
+        self.assertTrue(first.is_read_by(self.user))
+        self.assertTrue(second.is_read_by(self.user))
+        self.assertFalse(third.is_read_by(self.user))
+        self.assertEqual(self.unread_count(), 1)
+
+        # Un recibo de un mensaje anterior no hace retroceder la marca de agua
+        first.mark_as_read_by(self.user)
+        self.assertEqual(get_read_watermark(self.conversation.id, self.user), second.id)
+        self.assertEqual(MessageReadStatus.objects.filter(user=self.user).count(), 2)
+
+    def test_mark_conversation_read_up_to_a_message(self):
+        Message.objects.create(conversation=self.conversation, sender=self.user, text='respuesta')
+        result = mark_conversation_read(self.conversation, self.user, up_to_message_id=self.messages[1].id)
+        self.assertEqual((result['count'], result['first_message_id']), (2, self.messages[0].id))
+        self.assertEqual(self.unread_count(), 1)
+
+        result = mark_conversation_read(self.conversation, self.user)
+        self.assertEqual(result['count'], 1)
+        self.assertEqual(self.unread_count(), 0)
+        self.assertEqual(mark_conversation_read(self.conversation, self.user)['count'], 0)
+
+    def test_migration_collapses_receipts_into_watermarks(self):
+        migration = importlib.import_module('core.migrations.0014_conversationreadstate')
+        other_conversation = Conversation.objects.create(type='DIRECT', created_by=self.user)
+        other_message = Message.objects.create(conversation=other_conversation, sender=self.other, text='hola')
+        for message in (self.messages[0], self.messages[2], other_message):
+            MessageReadStatus.objects.create(message=message, user=self.user)
+
+        migration.collapse_read_statuses(django_apps, None)
+        self.assertEqual(
+            dict(ConversationReadState.objects.filter(user=self.user)
+                 .values_list('conversation_id', 'last_read_message_id')),
+            {self.conversation.id: self.messages[2].id, other_conversation.id: other_message.id},
+        )
+
+
+class AttachmentUploadTests(TestCase):
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, ACTIVITY_LOG_ASYNC=False, MAX_UPLOAD_SIZE=1024))
+        self.user = User.objects.create_user(username='resident', password='x')
+        self.conversation = Conversation.objects.create(type='GROUP', created_by=self.user)
+        self.conversation.participants.add(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/conversations/{self.conversation.id}/attachments/'
+
+    def test_upload_creates_file_message_and_audit_entry(self):
+        upload = SimpleUploadedFile('acta.pdf', b'%PDF-1.4 ' * 50, content_type='application/pdf')
+        response = self.client.post(self.url, {'file': upload, 'text': ' acta de la reunión '}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        message = Message.objects.get(conversation=self.conversation)
+        self.assertEqual((message.type, message.text, message.attachment_size), ('FILE', 'acta de la reunión', 450))
+
+        # El archivo no va al detalle del log, el resto del formulario sí
+        log = ActivityLog.objects.get(user=self.user, path=self.url)
+        self.assertEqual(json.loads(log.details)['body'], {'text': [' acta de la reunión ']})
+
+    @mock.patch('core.services.attachments.close_old_connections')
+    def test_thumbnail_failure_is_logged_and_counted(self, _):
+        upload = SimpleUploadedFile('foto.jpg', b'no es un jpeg', content_type='image/jpeg')
+        # TestCase no ejecuta on_commit: la miniatura se genera a mano, en este hilo
+        message_id = self.client.post(self.url, {'file': upload}, format='multipart').data['id']
+        failures = metrics.CHAT_THUMBNAIL_FAILURES.snapshot().get('["UnidentifiedImageError"]', 0)
+        with self.assertLogs('core.services.attachments', 'ERROR'):
+            self.assertIsNone(attachments.generate_thumbnail(message_id))
+        self.assertEqual(metrics.CHAT_THUMBNAIL_FAILURES.snapshot()['["UnidentifiedImageError"]'], failures + 1)
+
+    def test_oversized_upload_is_rejected(self):
+        # Sin Content-Length confiable el archivo se corta mientras llega
+        upload = SimpleUploadedFile('foto.jpg', b'x' * 2048, content_type='image/jpeg')
+        self.assertEqual(self.client.post(self.url, {'file': upload}, format='multipart').status_code, 413)
+        # Con Content-Length excedido se rechaza antes de leer el cuerpo
+        upload = SimpleUploadedFile('video.mp4', b'x' * (70 * 1024), content_type='video/mp4')
+        self.assertEqual(self.client.post(self.url, {'file': upload}, format='multipart').status_code, 413)
+        self.assertFalse(Message.objects.filter(conversation=self.conversation).exists())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerTests(TestCase):
+    def setUp(self):
+        channel_layers.backends = {}
+        self.addCleanup(setattr, channel_layers, 'backends', {})
+        membership.invalidate()
+        self.addCleanup(membership.invalidate)
+        cache.clear()
+        self.user = User.objects.create_user(username='resident', password='x')
+        Profile.objects.create(user=self.user, full_name='Ana Pérez')
+        self.conversation = Conversation.objects.create(type='GROUP', created_by=self.user)
+        self.conversation.participants.add(self.user)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.conversation.id}/')
+        communicator.scope['user'] = user
+        return communicator, await communicator.connect()
+
+    async def test_message_is_saved_and_broadcast(self):
+        communicator, (connected, _) = await self.connect(self.user)
+        self.assertTrue(connected)
+        await communicator.send_json_to({'type': 'message.send', 'data': {'text': 'hola'}})
+        frame = await communicator.receive_json_from(timeout=2)
+        await communicator.disconnect()
+
+        self.assertEqual(frame['type'], 'message.new')
+        # Los datos del remitente salen de load_connection_state, sin consultas por mensaje
+        self.assertEqual(frame['data']['sender']['full_name'], 'Ana Pérez')
+        message = await Message.objects.aget(conversation=self.conversation)
+        self.assertEqual((message.id, message.text), (frame['data']['id'], 'hola'))
+        conversation = await Conversation.objects.aget(pk=self.conversation.pk)
+        self.assertEqual((conversation.last_message_preview, conversation.last_message_at), ('hola', message.created_at))
+
+    async def test_non_participant_is_rejected(self):
+        outsider = await User.objects.acreate(username='outsider')
+        communicator, (connected, code) = await self.connect(outsider)
+        self.assertEqual((connected, code), (False, 4001))
+
+    async def test_failed_save_rolls_back_and_is_counted(self):
+        communicator, _ = await self.connect(self.user)
+        errors = metrics.CHAT_MESSAGE_ERRORS.snapshot().get('["websocket"]', 0)
+        with mock.patch.object(Conversation, 'preview_for', side_effect=RuntimeError('sin preview')), \
+                self.assertLogs('core.consumers', 'ERROR'):
+            await communicator.send_json_to({'type': 'message.send', 'data': {'text': 'hola'}})
+            self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+        await communicator.disconnect()
+
+        # El mensaje se creó dentro de la transacción que falló: no queda ni él ni el preview
+        self.assertFalse(await Message.objects.filter(conversation=self.conversation).aexists())
+        conversation = await Conversation.objects.aget(pk=self.conversation.pk)
+        self.assertIsNone(conversation.last_message_at)
+        self.assertEqual(metrics.CHAT_MESSAGE_ERRORS.snapshot()['["websocket"]'], errors + 1)
+
+    def test_broadcast_failure_is_logged(self):
+        layer = channel_layers['default']
+        with mock.patch.object(layer, 'group_send', side_effect=RuntimeError('capa caída')), \
+                self.assertLogs('core.services.chat', 'ERROR') as logs:
+            broadcast_to_conversation(self.conversation.id, {'type': 'message_new', 'frame': '{}'})
+        self.assertIn(f'conversation {self.conversation.id}', logs.output[0])
+
+    def test_bench_chat_removes_its_fixtures(self):
+        call_command('bench_chat', messages=3, warmup=1, stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(username='bench_chat_sender').exists())
+        self.assertEqual(list(Conversation.objects.all()), [self.conversation])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class WebSocketJWTAuthTests(TestCase):
+    def setUp(self):
+        channel_layers.backends = {}
+        self.addCleanup(setattr, channel_layers, 'backends', {})
+        ws_auth._stubs.clear()
+        self.addCleanup(ws_auth._stubs.clear)
+        membership.invalidate()
+        self.addCleanup(membership.invalidate)
+        self.user = User.objects.create_user(username='resident', password='x')
+        self.conversation = Conversation.objects.create(type='GROUP', created_by=self.user)
+        self.conversation.participants.add(self.user)
+        self.app = ws_auth.JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+        self.path = f'/ws/chat/{self.conversation.id}/'
+
+    def token(self, lifetime=None):
+        access = CondoRefreshToken.for_user(self.user).access_token
+        if lifetime is not None:
+            access.set_exp(lifetime=lifetime)
+        return str(access)
+
+    async def test_token_in_query_string_or_subprotocol(self):
+        token = await sync_to_async(self.token)()
+        communicator = WebsocketCommunicator(self.app, f'{self.path}?token={token}')
+        self.assertEqual(await communicator.connect(), (True, None))
+        await communicator.disconnect()
+
+        communicator = WebsocketCommunicator(self.app, self.path, subprotocols=['jwt', token])
+        self.assertEqual(await communicator.connect(), (True, 'jwt'))
+        await communicator.disconnect()
+
+    async def test_missing_invalid_or_expired_token_is_rejected(self):
+        expired = await sync_to_async(self.token)(timedelta(seconds=-10))
+        for path in (self.path, f'{self.path}?token=no-es-un-jwt', f'{self.path}?token={expired}'):
+            connected, _ = await WebsocketCommunicator(self.app, path).connect()
+            self.assertFalse(connected, path)
+
+    async def test_connection_is_closed_when_the_token_expires(self):
+        token = await sync_to_async(self.token)(timedelta(seconds=1))
+        communicator = WebsocketCommunicator(self.app, f'{self.path}?token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        frame = await communicator.receive_json_from(timeout=3)
+        self.assertEqual((frame['type'], frame['data']['code']), ('error', 'TOKEN_EXPIRED'))
+        self.assertEqual(await communicator.receive_output(timeout=1), {'type': 'websocket.close', 'code': 4401})
+
+
+class MessageCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='resident', password='x')
+        self.conversation = Conversation.objects.create(type='GROUP', created_by=self.user)
+        self.conversation.participants.add(self.user)
+        self.ids = [
+            Message.objects.create(conversation=self.conversation, sender=self.user, text=f'mensaje {n}').id
+            for n in range(7)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/conversations/{self.conversation.id}/messages/'
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([m['id'] for m in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_walks_history_backwards_and_syncs_forward(self):
+        ids = self.ids
+        self.assertEqual(self.walk(f'{self.url}?page_size=3', 'previous'), [ids[4:], ids[1:4], ids[:1]])
+        # Un cliente WebSocket reconecta con el id del último mensaje que recibió
+        self.assertEqual(self.walk(f'{self.url}?page_size=3&since={ids[0]}', 'next'), [ids[1:4], ids[4:]])
+
+        response = self.client.get(f'{self.url}?since={ids[-1]}')
+        self.assertEqual((response.data['results'], response.data['sync_cursor']), ([], str(ids[-1])))
+        self.assertEqual(self.client.get(f'{self.url}?since=999999').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}?since={ids[0]}&before={ids[-1]}').status_code, 400)
+
+    def test_page_parameter_keeps_the_previous_format(self):
+        response = self.client.get(f'{self.url}?page=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual([m['id'] for m in response.data['results']], self.ids)
+        self.assertNotIn('sync_cursor', response.data)
+
+
+class MembershipCacheTests(TestCase):
+    def setUp(self):
+        membership.invalidate()
+        self.addCleanup(membership.invalidate)
+
+    def test_positives_are_cached_and_expire(self):
+        user = User.objects.create_user(username='resident', password='x')
+        conversation = Conversation.objects.create(type='DIRECT', created_by=user)
+        conversation.participants.add(user)
+        self.assertTrue(membership.is_member(conversation.id, user.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(membership.is_member(conversation.id, user.id))
+
+        # Baja hecha desde otro proceso: este no recibe la invalidación por signal
+        through = Conversation.participants.through
+        through.objects.filter(conversation=conversation, user=user).delete()
+        self.assertTrue(membership.is_member(conversation.id, user.id))  # caché todavía vigente
+        with override_settings(CHAT_MEMBERSHIP_TTL=0):
+            self.assertFalse(membership.is_member(conversation.id, user.id))
+
+    def test_misses_are_confirmed_against_the_database(self):
+        user = User.objects.create_user(username='resident', password='x')
+        conversation = Conversation.objects.create(type='DIRECT', created_by=user)
+        self.assertFalse(membership.is_member(conversation.id, user.id))
+        # Alta hecha desde otro proceso: la ausencia en la caché se vuelve a comprobar
+        Conversation.participants.through.objects.create(conversation=conversation, user=user)
+        self.assertTrue(membership.is_member(conversation.id, user.id))
+
+
+class _RecordingLayer:
+    def __init__(self):
+        self.events = []
+
+    async def group_send(self, group, event):
+        self.events.append(event)
+
+
+class PresenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def test_connection_counter_expires_unless_refreshed(self):
+        key = presence._key(1, 7)
+        now = time.time()
+        with override_settings(CHAT_PRESENCE_TTL=90):
+            self.assertTrue(await presence.register_connection(1, 7))
+            with mock.patch('time.time', return_value=now + 60):
+                await presence.refresh_connection(1, 7)
+            with mock.patch('time.time', return_value=now + 120):
+                self.assertEqual(await cache.aget(key), 1)
+            # Worker caído: nadie renueva la clave y el usuario deja de figurar online
+            with mock.patch('time.time', return_value=now + 200):
+                self.assertIsNone(await cache.aget(key))
+                await presence.refresh_connection(1, 7)
+                self.assertEqual(await cache.aget(key), 1)
+
+    async def test_typing_stop_is_emitted_when_timeout_expires(self):
+        layer = _RecordingLayer()
+        coalescer = presence.TypingCoalescer(window=0.01, timeout=0.05)
+        await coalescer.update(layer, 1, 7, 'ana', True)
+        await asyncio.sleep(0.02)
+        await coalescer.update(layer, 1, 7, 'ana', True)  # sigue escribiendo: sólo renueva
+        await asyncio.sleep(0.2)
+
+        self.assertEqual([[e['user_id'] for e in event['started']] for event in layer.events], [[7], []])
+        self.assertEqual([[e['user_id'] for e in event['stopped']] for event in layer.events], [[], [7]])
+        self.assertEqual(coalescer._expiry_tasks, {})
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_user()
+        self.user = User.objects.create_user(username='admin', password='x', is_staff=True)
+        self.profile = Profile.objects.create(user=self.user, role='ADMIN', full_name='Administración')
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/api/fees/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_claims_token_builds_the_user_without_queries(self):
+        token = CondoRefreshToken.for_user(self.user).access_token
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+        self.assertEqual((user.pk, user.is_staff, user.is_active, user.profile.role), (self.user.pk, True, True, 'ADMIN'))
+
+    def test_legacy_token_without_claims_reads_the_user(self):
+        with self.assertNumQueries(1):
+            user = self.authenticate(AccessToken.for_user(self.user))
+        self.assertEqual(user.profile.role, 'ADMIN')
+
+        token = AccessToken.for_user(self.user)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_demoted_or_deactivated_user_stops_using_issued_claims(self):
+        token = CondoRefreshToken.for_user(self.user).access_token
+        self.profile.role = 'RESIDENT'
+        self.profile.save()
+        self.assertEqual(self.authenticate(token).profile.role, 'RESIDENT')
+
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    @override_settings(AUTH_CLAIMS_MAX_AGE=-1)
+    def test_claims_of_old_tokens_are_rechecked(self):
+        with self.assertNumQueries(1):
+            self.authenticate(CondoRefreshToken.for_user(self.user).access_token)
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False)
+class LoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Vecino.Perez', email='Vecino@Condo.com', password='clave-segura')
+
+    def login(self, **credentials):
+        return APIClient().post('/api/auth/login/', {**credentials, 'password': 'clave-segura'}, format='json')
+
+    def test_username_and_email_are_case_insensitive(self):
+        for credentials in ({'username': 'vecino.perez'}, {'username': 'VECINO.PEREZ'}, {'email': 'vecino@condo.COM'}):
+            response = self.login(**credentials)
+            self.assertEqual(response.status_code, 200, credentials)
+            self.assertEqual(response.data['user']['id'], self.user.id)
+        self.assertEqual(ActivityLog.objects.filter(user=self.user, action='USER_LOGIN_SUCCESS').count(), 3)
+
+    def test_failed_audit_write_is_logged(self):
+        with mock.patch.object(ActivityLog.objects, 'create', side_effect=RuntimeError('sin disco')), \
+                self.assertLogs('core.services.audit', 'ERROR') as logs:
+            self.assertEqual(self.login(username='vecino.perez').status_code, 200)
+        self.assertIn('USER_LOGIN_SUCCESS', logs.output[0])
+
+    def test_wrong_password_or_unknown_user_is_rejected(self):
+        self.assertEqual(self.login(username='otro.vecino').status_code, 401)
+        response = APIClient().post('/api/auth/login/', {'username': 'vecino.perez', 'password': 'x'}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(PASSWORD_FAST_ITERATIONS=500, PASSWORD_HASH_ITERATIONS=2000, ACTIVITY_LOG_ASYNC=False)
+class PasswordHasherTests(TestCase):
+    def iterations(self, user):
+        user.refresh_from_db()
+        return identify_hasher(user.password).safe_summary(user.password)['iterations']
+
+    def test_iterations_follow_settings(self):
+        self.assertEqual(FastPBKDF2PasswordHasher().iterations, 500)
+        self.assertEqual(ProductionPBKDF2PasswordHasher().iterations, 2000)
+
+    def test_fast_profile_hash_is_upgraded_on_login(self):
+        with override_settings(PASSWORD_HASHERS=['core.hashers.FastPBKDF2PasswordHasher']):
+            user = User.objects.create_user(username='resident', password='clave-segura')
+        self.assertEqual(self.iterations(user), 500)
+
+        with override_settings(PASSWORD_HASHERS=['core.hashers.ProductionPBKDF2PasswordHasher']):
+            response = self.client.post('/api/auth/login/', {'username': 'resident', 'password': 'clave-segura'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.iterations(user), 2000)
+
+
+class SearchEndpointTests(TestCase):
+    def test_limit_is_bounded_and_validated(self):
+        user = User.objects.create_user(username='resident', password='x')
+        conversation = Conversation.objects.create(type='GROUP', created_by=user)
+        conversation.participants.add(user)
+        for n in range(30):
+            Message.objects.create(conversation=conversation, sender=user, text=f'reunión de consorcio {n}')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        for limit, expected in (('-1', 1), ('0', 1), ('5', 5), ('500', 30)):
+            response = client.get('/api/search/', {'q': 'reunión', 'scope': 'messages', 'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['messages']), expected)
+        response = client.get('/api/search/', {'q': 'reunión', 'limit': 'muchos'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False)
+class EndpointQueryBudgetTests(TestCase):
+    def test_hot_endpoints_stay_within_query_budget(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'endpoints.json')
+            # CommandError si algún endpoint responde != 200 o supera su presupuesto de consultas
+            call_command('bench_endpoints', scale=0.01, iterations=1, warmup=0, output=output, stdout=io.StringIO())
+            with open(output, encoding='utf-8') as f:
+                report = json.load(f)
+
+        self.assertEqual({r['name'] for r in report['endpoints']}, {name for name, *_ in ENDPOINTS})
+        self.assertTrue(all(r['ok'] for r in report['endpoints']))
+        self.assertGreater(report['dataset']['fee'], 0)
+
+    def test_rejects_invalid_iterations(self):
+        with self.assertRaises(CommandError):
+            call_command('bench_endpoints', iterations=0, stdout=io.StringIO())
+
+    def test_load_data_keeps_historical_timestamps(self):
+        call_command('generate_load_data', scale=0.01, tables='access_logs,messages', stdout=io.StringIO())
+        cutoff = timezone.now() - timedelta(days=30)
+        self.assertTrue(AccessLog.objects.filter(timestamp__lt=cutoff).exists())
+        self.assertTrue(Message.objects.filter(created_at__lt=cutoff).exists())
+        # Los Field del modelo no se tocan: las altas normales siguen sellando la hora actual
+        self.assertTrue(Message._meta.get_field('created_at').auto_now_add)
+        self.assertTrue(AccessLog._meta.get_field('timestamp').auto_now_add)
+
+
+@override_settings(SQL_PROFILING_ENABLED=True, ACTIVITY_LOG_ASYNC=False)
+class SQLProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        sql_profiling.profile.reset()
+        self.admin = User.objects.create_user(username='admin', password='x', is_staff=True)
+
+    def test_profiles_requests_by_route(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/conversations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+        report = client.get('/api/admin/sql-profile/').json()
+        routes = {row['route']: row for row in report['routes']}
+        self.assertEqual(routes['conversation-list']['requests'], 1)
+        self.assertGreater(routes['conversation-list']['queries']['max'], 0)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_exposes_http_metrics_by_route(self):
+        user = User.objects.create_user(username='admin', password='x', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user)
+        client.get('/api/conversations/')
+
+        self.client.force_login(user)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_requests_total{route="conversation-list",method="GET",status="200"}', body)
+
+    def test_requires_staff_without_token_in_production(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(User.objects.create_user(username='resident', password='x'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secreto')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto').status_code, 200)
+
+    def test_dead_worker_dumps_are_archived(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROC_DIR=directory):
+            # Por encima de pid_max (2**22): ningún proceso vivo tiene esos pids
+            for pid in (2 ** 22 + 1, 2 ** 22 + 2):
+                with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+                    json.dump({'pid': pid, 'metrics': {
+                        'chat_message_errors_total': {'["websocket"]': 2}, 'websocket_connections': {'[]': 5},
+                    }}, f)
+
+            # Más los errores que este mismo proceso ya haya contado
+            errors = metrics.CHAT_MESSAGE_ERRORS.snapshot().get('["websocket"]', 0) + 4
+            for _ in range(2):
+                body = metrics.render()
+                self.assertIn(f'chat_message_errors_total{{source="websocket"}} {errors}', body)
+                self.assertNotRegex(body, r'\nwebsocket_connections (5|10)\n')
+            self.assertEqual(
+                sorted(n for n in os.listdir(directory) if n.endswith('.json')),
+                sorted([metrics.ARCHIVE_FILE, f'{os.getpid()}.json']),
+            )
+
+
+class LogRetentionTests(TestCase):
+    def test_export_moves_expired_months_out_of_the_live_table(self):
+        old, recent = AccessLog.objects.bulk_create([AccessLog(access_type='MANUAL'), AccessLog(access_type='MANUAL')])
+        AccessLog.objects.filter(pk=old.pk).update(timestamp=timezone.now() - timedelta(days=120))
+        expired = log_partitions.expired_partitions(AccessLog, keep_months=2)
+        self.assertEqual([p.month for p in expired], [log_partitions.month_start(timezone.now() - timedelta(days=120))])
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('log_retention', months=2, tables='access', action='export', output_dir=directory,
+                         stdout=io.StringIO())
+            self.assertEqual(len(os.listdir(directory)), 1)
+        self.assertEqual(list(AccessLog.objects.values_list('pk', flat=True)), [recent.pk])
+
+
+class LogCursorPaginationTests(TestCase):
+    def test_walks_filtered_logs_newest_first_without_gaps(self):
+        admin = User.objects.create_user(username='admin', password='x', is_staff=True, is_superuser=True)
+        other = User.objects.create_user(username='other', password='x')
+        ActivityLog.objects.bulk_create(
+            [ActivityLog(user=admin if i % 2 else other, action='CREATE' if i % 3 else 'DELETE') for i in range(12)]
+        )
+        expected = list(
+            ActivityLog.objects.filter(user=admin, action='CREATE').order_by('-timestamp', '-id')
+            .values_list('id', flat=True)
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        seen, url = [], f'/api/activity-logs/?page_size=2&action=CREATE&user={admin.pk}'
+        while url:
+            body = client.get(url).json()
+            seen += [row['id'] for row in body['results']]
+            url = body['next']
+        self.assertEqual(seen, expected)
+        self.assertEqual(client.get('/api/activity-logs/?from=ayer').status_code, 400)
+
+
+class SecurityRollupTests(TestCase):
+    def test_report_combines_rollups_with_rows_after_the_last_refresh(self):
+        logs = AccessLog.objects.bulk_create([AccessLog(access_type='FACIAL', was_granted=False) for _ in range(3)])
+        AccessLog.objects.filter(pk__in=[log.pk for log in logs[:2]]).update(
+            timestamp=timezone.now() - timedelta(days=10)
+        )
+        security_rollups.refresh()
+        self.assertEqual(DailyAccessStat.objects.get(day=(timezone.now() - timedelta(days=10)).date()).count, 2)
+
+        AccessLog.objects.create(access_type='MANUAL', was_granted=False)
+        start, end = timezone.now() - timedelta(days=30), timezone.now()
+        self.assertEqual(security_rollups.security_summary(start, end)['unauthorized_access'], 4)
+        security_rollups.refresh()
+        self.assertEqual(security_rollups.security_summary(start, end)['unauthorized_access'], 4)
+
+    def test_edited_and_deleted_rows_on_refreshed_days_are_recomputed(self):
+        kept, deleted = SecurityIncident.objects.bulk_create([
+            SecurityIncident(incident_type='OTHER', description='x'),
+            SecurityIncident(incident_type='OTHER', description='y'),
+        ])
+        SecurityIncident.objects.update(detected_at=timezone.now() - timedelta(days=10))
+        security_rollups.refresh()
+        start, end = timezone.now() - timedelta(days=30), timezone.now()
+        self.assertEqual(security_rollups.security_summary(start, end)['total_incidents'], 2)
+
+        SecurityIncident.objects.get(pk=deleted.pk).delete()
+        kept = SecurityIncident.objects.get(pk=kept.pk)
+        kept.incident_type = 'LOOSE_PET'
+        kept.save()
+        expected = [{'type': 'LOOSE_PET', 'count': 1}]
+        self.assertEqual(security_rollups.security_summary(start, end)['incidents_by_type'], expected)
+        security_rollups.refresh()
+        self.assertEqual(security_rollups.security_summary(start, end)['incidents_by_type'], expected)
+        self.assertEqual(DailyIncidentStat.objects.get().incident_type, 'LOOSE_PET')
+
+
+class LedgerTests(TestCase):
+    def test_balances_follow_fees_and_payments(self):
+        owner = User.objects.create_user(username='owner', password='x')
+        Unit.objects.create(code='A-1', tower='A', number='1', owner=owner)
+        ExpenseType.objects.create(name='Expensas', amount_default=100)
+        self.assertEqual(fees.issue_fees('2025-01'), 1)
+        fee = Fee.objects.get()
+
+        fees.register_payment(fee.id, 30)
+        Fee.objects.filter(pk=fee.pk).update(status='OVERDUE')  # sin signals: el libro queda desfasado
+        self.assertEqual(ledger.check()['total_mismatches'], 1)
+
+        ledger.rebuild()
+        balance = UnitPeriodBalance.objects.get()
+        self.assertEqual((balance.issued, balance.paid, balance.outstanding, balance.overdue), (100, 30, 70, 70))
+        self.assertEqual(ledger.check()['total_mismatches'], 0)
+
+
+class FinanceMetricsTests(TestCase):
+    def test_partial_payments_do_not_inflate_issued(self):
+        owner = User.objects.create_user(username='owner', password='x')
+        Unit.objects.create(code='A-1', tower='A', number='1', owner=owner)
+        ExpenseType.objects.create(name='Expensas', amount_default=100)
+        fees.issue_fees('2025-01')
+        fee = Fee.objects.get()
+        fees.register_payment(fee.id, 30)
+        fees.register_payment(fee.id, 20)
+
+        summary = finance.fee_summary()
+        self.assertEqual((summary['issued'], summary['paid'], summary['outstanding']), (100, 50, 50))
+        self.assertEqual(summary['collection_rate'], 50.0)
+
+
+class PaymentImportTests(TestCase):
+    def test_import_matches_fees_and_reports_leftovers(self):
+        owner = User.objects.create_user(username='owner', password='x')
+        Unit.objects.create(code='A-1', tower='A', number='1', owner=owner)
+        ExpenseType.objects.create(name='Expensas', amount_default=100)
+        fees.issue_fees('2025-01')
+        statement = io.BytesIO(
+            'Fecha;Unidad;Periodo;Importe;Referencia\n'
+            '2025-01-05;A-1;2025-01;60,00;T1\n'
+            '2025-01-06;A-1;01/2025;60,00;T2\n'
+            '2025-01-06;Z-9;2025-01;10,00;T3\n'.encode()
+        )
+
+        report = payment_import.import_payments(statement)
+        self.assertEqual((report['matched'], report['payments_created'], report['fees_paid']), (2, 2, 1))
+        self.assertEqual([item['excess'] for item in report['overpaid']], [20])
+        self.assertEqual([item['reason'] for item in report['unmatched']], ['unidad desconocida'])
+        self.assertEqual(Fee.objects.get().status, 'PAID')
+        self.assertEqual(ledger.check()['total_mismatches'], 0)
+
+    def test_fees_of_the_whole_file_are_locked_in_one_query(self):
+        owner = User.objects.create_user(username='owner', password='x')
+        for number in ('1', '2'):
+            Unit.objects.create(code=f'A-{number}', tower='A', number=number, owner=owner)
+        ExpenseType.objects.create(name='Expensas', amount_default=100)
+        fees.issue_fees('2025-01')
+        statement = io.BytesIO(
+            'unidad,periodo,monto\nA-2,2025-01,100\nA-1,2025-01,100\nA-1,2025-01,10\n'.encode()
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            report = payment_import.import_payments(statement, batch_size=1)
+        # Las demás lecturas de core_fee son las agregaciones del libro de saldos
+        fee_locks = [q for q in queries if q['sql'].startswith('SELECT "core_fee"."id"')]
+        self.assertEqual(len(fee_locks), 1)
+        # La cuota saldada en un lote no vuelve a contarse en el siguiente
+        self.assertEqual((report['payments_created'], report['fees_paid']), (2, 2))
+        self.assertEqual([item['excess'] for item in report['overpaid']], [10])
+        self.assertEqual(ledger.check()['total_mismatches'], 0)
+
+
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        self.provider = payment_providers.StubProvider()
+        payment_providers.set_provider(self.provider)
+        self.addCleanup(payment_providers.set_provider, None)
+
+    @override_settings(PAYMENT_WEBHOOK_MAX_ATTEMPTS=1)
+    def test_replayed_webhooks_apply_each_payment_once(self):
+        owner = User.objects.create_user(username='owner', password='x')
+        Unit.objects.create(code='A-1', tower='A', number='1', owner=owner)
+        ExpenseType.objects.create(name='Expensas', amount_default=100)
+        fees.issue_fees('2025-01')
+        fee = Fee.objects.get()
+        payment_id = self.provider.pay(fee.id, 100, status='pending')
+        self.provider.update(payment_id, 'approved')
+        self.provider.notify('404', 'payment.created')  # pago que el proveedor no conoce
+
+        client = APIClient()
+        for notification in self.provider.recorded * 2:
+            query = '&'.join(f'{key}={value}' for key, value in notification['query'].items())
+            response = client.post(f'/api/payments/webhook/mercadopago/?{query}', notification['body'],
+                                   format='json', headers=notification['headers'])
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 3)
+
+        self.assertEqual(payment_webhooks.process_batch(), {'done': 2, 'dead': 1})
+        self.assertEqual(Payment.objects.get().external_id, f'mercadopago:{payment_id}')
+        self.assertEqual(Fee.objects.get().status, 'PAID')
+        self.assertEqual(PaymentDeadLetter.objects.count(), 1)
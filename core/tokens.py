@@ -0,0 +1,54 @@
+# core/tokens.py
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+
+def add_user_claims(token, user):
+    """
+    Claims de usuario para que la API (core.authentication) y el WebSocket (core.ws_auth)
+    construyan el usuario sin consultar la BD. `role` y `profile_id` son None si no tiene perfil.
+    """
+    profile = getattr(user, 'profile', None)
+    token['username'] = user.username
+    token['is_active'] = user.is_active
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+    token['role'] = profile.role if profile is not None else None
+    token['profile_id'] = profile.pk if profile is not None else None
+    token['full_name'] = profile.full_name if profile is not None else ''
+    return token
+
+
+class CondoRefreshToken(RefreshToken):
+    """RefreshToken con los claims de usuario; el access token derivado los hereda"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = add_user_claims(super().for_user(user), user)
+        token.user = user
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        # Al refrescar, releer rol y nombre: pudieron cambiar desde que se emitió el refresh token
+        user = getattr(self, 'user', None)
+        if user is None:
+            user = User.objects.select_related('profile').filter(
+                **{api_settings.USER_ID_FIELD: self[api_settings.USER_ID_CLAIM]}
+            ).first()
+        if user is not None:
+            add_user_claims(access, user)
+        return access
+
+
+class CondoTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = CondoRefreshToken
+
+
+class CondoTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CondoRefreshToken
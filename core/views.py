@@ -1,29 +1,28 @@
 # condominio_backend/core/views.py
 
 from django.contrib.auth import authenticate, get_user_model
-from django.db.models import Sum, Q, Value, F, Count, DecimalField
+from django.db.models import Count, Prefetch
 from django.conf import settings
-from django.db.models.functions import Coalesce
-from decimal import Decimal
 from rest_framework import viewsets, permissions, filters, status, serializers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.exceptions import PermissionDenied
 import mercadopago
 from django.db import models
 from django.utils import timezone
+from django.http import HttpResponse
 import os  # 👈 Para las variables de entorno como la API Key
 import base64  # 👈 Para procesar la imagen
+import hmac
 from openai import OpenAI  # 👈 Para usar la IA
 from rest_framework.decorators import api_view, permission_classes # 👈 Para crear la vista de API
 
 from .models import (
     ActivityLog, CommonArea, ExpenseType, FamilyMember, Fee, MaintenanceRequest,
     MaintenanceRequestComment, Notice, NoticeCategory, Notification,
-    Payment, Pet, Profile, Reservation, Unit, Vehicle, MaintenanceRequestAttachment,
+    Payment, Pet, Profile, Reservation, Unit, UnitPeriodBalance, Vehicle, MaintenanceRequestAttachment,
     Visitor, SecurityIncident
 )
 from .serializers import (
@@ -36,7 +35,13 @@ from .serializers import (
     UnitSerializer, UnitDetailSerializer, UserWithProfileSerializer, VehicleSerializer
 )
 from .permissions import IsAdmin, IsOwnerOrAdmin
+from .filters import filter_logs
+from .pagination import KeysetCursorPagination, LogPaginationMixin
+from .services import finance, payment_import, payment_providers, payment_webhooks
 from .services.fees import register_payment
+from .services.audit import get_client_ip, record_activity
+from .services.metrics import track_ai_call
+from .tokens import CondoRefreshToken
 
 User = get_user_model()
 
@@ -53,37 +58,16 @@ class LoginView(APIView):
         if not identifier or not password:
             return Response({"detail": "Faltan credenciales"}, status=status.HTTP_400_BAD_REQUEST)
         
-        user_lookup = {"email__iexact": identifier} if "@" in identifier else {"username__iexact": identifier}
-        user_obj = User.objects.filter(**user_lookup).first()
-        
-        if not user_obj:
-            return Response({"detail": "Credenciales inválidas"}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        user = authenticate(request, username=user_obj.username, password=password)
+        # Una sola consulta (índice lower(username)/lower(email)) y verificación sobre ese usuario
+        user = authenticate(request, username=identifier, password=password)
         
         if not user:
             return Response({"detail": "Credenciales inválidas"}, status=status.HTTP_401_UNAUTHORIZED)
         
-        # Obtener IP del cliente
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip_address = x_forwarded_for.split(',')[0]
-        else:
-            ip_address = request.META.get('REMOTE_ADDR')
-        
-        # Registrar login exitoso con detalles completos
-        ActivityLog.objects.create(
-            user=user,
-            action="USER_LOGIN_SUCCESS",
-            description=f"Inició sesión desde {ip_address}",
-            ip_address=ip_address,
-            user_agent=request.META.get('HTTP_USER_AGENT', '')[:500],
-            path=request.path,
-            method='POST',
-            session_key=request.session.session_key if hasattr(request, 'session') else ''
-        )
+        # Registrar login exitoso (una sola vez y fuera del hilo de la petición)
+        record_activity(request, user, "USER_LOGIN_SUCCESS", f"Inició sesión desde {get_client_ip(request)}")
         
-        refresh = RefreshToken.for_user(user)
+        refresh = CondoRefreshToken.for_user(user)
         return Response({
             "access": str(refresh.access_token),
             "refresh": str(refresh),
@@ -104,23 +88,10 @@ class LogoutView(APIView):
         logout_type = request.data.get('logout_type', 'manual')
         action = 'USER_LOGOUT_MANUAL' if logout_type == 'manual' else 'USER_LOGOUT_EXPIRED'
         
-        # Obtener IP del cliente
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip_address = x_forwarded_for.split(',')[0]
-        else:
-            ip_address = request.META.get('REMOTE_ADDR')
-        
         # Registrar logout con detalles
-        ActivityLog.objects.create(
-            user=request.user,
-            action=action,
-            description=f"Cerró sesión {'manualmente' if logout_type == 'manual' else 'por expiración de token'}",
-            ip_address=ip_address,
-            user_agent=request.META.get('HTTP_USER_AGENT', '')[:500],
-            path=request.path,
-            method='POST',
-            session_key=request.session.session_key if hasattr(request, 'session') else ''
+        record_activity(
+            request, request.user, action,
+            f"Cerró sesión {'manualmente' if logout_type == 'manual' else 'por expiración de token'}"
         )
         
         return Response({"detail": "Sesión cerrada correctamente."})
@@ -159,6 +130,20 @@ class UnitViewSet(viewsets.ModelViewSet):
     search_fields = ['code', 'tower', 'number', 'owner__username', 'owner__profile__full_name']
     ordering_fields = ['code', 'tower', 'number', 'owner__username']
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action == 'retrieve':
+            # El detalle anida dueño, cuotas con pagos y mantenimientos: precargar todo en bloque
+            qs = qs.prefetch_related(
+                "owner__vehicles", "owner__pets", "owner__family_members",
+                Prefetch("fees", queryset=Fee.objects.select_related("unit", "unit__owner", "expense_type")
+                         .prefetch_related("payments")),
+                Prefetch("maintenance_requests", queryset=MaintenanceRequest.objects.select_related(
+                    "unit", "reported_by", "assigned_to", "completed_by"
+                ).prefetch_related("comments__user", "attachments")),
+            )
+        return qs
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return UnitDetailSerializer
@@ -176,7 +161,7 @@ class ExpenseTypeViewSet(viewsets.ModelViewSet):
 
 
 class FeeViewSet(viewsets.ModelViewSet):
-    queryset = Fee.objects.select_related("unit", "expense_type", "unit__owner").all()
+    queryset = Fee.objects.select_related("unit", "expense_type", "unit__owner").prefetch_related("payments")
     serializer_class = FeeSerializer
     ordering = ["-issued_at"]
 
@@ -210,6 +195,24 @@ class FeeViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='import-payments', permission_classes=[IsAdmin],
+            parser_classes=[MultiPartParser])
+    def import_payments(self, request):
+        """Importación masiva de pagos (CSV o extracto bancario). ?dry_run=1 sólo concilia."""
+        uploaded_file = request.FILES.get('file')
+        if not uploaded_file:
+            return Response({"detail": "Falta el archivo."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            report = payment_import.import_payments(
+                uploaded_file,
+                method=request.data.get('method') or 'transfer',
+                source=uploaded_file.name,
+                dry_run=request.query_params.get('dry_run') == '1',
+            )
+        except payment_import.ImportFormatError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
 class NoticeCategoryViewSet(viewsets.ModelViewSet):
     queryset = NoticeCategory.objects.all()
     serializer_class = NoticeCategorySerializer
@@ -325,11 +328,19 @@ class FamilyMemberViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdmin]
 
 
-class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = ActivityLog.objects.all()
+class ActivityLogViewSet(LogPaginationMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Bitácora de actividad, de la más reciente a la más antigua, paginada por cursor (timestamp, id).
+    Filtros: ?from=&to=, ?user=<id>, ?action=<ACCION>[,<ACCION>...]
+    """
+    queryset = ActivityLog.objects.select_related('user', 'user__profile')
     serializer_class = ActivityLogSerializer
     permission_classes = [IsAdmin]
 
+    def get_queryset(self):
+        qs = filter_logs(super().get_queryset(), self.request.query_params, {'action': 'action'})
+        return qs.order_by('-timestamp', '-id')
+
 
 class PageAccessLogView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -344,19 +355,13 @@ class DashboardStatsView(APIView):
     permission_classes = [IsAdmin]
 
     def get(self, request):
-        from django.db.models import Count, Q
         from datetime import timedelta
         
         try:
-            # Calculamos los totales de todas las cuotas emitidas históricamente
-            fee_aggregates = Fee.objects.aggregate(
-                total_issued=Coalesce(Sum('amount'), Decimal('0.0')),
-                total_paid=Coalesce(Sum('payments__amount'), Decimal('0.0'))
-            )
-
-            total_issued = fee_aggregates['total_issued']
-            total_paid = fee_aggregates['total_paid']
-            total_outstanding = total_issued - total_paid
+            # Emitido/cobrado/pendiente y cuotas por estado en una sola consulta (core.services.finance)
+            fees_summary = finance.fee_summary()
+            total_issued = fees_summary['issued']
+            total_outstanding = fees_summary['outstanding']
 
             # --- NUEVA LÓGICA PARA LOS INDICADORES ---
             delinquency_rate = 0
@@ -366,12 +371,12 @@ class DashboardStatsView(APIView):
                 # Tasa de Morosidad: (Lo que se debe / Lo que se emitió) * 100
                 delinquency_rate = (total_outstanding / total_issued) * 100
                 # Tasa de Cobranza: (Lo que se pagó / Lo que se emitió) * 100
-                collection_rate = (total_paid / total_issued) * 100
+                collection_rate = fees_summary['collection_rate']
 
             # --- DATOS PARA GRÁFICAS ---
             
             # 1. Cuotas por estado
-            fees_by_status = list(Fee.objects.values('status').annotate(count=Count('id')))
+            fees_by_status = [{'status': item['status'], 'count': item['count']} for item in fees_summary['by_status']]
             
             # 2. Usuarios por rol
             users_by_role = list(Profile.objects.values('role').annotate(value=Count('id')))
@@ -447,7 +452,8 @@ class FinanceReportView(APIView):
         to_period = request.query_params.get('to')
         owner_id = request.query_params.get('owner')
 
-        queryset = Fee.objects.select_related('expense_type')
+        # Saldos precalculados por unidad/periodo/tipo (core.services.ledger): sin recorrer cuotas ni pagos
+        queryset = UnitPeriodBalance.objects.all()
 
         if from_period:
             queryset = queryset.filter(period__gte=from_period)
@@ -456,48 +462,16 @@ class FinanceReportView(APIView):
         if owner_id:
             queryset = queryset.filter(unit__owner_id=owner_id)
 
-        aggregates = queryset.aggregate(
-            issued=Coalesce(Sum('amount'), Value(0), output_field=DecimalField()),
-            paid=Coalesce(Sum('amount', filter=Q(status='PAID')), Value(0), output_field=DecimalField())
-        )
-        overall_issued = aggregates['issued']
-        overall_paid = aggregates['paid']
-        overall_outstanding = overall_issued - overall_paid
-
-        by_type = list(queryset.values('expense_type__name')
-            .annotate(
-                type=F('expense_type__name'),
-                count=Count('id'),
-                issued=Coalesce(Sum('amount'), Value(0), output_field=DecimalField()),
-                paid=Coalesce(Sum('amount', filter=Q(status='PAID')), Value(0), output_field=DecimalField())
-            )
-            .annotate(outstanding=F('issued') - F('paid'))
-            .values('type', 'count', 'issued', 'paid', 'outstanding')
-            .order_by('-issued')
-        )
-        
-        by_period = list(queryset.values('period')
-            .annotate(
-                issued=Coalesce(Sum('amount'), Value(0), output_field=DecimalField()),
-                paid=Coalesce(Sum('amount', filter=Q(status='PAID')), Value(0), output_field=DecimalField())
-            )
-            .values('period', 'issued', 'paid')
-            .order_by('period')
-        )
-
+        summary = finance.ledger_summary(queryset)
         data = {
-            "overall": {
-                "issued": float(overall_issued or 0),
-                "paid": float(overall_paid or 0),
-                "outstanding": float(overall_outstanding or 0),
-            },
+            "overall": {key: float(value) for key, value in summary["overall"].items()},
             "by_type": [
                 {**item, 'issued': float(item['issued']), 'paid': float(item['paid']), 'outstanding': float(item['outstanding'])}
-                for item in by_type
+                for item in summary["by_type"]
             ],
             "by_period": [
-                {**item, 'issued': float(item['issued']), 'paid': float(item['paid'])}
-                for item in by_period
+                {'period': item['period'], 'issued': float(item['issued']), 'paid': float(item['paid'])}
+                for item in summary["by_period"]
             ],
         }
         
@@ -511,28 +485,29 @@ class FeePaymentPreferenceView(APIView):
             fee_lookup = {'pk': fee_id}
             if not (hasattr(request.user, 'profile') and request.user.profile.role == 'ADMIN'):
                 fee_lookup['unit__owner'] = request.user
-            Fee.objects.get(**fee_lookup)
+            fee = Fee.objects.select_related('unit', 'expense_type').get(**fee_lookup)
         except Fee.DoesNotExist:
             return Response({"detail": "Cuota no encontrada."}, status=status.HTTP_404_NOT_FOUND)
 
-        fake_link = f"https://www.mercadopago.com.ar/pagar/con/qr/{fee_id}"
-        placeholder_qr_base64 = 'iVBORw0KGgoAAAANSUhEUgAAAQAAAAEAAQMAAABmvDolAAAABlBMVEX///8AAABVwtN+AAABbklEQVR4nO2WsQ3DMAxEFXqBJRgQ3QWLsAwLMEaowGBLYIZgCf5/lW6ECIZ/uW/yvB5k3zJ2lO/ncsP5P+H8IeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J8Q/hPCf0L4Twh/CeE/IfwnhP+E8J/s38A2gUzC8oVoRBAAAAAElFTkSuQmCC'
-        
-        mock_response = {
-            "init_point": fake_link,
-            "point_of_interaction": {
-                "transaction_data": {
-                    "qr_code_base64": placeholder_qr_base64
-                }
-            }
-        }
-        
-        return Response(mock_response, status=status.HTTP_200_OK)
+        try:
+            preference = payment_providers.get_provider().create_preference(
+                fee, notification_url=settings.MERCADOPAGO_NOTIFICATION_URL
+            )
+        except payment_providers.ProviderError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        return Response(preference, status=status.HTTP_200_OK)
 
 
 class MercadoPagoWebhookView(APIView):
+    """Guarda la notificación y responde enseguida; la aplica `manage.py process_payment_events`"""
     permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
     def post(self, request, *args, **kwargs):
+        if not payment_webhooks.verify_signature(request.headers, request.query_params):
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        body = request.data.dict() if hasattr(request.data, 'dict') else request.data
+        payment_webhooks.enqueue(body if isinstance(body, dict) else {}, request.query_params.dict(), request.headers)
         return Response(status=status.HTTP_200_OK)
     
 # ... (al final del archivo, después de MercadoPagoWebhookView)
@@ -574,7 +549,7 @@ def vehicle_recognition_view(request):
         image_data_url = f"data:{image_file.content_type};base64,{image_base64}"
 
         # 2. Enviar la imagen a la IA con un prompt específico para OCR de placas
-        completion = client.chat.completions.create(
+        completion = track_ai_call('recognize-vehicle', client.chat.completions.create,
             extra_headers={
                 "HTTP-Referer": os.getenv("SITE_URL", ""),
                 "X-Title": os.getenv("SITE_NAME", ""),
@@ -667,6 +642,11 @@ class OccupancyReportView(APIView):
 # --- ViewSets para Chat ---
 from .serializers import ConversationSerializer, MessageSerializer
 from .models import Conversation, Message, MessageReadStatus
+from .services.chat import annotate_unread_counts, mark_conversation_read, broadcast_messages_read
+from .services.presence import online_user_ids
+from .services import search
+from .services.attachments import content_length_exceeds_limit, create_attachment_message, install_upload_handlers
+from .services import metrics, sql_profiling
 
 class ConversationViewSet(viewsets.ModelViewSet):
     serializer_class = ConversationSerializer
@@ -674,9 +654,10 @@ class ConversationViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Solo mostrar conversaciones donde el usuario es participante
-        return Conversation.objects.filter(
+        queryset = Conversation.objects.filter(
             participants=self.request.user
         ).prefetch_related('participants').order_by('-last_message_at')
+        return annotate_unread_counts(queryset, self.request.user)
     
     def perform_create(self, serializer):
         conversation = serializer.save()
@@ -686,34 +667,52 @@ class ConversationViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def mark_all_as_read(self, request, pk=None):
-        """Marcar todos los mensajes de la conversación como leídos"""
+        """Marcar todos los mensajes de la conversación como leídos (opcionalmente hasta up_to_message_id)"""
         conversation = self.get_object()
-        messages = conversation.messages.exclude(sender=request.user)
+        up_to_message_id = request.data.get('up_to_message_id')
+        if up_to_message_id is not None:
+            try:
+                up_to_message_id = int(up_to_message_id)
+            except (TypeError, ValueError):
+                return Response({'detail': 'up_to_message_id debe ser un entero.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        for message in messages:
-            MessageReadStatus.objects.get_or_create(
-                message=message,
-                user=request.user
-            )
+        result = mark_conversation_read(conversation, request.user, up_to_message_id=up_to_message_id)
+        if result['count']:
+            broadcast_messages_read(result)
         
-        return Response({'status': 'marked as read'})
+        return Response({'status': 'marked as read', **result})
+    
+    @action(detail=True, methods=['get'])
+    def online(self, request, pk=None):
+        """Participantes de la conversación conectados por WebSocket"""
+        conversation = self.get_object()
+        return Response({
+            'conversation_id': conversation.id,
+            'online_user_ids': online_user_ids(conversation.id),
+        })
     
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
-        """Obtener mensajes de una conversación"""
+        """
+        Obtener mensajes de una conversación con paginación por cursor (created_at, id).
+        `?before=<cursor>` pagina hacia atrás; `?since=<cursor|message_id>` devuelve lo
+        posterior, para que un cliente WebSocket recupere lo perdido al reconectar.
+        """
         conversation = self.get_object()
-        messages = conversation.messages.select_related('sender').order_by('created_at')
+        messages = conversation.messages.select_related('sender', 'sender__profile')
         
-        # Paginación
-        page = self.paginate_queryset(messages)
-        if page is not None:
+        # Compatibilidad con clientes que aún paginan con ?page=
+        if 'page' in request.query_params:
+            page = self.paginate_queryset(messages.order_by('created_at', 'id'))
             serializer = MessageSerializer(page, many=True)
             return self.get_paginated_response(serializer.data)
         
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        paginator = KeysetCursorPagination()
+        page = paginator.paginate_queryset(messages, request, view=self)
+        serializer = MessageSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
-    @action(detail=True, methods=['post'], url_path='messages')
+    @messages.mapping.post
     def create_message(self, request, pk=None):
         """Crear un mensaje en una conversación"""
         conversation = self.get_object()
@@ -730,6 +729,33 @@ class ConversationViewSet(viewsets.ModelViewSet):
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['post'], url_path='attachments', parser_classes=[MultiPartParser])
+    def upload_attachment(self, request, pk=None):
+        """
+        Sube un adjunto (campo `file`, `text` opcional) como mensaje de la conversación.
+        El archivo se escribe a disco por trozos y se corta al superar MAX_UPLOAD_SIZE;
+        el mensaje se emite por WebSocket al instante y la miniatura llega después.
+        """
+        conversation = self.get_object()
+        
+        # Rechazar por Content-Length antes de leer el cuerpo
+        if content_length_exceeds_limit(request):
+            return Response({'detail': f'El archivo supera el máximo de {settings.MAX_UPLOAD_SIZE} bytes.'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        
+        limiter = install_upload_handlers(request)
+        uploaded_file = request.FILES.get('file')
+        if limiter.exceeded:
+            return Response({'detail': f'El archivo supera el máximo de {settings.MAX_UPLOAD_SIZE} bytes.'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if uploaded_file is None:
+            return Response({'detail': 'Debe enviar un archivo en el campo "file".'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        message = create_attachment_message(conversation, request.user, uploaded_file,
+                                            text=request.data.get('text', '').strip())
+        return Response(MessageSerializer(message, context={'request': request}).data,
+                        status=status.HTTP_201_CREATED)
 
 
 class MessageViewSet(viewsets.ModelViewSet):
@@ -743,19 +769,94 @@ class MessageViewSet(viewsets.ModelViewSet):
         ).select_related('sender', 'conversation').order_by('-created_at')
     
     def perform_create(self, serializer):
-        serializer.save(sender=self.request.user)
+        message = serializer.save(sender=self.request.user)
+        # Mantener el preview desnormalizado que usa el listado de conversaciones
+        message.conversation.update_last_message(message)
+        metrics.CHAT_MESSAGES.inc(source='rest')
     
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
         """Marcar un mensaje como leído"""
         message = self.get_object()
-        MessageReadStatus.objects.get_or_create(
-            message=message,
-            user=request.user
-        )
+        message.mark_as_read_by(request.user)
         return Response({'status': 'marked as read'})
 
 
+class SearchView(APIView):
+    """
+    Búsqueda de texto completo en mensajes de chat (sólo conversaciones del usuario) y avisos.
+    Parámetros: q (obligatorio), scope=all|messages|notices, conversation, limit (entre 1 y 100).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            return Response({'detail': 'El parámetro q debe tener al menos 2 caracteres.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        scope = request.query_params.get('scope', 'all')
+        if scope not in ('all', 'messages', 'notices'):
+            return Response({'detail': 'scope debe ser all, messages o notices.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+            conversation_id = request.query_params.get('conversation')
+            conversation_id = int(conversation_id) if conversation_id else None
+        except ValueError:
+            return Response({'detail': 'limit y conversation deben ser enteros.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = {'query': query, 'backend': search.backend()}
+        if scope in ('all', 'messages'):
+            messages = search.search_messages(request.user, query, limit=limit, conversation_id=conversation_id)
+            data['messages'] = [
+                {**MessageSerializer(m, context={'request': request}).data, 'rank': m.search_rank} for m in messages
+            ]
+        if scope in ('all', 'notices'):
+            notices = search.search_notices(query, limit=limit)
+            data['notices'] = [
+                {**NoticeSerializer(n, context={'request': request}).data, 'rank': n.search_rank} for n in notices
+            ]
+        return Response(data)
+
+
+class SQLProfileView(APIView):
+    """
+    Resumen del perfilado SQL por ruta en la ventana móvil de este proceso (SQL_PROFILING_ENABLED).
+    GET ?sort=queries|sql_ms|requests|duplicates&limit=N; DELETE reinicia las estadísticas.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            return Response({'detail': 'limit debe ser un entero.'}, status=status.HTTP_400_BAD_REQUEST)
+        routes = sql_profiling.profile.report(sort=request.query_params.get('sort', 'queries'))
+        return Response({
+            'enabled': getattr(settings, 'SQL_PROFILING_ENABLED', False),
+            'window_seconds': sql_profiling.profile.window,
+            'pid': os.getpid(),
+            'routes': routes[:limit],
+        })
+
+    def delete(self, request):
+        sql_profiling.profile.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def metrics_view(request):
+    """
+    Métricas de todos los workers en formato de texto de Prometheus. Con METRICS_TOKEN exige
+    "Authorization: Bearer <token>"; sin token sólo son públicas con DEBUG, si no requieren sesión de staff.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG and not request.user.is_staff:
+        return HttpResponse(status=401 if request.user.is_anonymous else 403)
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 # Vista de prueba para exportación
 class TestExportView(APIView):
     permission_classes = [IsAdmin]
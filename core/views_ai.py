@@ -7,6 +7,7 @@ import os
 import base64
 import json
 from decimal import Decimal
+from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.db.models import Avg, Count, Q
 from rest_framework import viewsets, permissions, status
@@ -17,13 +18,18 @@ from openai import OpenAI
 
 from .models import (
     FaceEncoding, Visitor, SecurityIncident, AccessLog,
-    Vehicle, Fee, User, Unit, Notification
+    Vehicle, Fee, Unit, Notification
 )
 from .serializers import (
     FaceEncodingSerializer, VisitorSerializer, SecurityIncidentSerializer,
     AccessLogSerializer
 )
+from .filters import filter_logs
+from .pagination import LogPaginationMixin
 from .permissions import IsAdmin
+from .services.metrics import track_ai_call
+
+User = get_user_model()
 
 # Configuración del cliente de IA
 try:
@@ -78,7 +84,7 @@ def facial_recognition_view(request):
         resident_names = ", ".join([u.profile.full_name or u.username for u in residents[:20]])
 
         # Llamar a la IA para identificar a la persona
-        completion = client.chat.completions.create(
+        completion = track_ai_call('recognize-face', client.chat.completions.create,
             extra_headers={
                 "HTTP-Referer": os.getenv("SITE_URL", ""),
                 "X-Title": os.getenv("SITE_NAME", ""),
@@ -209,7 +215,7 @@ def register_visitor_with_ai(request):
         image_data_url = f"data:{image_file.content_type};base64,{image_base64}"
 
         # Llamar a la IA para analizar al visitante
-        completion = client.chat.completions.create(
+        completion = track_ai_call('register-visitor', client.chat.completions.create,
             extra_headers={
                 "HTTP-Referer": os.getenv("SITE_URL", ""),
                 "X-Title": os.getenv("SITE_NAME", ""),
@@ -353,7 +359,7 @@ def detect_anomaly(request):
         image_data_url = f"data:{image_file.content_type};base64,{image_base64}"
 
         # Llamar a la IA para detectar anomalías
-        completion = client.chat.completions.create(
+        completion = track_ai_call('detect-anomaly', client.chat.completions.create,
             extra_headers={
                 "HTTP-Referer": os.getenv("SITE_URL", ""),
                 "X-Title": os.getenv("SITE_NAME", ""),
@@ -451,25 +457,23 @@ def detect_anomaly(request):
 # LOGS DE ACCESO
 # ============================================
 
-class AccessLogViewSet(viewsets.ReadOnlyModelViewSet):
-    """Visualización de logs de acceso"""
-    queryset = AccessLog.objects.all().order_by('-timestamp')
+class AccessLogViewSet(LogPaginationMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Visualización de logs de acceso, paginada por cursor (timestamp, id).
+    Filtros: ?from=&to=, ?user=<id>, ?type=<TIPO>[,<TIPO>...], ?granted=1|0
+    """
+    queryset = AccessLog.objects.select_related('user', 'visitor')
     serializer_class = AccessLogSerializer
     permission_classes = [IsAdmin]
 
     def get_queryset(self):
-        qs = super().get_queryset()
-        
-        # Filtros opcionales
-        access_type = self.request.query_params.get('type')
-        if access_type:
-            qs = qs.filter(access_type=access_type)
+        qs = filter_logs(super().get_queryset(), self.request.query_params, {'type': 'access_type'})
         
         granted = self.request.query_params.get('granted')
         if granted:
             qs = qs.filter(was_granted=(granted == '1'))
         
-        return qs
+        return qs.order_by('-timestamp', '-id')
 
 
 # ============================================
@@ -484,31 +488,40 @@ def predict_delinquency(request):
     usando análisis de patrones históricos.
     """
     try:
-        # Obtener todos los residentes con sus estadísticas de pago
-        residents = User.objects.filter(profile__role='RESIDENT', is_active=True)
-        predictions = []
+        from datetime import date
+        # Estadísticas de pago de todos los residentes en una sola consulta agregada
+        residents = (
+            User.objects.filter(profile__role='RESIDENT', is_active=True)
+            .select_related('profile')
+            .annotate(
+                total_fees=Count('units__fees'),
+                paid_fees=Count('units__fees', filter=Q(units__fees__status='PAID')),
+                overdue_fees=Count('units__fees', filter=Q(units__fees__status='OVERDUE')),
+            )
+            .filter(total_fees__gt=0)
+        )
+
+        # Días de retraso acumulados por residente, agrupando las cuotas vencidas por fecha de vencimiento
+        today = date.today()
+        overdue_days = {}
+        overdue_by_due_date = (
+            Fee.objects.filter(status='OVERDUE', due_date__isnull=False)
+            .values_list('unit__owner_id', 'due_date')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for owner_id, due_date, count in overdue_by_due_date:
+            overdue_days[owner_id] = overdue_days.get(owner_id, 0) + (today - due_date).days * count
 
+        predictions = []
         for resident in residents:
-            # Obtener cuotas del residente
-            fees = Fee.objects.filter(unit__owner=resident)
-            total_fees = fees.count()
-            
-            if total_fees == 0:
-                continue
+            total_fees = resident.total_fees
+            paid_fees = resident.paid_fees
+            overdue_fees = resident.overdue_fees
+            payment_rate = (paid_fees / total_fees) * 100
 
-            # Calcular métricas
-            paid_fees = fees.filter(status='PAID').count()
-            overdue_fees = fees.filter(status='OVERDUE').count()
-            payment_rate = (paid_fees / total_fees) * 100 if total_fees > 0 else 0
-            
             # Calcular días promedio de retraso
-            overdue_days_avg = 0
-            if overdue_fees > 0:
-                from datetime import date
-                overdue_list = fees.filter(status='OVERDUE', due_date__isnull=False)
-                if overdue_list.exists():
-                    total_days = sum([(date.today() - f.due_date).days for f in overdue_list])
-                    overdue_days_avg = total_days / overdue_fees
+            overdue_days_avg = overdue_days.get(resident.id, 0) / overdue_fees if overdue_fees > 0 else 0
 
             # Calcular score de riesgo (0-100, donde 100 es alto riesgo)
             risk_score = 0
@@ -603,7 +616,7 @@ def analyze_image_with_ai(request):
         image_data_url = f"data:{image_file.content_type};base64,{image_base64}"
 
         # Llamar a la IA
-        completion = client.chat.completions.create(
+        completion = track_ai_call('analyze-image', client.chat.completions.create,
             extra_headers={
                 "HTTP-Referer": os.getenv("SITE_URL", ""),
                 "X-Title": os.getenv("SITE_NAME", ""),
@@ -3,10 +3,9 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
 from django.db.models import Sum, Count, Avg, Q, F
-from django.db.models.functions import TruncMonth, TruncDate
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
 from datetime import timedelta, datetime
-from decimal import Decimal
 import csv
 import io
 from django.http import HttpResponse
@@ -20,10 +19,11 @@ from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.chart import BarChart, PieChart, LineChart, Reference
 
 from .models import (
-    Fee, Payment, MaintenanceRequest, Visitor, SecurityIncident,
-    Reservation, Unit, User, ActivityLog, AccessLog
+    Fee, Payment, MaintenanceRequest,
+    Reservation, Unit, UnitPeriodBalance, User, ActivityLog
 )
 from .permissions import IsAdmin
+from .services import finance, security_rollups
 
 
 class AdvancedReportsView(APIView):
@@ -59,69 +59,39 @@ class AdvancedReportsView(APIView):
 
     def get_financial_report(self, start_date, end_date):
         """Reporte financiero detallado"""
-        # Ingresos por mes
-        income_by_month = Payment.objects.filter(
-            paid_at__range=[start_date, end_date]
-        ).annotate(
-            month=TruncMonth('paid_at')
-        ).values('month').annotate(
-            total=Sum('amount')
-        ).order_by('month')
+        # Cuotas emitidas en el rango: emitido, cobrado, pendiente y por estado (una consulta)
+        fees = finance.fee_summary(Fee.objects.filter(issued_at__range=[start_date, end_date]))
 
-        # Cuotas por estado
-        fees_by_status = Fee.objects.filter(
-            issued_at__range=[start_date, end_date]
-        ).values('status').annotate(
-            count=Count('id'),
-            total=Sum('amount')
-        )
+        # Ingresos del rango por mes y por método de pago (una consulta)
+        payments = finance.payment_summary(Payment.objects.filter(paid_at__range=[start_date, end_date]))
 
-        # Morosidad por unidad
-        delinquent_units = Fee.objects.filter(
-            status='OVERDUE'
+        # Morosidad por unidad: saldo pendiente de cuotas vencidas, desde el libro de saldos
+        delinquent_units = UnitPeriodBalance.objects.filter(
+            overdue__gt=0
         ).values(
             'unit__code', 'unit__tower'
         ).annotate(
-            total_debt=Sum('amount'),
+            total_debt=Sum('overdue'),
             count=Count('id')
         ).order_by('-total_debt')[:10]
 
-        # Tasa de cobranza
-        total_issued = Fee.objects.filter(
-            issued_at__range=[start_date, end_date]
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-        total_paid = Payment.objects.filter(
-            paid_at__range=[start_date, end_date]
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-        collection_rate = (total_paid / total_issued * 100) if total_issued > 0 else 0
-
-        # Métodos de pago
-        payment_methods = Payment.objects.filter(
-            paid_at__range=[start_date, end_date]
-        ).values('method').annotate(
-            count=Count('id'),
-            total=Sum('amount')
-        )
-
         return {
             'period': {
                 'start': start_date.isoformat(),
                 'end': end_date.isoformat()
             },
             'summary': {
-                'total_issued': float(total_issued),
-                'total_paid': float(total_paid),
-                'total_pending': float(total_issued - total_paid),
-                'collection_rate': round(float(collection_rate), 2)
+                'total_issued': float(fees['issued']),
+                'total_paid': float(fees['paid']),
+                'total_pending': float(fees['outstanding']),
+                'collection_rate': fees['collection_rate']
             },
             'income_by_month': [
                 {
                     'month': item['month'].strftime('%Y-%m'),
                     'total': float(item['total'])
                 }
-                for item in income_by_month
+                for item in payments['by_month']
             ],
             'fees_by_status': [
                 {
@@ -129,7 +99,7 @@ class AdvancedReportsView(APIView):
                     'count': item['count'],
                     'total': float(item['total'])
                 }
-                for item in fees_by_status
+                for item in fees['by_status']
             ],
             'delinquent_units': [
                 {
@@ -145,61 +115,13 @@ class AdvancedReportsView(APIView):
                     'count': item['count'],
                     'total': float(item['total'])
                 }
-                for item in payment_methods
+                for item in payments['by_method']
             ]
         }
 
     def get_security_report(self, start_date, end_date):
-        """Reporte de seguridad con IA"""
-        # Incidentes por tipo
-        incidents_by_type = SecurityIncident.objects.filter(
-            detected_at__range=[start_date, end_date]
-        ).values('incident_type').annotate(
-            count=Count('id')
-        ).order_by('-count')
-
-        # Incidentes por severidad (si existe el campo)
-        try:
-            incidents_by_severity = SecurityIncident.objects.filter(
-                detected_at__range=[start_date, end_date]
-            ).values('severity').annotate(
-                count=Count('id')
-            )
-        except:
-            incidents_by_severity = []
-
-        # Visitantes por día
-        visitors_by_day = Visitor.objects.filter(
-            entry_time__range=[start_date, end_date]
-        ).annotate(
-            date=TruncDate('entry_time')
-        ).values('date').annotate(
-            count=Count('id')
-        ).order_by('date')
-
-        # Accesos no autorizados
-        unauthorized_access = AccessLog.objects.filter(
-            timestamp__range=[start_date, end_date],
-            was_granted=False
-        ).count()
-
-        # Detecciones de IA (contamos incidentes con confidence_score)
-        try:
-            ai_detections = SecurityIncident.objects.filter(
-                detected_at__range=[start_date, end_date]
-            ).exclude(confidence_score__isnull=True).count()
-        except:
-            ai_detections = 0
-
-        # Tiempo promedio de respuesta
-        avg_response_time = SecurityIncident.objects.filter(
-            detected_at__range=[start_date, end_date],
-            resolved_at__isnull=False
-        ).annotate(
-            response_time=F('resolved_at') - F('detected_at')
-        ).aggregate(
-            avg=Avg('response_time')
-        )['avg']
+        """Reporte de seguridad con IA, leído de los rollups diarios (core.services.security_rollups)"""
+        stats = security_rollups.security_summary(start_date, end_date)
 
         return {
             'period': {
@@ -207,36 +129,23 @@ class AdvancedReportsView(APIView):
                 'end': end_date.isoformat()
             },
             'summary': {
-                'total_incidents': SecurityIncident.objects.filter(
-                    detected_at__range=[start_date, end_date]
-                ).count(),
-                'unauthorized_access': unauthorized_access,
-                'ai_detections': ai_detections,
-                'avg_response_time_hours': round(
-                    avg_response_time.total_seconds() / 3600, 2
-                ) if avg_response_time else 0
+                'total_incidents': stats['total_incidents'],
+                'unauthorized_access': stats['unauthorized_access'],
+                'ai_detections': stats['ai_detections'],
+                'avg_response_time_hours': stats['avg_response_time_hours']
             },
-            'incidents_by_type': [
-                {
-                    'type': item['incident_type'],
-                    'count': item['count']
-                }
-                for item in incidents_by_type
-            ],
-            'incidents_by_severity': [
-                {
-                    'severity': item['severity'],
-                    'count': item['count']
-                }
-                for item in incidents_by_severity
-            ],
+            'incidents_by_type': stats['incidents_by_type'],
+            # SecurityIncident no tiene campo de severidad
+            'incidents_by_severity': [],
+            'access_by_type': stats['access_by_type'],
             'visitors_by_day': [
                 {
                     'date': item['date'].isoformat(),
                     'count': item['count']
                 }
-                for item in visitors_by_day
-            ]
+                for item in stats['visitors_by_day']
+            ],
+            'visitors_by_unit': stats['visitors_by_unit']
         }
 
     def get_maintenance_report(self, start_date, end_date):
@@ -0,0 +1,116 @@
+# core/ws_auth.py
+import copy
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import build_claims_user, get_full_user
+
+User = get_user_model()
+
+# Subprotocolo con el que el cliente puede enviar el token: Sec-WebSocket-Protocol: jwt, <token>
+JWT_SUBPROTOCOL = 'jwt'
+MAX_CACHED_TOKENS = 10000
+
+_stubs = OrderedDict()  # token -> (user, exp, cached_until)
+_lock = threading.Lock()
+
+
+def get_token_from_scope(scope):
+    """Devuelve (token, subprotocolo) desde ?token= o desde el header de subprotocolos"""
+    subprotocols = scope.get('subprotocols') or []
+    if JWT_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(JWT_SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], JWT_SUBPROTOCOL
+
+    query = parse_qs(scope.get('query_string', b'').decode())
+    token = (query.get('token') or [None])[0]
+    return token, None
+
+
+def _get_cached(token, now):
+    with _lock:
+        entry = _stubs.get(token)
+        if entry is None:
+            return None
+        if entry[2] <= now:
+            del _stubs[token]
+            return None
+        _stubs.move_to_end(token)
+        return entry
+
+
+def _store(token, user, exp, now):
+    ttl = getattr(settings, 'WEBSOCKET_JWT_CACHE_TTL', 60)
+    with _lock:
+        _stubs[token] = (user, exp, min(now + ttl, exp))
+        _stubs.move_to_end(token)
+        while len(_stubs) > MAX_CACHED_TOKENS:
+            _stubs.popitem(last=False)
+
+
+@database_sync_to_async
+def _load_user(user_id):
+    # Sólo para tokens emitidos antes de que existieran los claims de usuario
+    try:
+        user = get_full_user(user_id)
+    except User.DoesNotExist:
+        return None
+    return copy.copy(user) if user.is_active else None
+
+
+async def authenticate_token(token):
+    """Valida firma y expiración localmente. Devuelve (user, exp) o (None, None)."""
+    now = time.time()
+    cached = _get_cached(token, now)
+    if cached is not None:
+        return cached[0], cached[1]
+
+    try:
+        validated = AccessToken(token)
+    except TokenError:
+        return None, None
+
+    user = build_claims_user(validated)
+    if user is None:
+        user = await _load_user(validated[api_settings.USER_ID_CLAIM])
+    if user is None or not user.is_active:
+        return None, None
+
+    exp = validated['exp']
+    _store(token, user, exp, now)
+    return user, exp
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Autentica el handshake WebSocket con el mismo JWT que usa la API REST, sin sesión ni BD.
+    Deja en el scope `user`, `token_exp` (epoch) y `jwt_subprotocol` (para aceptarlo en accept()).
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        scope['user'] = AnonymousUser()
+        scope['token_exp'] = None
+        scope['jwt_subprotocol'] = None
+
+        token, subprotocol = get_token_from_scope(scope)
+        if token:
+            user, exp = await authenticate_token(token)
+            if user is not None:
+                scope['user'] = user
+                scope['token_exp'] = exp
+                scope['jwt_subprotocol'] = subprotocol
+
+        return await super().__call__(scope, receive, send)